@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import re
+from typing import Any, Dict, Optional
+
+from qdrant_client import models
+
+from app.config import Config
+from app.qdrant_pool import qdrant_pool
+from app.review_stats import PERIODS, stats_for
+from app.tenants import Tenant, tenants
+from app.vectorstore import build_qdrant_filter
+
+logger = logging.getLogger(__name__)
+
+_AGGREGATE_RE = re.compile(
+    r"\b(how many|number of|count|average|avg|mean rating|breakdown|distribution"
+    r"|trend|trending|over time|per month|monthly|increased|decreased|went (up|down))\b"
+)
+# Anything about what the reviews say needs retrieval, even when it also asks for a count
+_CONTENT_RE = re.compile(
+    r"\b(why|about|mention\w*|say|said|says|complain\w*|prais\w*|like|dislike|example\w*"
+    r"|quote\w*|theme\w*|issue\w*|topic\w*|because|reason\w*|feedback on)\b"
+)
+_TREND_RE = re.compile(r"\b(trend|trending|over time|per month|monthly|increased|decreased|went (up|down))\b")
+
+
+def classify_intent(user_query: str, parsed: Dict[str, Any]) -> str:
+    """Return "aggregate" when the filter alone answers the query, else "search".
+
+    The parser's `intent` field decides when present; the regexes cover parses
+    without it (older cached entries, or a model that omitted the field).
+    """
+    intent = parsed.get("intent")
+    if intent in ("aggregate", "search"):
+        return intent
+    query = user_query.lower()
+    if _AGGREGATE_RE.search(query) and not _CONTENT_RE.search(query):
+        return "aggregate"
+    return "search"
+
+
+async def count_by_rating(
+    filter_dict: Optional[Dict[str, Any]], collection_name: str = Config.COLLECTION_NAME
+) -> Dict[str, Any]:
+    """Per-rating counts straight from Qdrant, for when no stats snapshot is loaded."""
+    base = build_qdrant_filter(filter_dict)
+
+    async def count(rating: int) -> int:
+        must = [models.FieldCondition(key="rating", match=models.MatchValue(value=rating))]
+        if base is not None:
+            must.extend(base.must)
+        async with qdrant_pool.client() as qdrant:
+            result = await qdrant.count(
+                collection_name=collection_name,
+                count_filter=models.Filter(must=must),
+                exact=True,
+            )
+        return result.count
+
+    counts = await asyncio.gather(*(count(rating) for rating in range(1, 6)))
+    by_rating = dict(zip(range(1, 6), counts))
+    total = sum(counts)
+    average = round(sum(r * n for r, n in by_rating.items()) / total, 2) if total else None
+    return {"count": total, "average_rating": average, "by_rating": by_rating}
+
+
+def _describe_filter(filter_dict: Optional[Dict[str, Any]]) -> str:
+    parts = []
+    rating = (filter_dict or {}).get("rating") or {}
+    if "$in" in rating:
+        parts.append("rated " + " or ".join(f"{r}★" for r in sorted(rating["$in"])))
+    if "$gte" in rating and "$lte" in rating:
+        parts.append(f"rated {rating['$gte']}★ to {rating['$lte']}★")
+    elif "$gte" in rating:
+        parts.append(f"rated {rating['$gte']}★ or higher")
+    elif "$lte" in rating:
+        parts.append(f"rated {rating['$lte']}★ or lower")
+    create_time = (filter_dict or {}).get("createTime") or {}
+    if "$gte" in create_time:
+        parts.append(f"posted since {create_time['$gte'][:10]}")
+    return " and ".join(parts)
+
+
+def render_aggregate_answer(
+    user_query: str, filter_dict: Optional[Dict[str, Any]], summary: Dict[str, Any]
+) -> str:
+    """Templated answer for an aggregate query."""
+    description = _describe_filter(filter_dict)
+    subject = f"reviews {description}" if description else "reviews in total"
+    count = summary["count"]
+    if not count:
+        return f"There are no {subject}."
+
+    lines = [f"There {'is' if count == 1 else 'are'} **{count}** {subject}, "
+             f"with an average rating of **{summary['average_rating']}★**."]
+    breakdown = ", ".join(f"{r}★: {n}" for r, n in summary["by_rating"].items() if n)
+    lines.append(f"\nBy rating: {breakdown}.")
+
+    periods = summary.get("periods")
+    if periods:
+        lines.append("\nRecent activity:")
+        for period, stats in periods.items():
+            average = f", average {stats['average_rating']}★" if stats["count"] else ""
+            lines.append(f"- Last {PERIODS[period]} days: {stats['count']}{average}")
+
+    trend = [t for t in summary.get("monthly_trend") or [] if t["count"]]
+    if trend and _TREND_RE.search(user_query.lower()):
+        lines.append("\nMonthly trend (reviews, average, 3-month rolling average):")
+        for t in trend:
+            lines.append(
+                f"- {t['month']}: {t['count']}, {t['average_rating']}★, {t['rolling_3m_average']}★"
+            )
+    return "\n".join(lines)
+
+
+async def answer_aggregate_query(
+    user_query: str, filter_dict: Optional[Dict[str, Any]], tenant: Optional[Tenant] = None
+) -> Optional[str]:
+    """Answer from the stats snapshot, or Qdrant counts without it; None if neither works."""
+    tenant = tenant or tenants.default
+    scoped = tenant.scope(filter_dict)
+    summary = await stats_for(tenant.collection_name).asummarize(scoped)
+    if summary is None:
+        try:
+            summary = await count_by_rating(scoped, tenant.collection_name)
+        except Exception as e:
+            logger.warning("Aggregate counts failed, falling back to retrieval: %s", e)
+            return None
+    return render_aggregate_answer(user_query, filter_dict, summary)
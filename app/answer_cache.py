@@ -0,0 +1,177 @@
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence
+
+import numpy as np
+
+from app.config import Config
+
+_WORD_RE = re.compile(r"\s*\S+\s*")
+
+
+def filter_key(filter_dict: Optional[Dict[str, Any]]) -> str:
+    """Canonical form of a parsed filter; key order and $in order don't matter."""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {k: canonical(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return sorted(value)
+        return value
+    return json.dumps(canonical(filter_dict or {}), sort_keys=True)
+
+
+def split_for_replay(answer: str) -> List[str]:
+    """Word-sized chunks so a cached answer streams like a generated one."""
+    return _WORD_RE.findall(answer)
+
+
+@dataclass
+class CachedAnswer:
+    answer: str
+    context: List[str]
+    vector: np.ndarray
+    filter_key: str
+    expires_at: Optional[float]
+
+
+class SemanticAnswerCache:
+    """Answers keyed on the query embedding and the parsed filter.
+
+    A lookup hits when a cached query with the same filter has cosine similarity
+    of at least `threshold`. Entries expire after `ttl` seconds, the least
+    recently used entry is evicted beyond `maxsize`, and everything is dropped
+    when the review collection signature changes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        threshold: float = 0.95,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._timer = timer
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()
+        self._by_filter: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._signature: Hashable = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
+
+    def _remove(self, entry_id: int) -> None:
+        key = self._entries.pop(entry_id).filter_key
+        ids = self._by_filter[key]
+        ids.remove(entry_id)
+        if not ids:
+            del self._by_filter[key]
+
+    def _check_signature(self, signature: Hashable) -> None:
+        if signature != self._signature:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._by_filter.clear()
+            self._signature = signature
+
+    def get(
+        self, vector: Sequence[float], filter_dict: Optional[Dict[str, Any]], signature: Hashable = None
+    ) -> Optional[CachedAnswer]:
+        key = filter_key(filter_dict)
+        query = self._unit(vector)
+        now = self._timer()
+        with self._lock:
+            self._check_signature(signature)
+            for entry_id in list(self._by_filter.get(key, [])):
+                entry = self._entries[entry_id]
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    self._remove(entry_id)
+            ids = self._by_filter.get(key, [])
+            if ids:
+                candidates = [e for e in ids if self._entries[e].vector.shape == query.shape]
+                if candidates:
+                    matrix = np.stack([self._entries[e].vector for e in candidates])
+                    similarities = matrix @ query
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        self._entries.move_to_end(candidates[best])
+                        self.hits += 1
+                        return self._entries[candidates[best]]
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        vector: Sequence[float],
+        filter_dict: Optional[Dict[str, Any]],
+        answer: str,
+        context: List[str],
+        signature: Hashable = None,
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        key = filter_key(filter_dict)
+        expires_at = self._timer() + self.ttl if self.ttl else None
+        with self._lock:
+            self._check_signature(signature)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = CachedAnswer(
+                answer, list(context), self._unit(vector), key, expires_at
+            )
+            self._by_filter.setdefault(key, []).append(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_filter.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+
+# One cache per tenant: answers are worded for one business, and each cache is
+# invalidated by the stats signature of that tenant's collection only
+_caches: Dict[str, SemanticAnswerCache] = {}
+
+
+def answer_cache_for(tenant_id: str) -> SemanticAnswerCache:
+    cache = _caches.get(tenant_id)
+    if cache is None:
+        cache = _caches[tenant_id] = SemanticAnswerCache(
+            maxsize=Config.ANSWER_CACHE_SIZE,
+            ttl=Config.ANSWER_CACHE_TTL,
+            threshold=Config.ANSWER_CACHE_SIMILARITY,
+        )
+    return cache
+
+
+def get_answer_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {tenant_id: cache.stats() for tenant_id, cache in _caches.items()}
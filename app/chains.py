@@ -1,91 +1,531 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from difflib import SequenceMatcher
+from langchain_core.documents import Document
 from langchain_core.runnables import RunnableMap
-from app.prompts import RESPONSE_PROMPT
-from app.vertexai_models import default_llm, get_llm_for_query
+from app.config import Config
+from app.aggregations import answer_aggregate_query, classify_intent
+from app.answer_cache import answer_cache_for, split_for_replay
+from app.context_builder import ContextBuild, build_context, estimate_tokens, record_context_stats
+from app.review_stats import format_stats_for_prompt, stats_for
+from app.session_store import SessionState, session_store
+from app.single_flight import SingleFlight
+from app.telemetry import COALESCED, RequestTimer
+from app.tenants import Tenant, tenants
+from app.utils import get_current_date, run_blocking
+from app.vertexai_models import aget_default_llm, aget_query_embeddings
 from app.vectorstore import build_qdrant_filter
 from app.hybrid_retriever import create_hybrid_retriever
-from app.query_parser import parse_query_with_llm
-from typing import AsyncIterator, Dict, Any, Tuple, List
+from app.query_parser import (
+    aparse_query_with_llm,
+    is_parse_cached,
+    normalize_query,
+    parse_query_with_llm,
+)
+from typing import AsyncIterator, Dict, Any, Optional, Tuple, List
 
+logger = logging.getLogger(__name__)
 
-def _get_k_value_for_query(user_query: str) -> int:
-    """Determine optimal k value based on query type."""
-    query_lower = user_query.lower()
-    
-    # For analytical queries that need comprehensive data - use high k
-    if any(phrase in query_lower for phrase in [
-        "most common", "most frequent", "trends", "patterns", 
-        "all complaints", "all praise", "summary", "analyze",
-        "what are the", "summarize", "overview", "how many"
-    ]):
-        return 1000  # Get most/all relevant reviews for comprehensive analysis
-    
-    # For comparison queries
-    if any(phrase in query_lower for phrase in [
-        "compare", "versus", "vs", "difference", "better", "worse"
-    ]):
-        return 100
-    
-    # For specific examples or particular issues
-    if any(phrase in query_lower for phrase in [
-        "example", "instance", "specific", "particular", "tell me about"
-    ]):
-        return 30  # Lower k for specific examples
-    
-    # Default for general queries
-    return 50
+# Identical session-less queries that arrive while one is being answered share its pipeline
+_single_flight = SingleFlight(max_pending=Config.STREAM_QUEUE_SIZE, on_join=COALESCED.inc)
+
+# How often embedding the raw query while the parser runs pays off
+_speculation_stats = {"started": 0, "reused": 0, "discarded": 0, "failed": 0}
+
+
+async def _retrieval_depth(
+    filter_dict: Optional[Dict[str, Any]], collection_name: str = Config.COLLECTION_NAME
+) -> int:
+    """Upper bound on reviews to retrieve; the retriever stops earlier when relevance drops off.
+
+    When the stats snapshot says the filter matches few reviews, there is no
+    point asking for more. The snapshot may lag new reviews, so k never goes
+    below RETRIEVAL_MIN_K.
+    """
+    matching = await stats_for(collection_name).acount(filter_dict)
+    if matching is None:
+        return Config.RETRIEVAL_MAX_K
+    return min(Config.RETRIEVAL_MAX_K, max(matching, Config.RETRIEVAL_MIN_K))
+
+
+def get_speculation_stats() -> Dict[str, Any]:
+    started = _speculation_stats["started"]
+    return {
+        **_speculation_stats,
+        "hit_rate": _speculation_stats["reused"] / started if started else 0.0,
+    }
 
-def _prepare_query(user_query: str) -> Tuple[Dict, str, object]:
-    """Common query preparation logic for both streaming and non-streaming RAG responses."""
-    parsed = parse_query_with_llm(user_query)
+
+def _is_close_enough(user_query: str, embedding_text: str) -> bool:
+    """Whether a vector for the raw query can stand in for one of the parsed text."""
+    a = normalize_query(user_query).split()
+    b = normalize_query(embedding_text).split()
+    return SequenceMatcher(None, a, b).ratio() >= Config.SPECULATION_SIMILARITY_THRESHOLD
+
+
+def _start_speculative_embedding(
+    user_query: str, previous_query: Optional[str] = None, tenant: Optional[Tenant] = None
+) -> Optional[asyncio.Task]:
+    """Embed the raw query concurrently with the parser LLM call."""
+    # A cached parse returns immediately, so there is nothing to overlap with
+    if not Config.SPECULATIVE_EMBEDDING or is_parse_cached(user_query, previous_query, tenant):
+        return None
+    _speculation_stats["started"] += 1
+    return asyncio.create_task(aget_query_embeddings(user_query))
+
+
+async def _resolve_speculative_embedding(
+    task: Optional[asyncio.Task], user_query: str, embedding_text: str
+) -> Optional[Dict[str, Any]]:
+    """Return the speculative embeddings if they can be reused, else None."""
+    if task is None:
+        return None
+    if not _is_close_enough(user_query, embedding_text):
+        task.cancel()
+        _speculation_stats["discarded"] += 1
+        return None
+    try:
+        embeddings = await task
+    except Exception as e:
+        logger.warning("Speculative embedding failed: %s", e)
+        _speculation_stats["failed"] += 1
+        return None
+    _speculation_stats["reused"] += 1
+    return embeddings
+
+
+def _prepare_query(
+    user_query: str,
+    parsed: Optional[Dict[str, Any]] = None,
+    query_embeddings: Optional[Dict[str, Any]] = None,
+    tenant: Optional[Tenant] = None,
+    k: Optional[int] = None,
+) -> Tuple[Dict, str, object]:
+    """Common query preparation logic for both streaming and non-streaming RAG responses.
+
+    `k` comes from _retrieval_depth; without it the retriever may page up to RETRIEVAL_MAX_K.
+    """
+    tenant = tenant or tenants.default
+    if parsed is None:
+        parsed = parse_query_with_llm(user_query, tenant=tenant)
     filter_dict = parsed.get("filter")
-    qdrant_filter = build_qdrant_filter(filter_dict)
+    # Search within the tenant's locations; the unscoped filter is what the user sees
+    search_filter = tenant.scope(filter_dict)
+    qdrant_filter = build_qdrant_filter(search_filter)
     
-    # Dynamic k based on query type
-    k_value = _get_k_value_for_query(user_query)
-    print(f"Using k={k_value} for query: {user_query}")  # Debug
+    k_value = k or Config.RETRIEVAL_MAX_K
+    logger.debug("Using k<=%s for query: %s", k_value, user_query)
     
     # Create hybrid retriever
-    retriever = create_hybrid_retriever(qdrant_filter=qdrant_filter, k=k_value)
+    retriever = create_hybrid_retriever(
+        qdrant_filter=qdrant_filter,
+        k=k_value,
+        query_embeddings=query_embeddings,
+        collection_name=tenant.collection_name,
+    )
 
     embedding_text = parsed["query_embedding_text"]
     
     return filter_dict, embedding_text, retriever
 
-def _rag_runnable(context: List[str], filter_dict: Dict, review_count: int = None) -> RunnableMap:
+def _rag_runnable(
+    context: str,
+    filter_dict: Dict,
+    review_count: int = None,
+    stats: str = "unavailable",
+    history: str = "none",
+) -> RunnableMap:
     return RunnableMap(
         {
-            "context": lambda _: "\n\n".join(context),
+            "context": lambda _: context,
             "criteria": lambda _: filter_dict,
             "review_count": lambda _: review_count,
+            "stats": lambda _: stats,
+            "history": lambda _: history,
             "question": lambda x: x["question"],
         }
     )
 
-async def get_streaming_rag_response(user_query: str) -> AsyncIterator[Dict[str, Any]]:
+def _content(message: Any) -> str:
+    return message.content if hasattr(message, "content") else str(message)
+
+
+def _format_history(history: List[Dict[str, str]]) -> str:
+    if not history:
+        return "none"
+    return "\n".join(f"User: {turn['human']}\nAssistant: {turn['ai']}" for turn in history)
+
+
+def _session_key(tenant: Tenant, session_id: Optional[str]) -> Optional[str]:
+    # Every tenant, the default included, is prefixed so no session id can name another tenant's key
+    if not session_id:
+        return session_id
+    return f"{tenant.tenant_id}:{session_id}"
+
+
+def _legacy_session_key(tenant: Tenant, session_id: Optional[str]) -> Optional[str]:
+    """The unprefixed key the default tenant stored sessions under before every tenant was prefixed.
+
+    Ids containing a colon are never looked up bare: other tenants' keys had that form.
+    """
+    if not session_id or tenant is not tenants.default or ":" in session_id:
+        return None
+    return session_id
+
+
+def _review_payload(doc: Document) -> Dict[str, Any]:
+    return {"text": doc.page_content, **doc.metadata}
+
+
+def _review_document(review: Dict[str, Any]) -> Document:
+    metadata = {key: value for key, value in review.items() if key != "text"}
+    return Document(page_content=review["text"], metadata=metadata)
+
+
+def _get_session(session_id: str, legacy_id: Optional[str] = None) -> Optional[SessionState]:
+    session = session_store.get(session_id)
+    if session is None and legacy_id:
+        session = session_store.get(legacy_id)
+        if session is not None:
+            # Move it under the prefixed key so the bare id is only read once
+            session_store.save(session_id, session)
+            session_store.delete(legacy_id)
+    return session
+
+
+async def _load_session(
+    session_id: Optional[str], legacy_id: Optional[str] = None
+) -> Optional[SessionState]:
+    if not session_id:
+        return None
+    try:
+        return await run_blocking(_get_session, session_id, legacy_id)
+    except Exception as e:
+        logger.warning("Loading session %s failed: %s", session_id, e)
+        return None
+
+
+async def _remember_turn(
+    session_id: Optional[str],
+    session: Optional[SessionState],
+    user_query: str,
+    answer: str,
+    filter_dict: Optional[Dict],
+    reviews: Optional[List[Dict[str, Any]]],
+) -> None:
+    """Append the turn to the session; reviews=None keeps the previous turn's reviews."""
+    if not session_id:
+        return
+    session = session or SessionState()
+    session.record_turn(
+        user_query, answer, filter_dict, reviews,
+        Config.SESSION_HISTORY_TURNS, Config.SESSION_MAX_REVIEWS,
+    )
+    try:
+        await run_blocking(session_store.save, session_id, session)
+    except Exception as e:
+        logger.warning("Saving session %s failed: %s", session_id, e)
+
+
+async def _stream_answer(
+    user_query: str,
+    context: str,
+    filter_dict: Dict,
+    review_count: int,
+    stats: str,
+    history: str = "none",
+    tenant: Optional[Tenant] = None,
+) -> AsyncIterator[str]:
+    """Stream the answer from a single LLM call over the assembled context."""
+    streaming_rag_chain = (
+        _rag_runnable(context, filter_dict, review_count, stats, history)
+        | (tenant or tenants.default).prompt("response")
+        | await aget_default_llm()
+    )
+    async for chunk in streaming_rag_chain.astream({"question": user_query}):
+        token = _content(chunk)
+        if token:
+            yield token
+
+
+async def _reduce_partials(
+    user_query: str,
+    summaries: List[str],
+    filter_dict: Dict,
+    tenant: Optional[Tenant] = None,
+) -> List[str]:
+    """Collapse partial summaries in groups until they fit in one reduce prompt.
+
+    Intermediate levels merge summaries with the collapse prompt; only the final
+    reduce step answers the question.
+    """
+    collapse_chain = (tenant or tenants.default).prompt("collapse") | await aget_default_llm()
+    semaphore = asyncio.Semaphore(Config.MAP_REDUCE_CONCURRENCY)
+
+    async def collapse(group: List[str]) -> str:
+        async with semaphore:
+            response = await collapse_chain.ainvoke({
+                "question": user_query,
+                "summaries": "\n\n".join(group),
+                "criteria": filter_dict,
+            })
+        return _content(response)
+
+    while (
+        len(summaries) > 1
+        and estimate_tokens("\n\n".join(summaries)) > Config.CONTEXT_TOKEN_BUDGET
+    ):
+        fan_in = max(2, Config.MAP_REDUCE_FAN_IN)
+        groups = [summaries[i:i + fan_in] for i in range(0, len(summaries), fan_in)]
+        summaries = await asyncio.gather(*(collapse(group) for group in groups))
+    return summaries
+
+
+async def _map_reduce_answer(
+    user_query: str,
+    context_docs: List[Any],
+    filter_dict: Dict,
+    review_count: int,
+    stats: str,
+    history: str = "none",
+    tenant: Optional[Tenant] = None,
+) -> AsyncIterator[str]:
+    """Summarize shards of reviews concurrently, then stream the combined answer."""
+    tenant = tenant or tenants.default
+    shard_size = Config.MAP_REDUCE_SHARD_SIZE
+    shards = [context_docs[i:i + shard_size] for i in range(0, len(context_docs), shard_size)]
+    map_chain = tenant.prompt("map") | await aget_default_llm()
+    semaphore = asyncio.Semaphore(Config.MAP_REDUCE_CONCURRENCY)
+
+    # One request, however many shards, in the context stats
+    shard_contexts = [build_context(shard, record=False) for shard in shards]
+    record_context_stats(shard_contexts)
+
+    async def summarize(shard: List[Any], shard_context: ContextBuild) -> str:
+        async with semaphore:
+            response = await map_chain.ainvoke({
+                "question": user_query,
+                "context": shard_context.text,
+                "criteria": filter_dict,
+                "review_count": len(shard),
+            })
+        return _content(response)
+
+    summaries = await asyncio.gather(
+        *(summarize(shard, context) for shard, context in zip(shards, shard_contexts))
+    )
+    summaries = await _reduce_partials(user_query, list(summaries), filter_dict, tenant)
+    logger.debug("Map-reduce: %s shards reduced to %s summaries", len(shards), len(summaries))
+
+    reduce_chain = tenant.prompt("reduce") | await aget_default_llm()
+    async for chunk in reduce_chain.astream({
+        "question": user_query,
+        "summaries": "\n\n".join(summaries),
+        "criteria": filter_dict,
+        "review_count": review_count,
+        "stats": stats,
+        "history": history,
+    }):
+        token = _content(chunk)
+        if token:
+            yield token
+
+
+async def get_streaming_rag_response(
+    user_query: str,
+    session_id: Optional[str] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    tenant: Optional[Tenant] = None,
+) -> AsyncIterator[Dict[str, Any]]:
     """Streams tokens as they're generated."""
-    filter_dict, embedding_text, retriever = _prepare_query(user_query)
-    parsed = parse_query_with_llm(user_query)
+    tenant = tenant or tenants.default
+    timer = RequestTimer()
+    outcome = None
+    attributes: Dict[str, Any] = {"tenant": tenant.tenant_id}
+    try:
+        events = _rag_events(user_query, session_id, chat_history, tenant, timer, attributes)
+        async with aclosing(events):
+            async for event in events:
+                if "chunk" in event or "answer" in event:
+                    timer.mark("first_token")
+                if event.get("done"):
+                    outcome = attributes.pop("outcome", "answered")
+                yield event
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away before the answer was complete
+        outcome = outcome or "cancelled"
+        raise
+    finally:
+        timer.finish(outcome or "error", attributes)
+
+
+def get_coalescing_stats() -> Dict[str, Any]:
+    return _single_flight.stats()
+
+
+def stream_rag_response(
+    user_query: str,
+    session_id: Optional[str] = None,
+    chat_history: Optional[List[Dict[str, str]]] = None,
+    tenant: Optional[Tenant] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """get_streaming_rag_response, sharing one run between concurrent identical queries.
+
+    Requests with a session or chat history are answered on their own, since
+    their filter and prompt depend on the conversation. For the rest, the
+    tenant, normalized query and current date determine the parsed filter, so
+    they key the flight.
+    """
+    tenant = tenant or tenants.default
+    if not Config.COALESCE_REQUESTS or session_id or chat_history:
+        return get_streaming_rag_response(user_query, session_id, chat_history, tenant)
+    key = (tenant.tenant_id, normalize_query(user_query), get_current_date())
+    return _single_flight.subscribe(
+        key, lambda: get_streaming_rag_response(user_query, tenant=tenant)
+    )
+
+
+async def _rag_events(
+    user_query: str,
+    session_id: Optional[str],
+    chat_history: Optional[List[Dict[str, str]]],
+    tenant: Tenant,
+    timer: RequestTimer,
+    attributes: Dict[str, Any],
+) -> AsyncIterator[Dict[str, Any]]:
+    """The pipeline behind get_streaming_rag_response; sets attributes["outcome"] on early exits."""
+    # Sessions, answers and stats are kept per tenant
+    legacy_session_id = _legacy_session_key(tenant, session_id)
+    session_id = _session_key(tenant, session_id)
+    stats_engine = stats_for(tenant.collection_name)
+    answer_cache = answer_cache_for(tenant.tenant_id)
+    with timer.stage("session"):
+        session = await _load_session(session_id, legacy_session_id)
+    # History sent by the client wins over the stored one
+    history = (chat_history or (session.history if session else []))[-Config.SESSION_HISTORY_TURNS:]
+    previous_query = (session.last_query if session else None) or (history[-1]["human"] if history else None)
+    # Answers can draw on the conversation, so only history-free requests share the answer cache
+    cache_answers = Config.ANSWER_CACHE_ENABLED and not history
+
+    speculative = _start_speculative_embedding(user_query, previous_query, tenant)
+    try:
+        # Parse once; the result is threaded through the rest of the pipeline
+        with timer.stage("parse"):
+            parsed = await aparse_query_with_llm(user_query, previous_query, tenant)
+    except BaseException:
+        if speculative is not None:
+            speculative.cancel()
+        raise
     if parsed.get("off_topic", False):
+        if speculative is not None:
+            speculative.cancel()
+        attributes["outcome"] = "off_topic"
         yield {
             "answer": "Sorry, I can't assist you yet with that. Currently I'm only able to help you "
-            "understand customer feedback for Duck and Decanter and improve business based on customer feedback. "
+            f"understand customer feedback for {tenant.name} and improve business based on customer feedback. "
             "Please ask me about customer reviews, complaints, praise, business insights, or suggestions for improvements.",
             "context": [],
             "parsed_filter": None,
             "done": True
         }
         return
-    print(f"Filter dict: {filter_dict}")  # Debug line
-    print(f"Embedding text: {embedding_text}")  # Debug line
-
-    context_docs = await retriever.ainvoke(embedding_text)
-    context = [doc.page_content for doc in context_docs]
-    review_count = len(context)  # Count the reviews here
-    print(f"Retrieved {review_count} reviews")  # Debug
-    print(f"Retrieved {len(context)} documents")  # Debug line
-    
-    print(f"Context: {context}")
-    if not context or all(not c.strip() for c in context):
+
+    if Config.AGGREGATE_FAST_PATH and classify_intent(user_query, parsed) == "aggregate":
+        filter_dict = parsed.get("filter")
+        with timer.stage("aggregate"):
+            answer = await answer_aggregate_query(user_query, filter_dict, tenant)
+        if answer is not None:
+            if speculative is not None:
+                speculative.cancel()
+            await _remember_turn(session_id, session, user_query, answer, filter_dict, None)
+            attributes["outcome"] = "aggregate"
+            yield {
+                "answer": answer,
+                "context": [],
+                "parsed_filter": filter_dict,
+                "done": True,
+            }
+            return
+
+    follow_up = bool(parsed.get("follow_up")) and session is not None and bool(session.last_reviews)
+    if follow_up:
+        # Answer from the reviews behind the previous answer instead of retrieving again
+        if speculative is not None:
+            speculative.cancel()
+        filter_dict = session.last_filter
+        context_docs = [_review_document(review) for review in session.last_reviews]
+        logger.debug("Follow-up: reusing %s reviews from the previous turn", len(context_docs))
+    else:
+        with timer.stage("embed"):
+            query_embeddings = await _resolve_speculative_embedding(
+                speculative, user_query, parsed["query_embedding_text"]
+            )
+            if query_embeddings is None:
+                query_embeddings = await aget_query_embeddings(parsed["query_embedding_text"])
+        k = await _retrieval_depth(tenant.scope(parsed.get("filter")), tenant.collection_name)
+        filter_dict, embedding_text, retriever = _prepare_query(
+            user_query, parsed, query_embeddings, tenant, k
+        )
+        logger.debug("Filter dict: %s", filter_dict)
+        logger.debug("Embedding text: %s", embedding_text)
+
+        if cache_answers:
+            # Keyed on the vector retrieval uses, so the lookup costs no extra embedding
+            cached = answer_cache.get(query_embeddings["dense"], filter_dict, stats_engine.signature)
+            if cached is not None:
+                yield {"metadata": {"context": cached.context, "parsed_filter": filter_dict}}
+                for piece in split_for_replay(cached.answer):
+                    yield {"chunk": piece}
+                await _remember_turn(
+                    session_id, session, user_query, cached.answer, filter_dict,
+                    [{"text": text} for text in cached.context],
+                )
+                attributes["outcome"] = "cached"
+                yield {"done": True}
+                return
+
+        with timer.stage("search"):
+            context_docs = await retriever.ainvoke(embedding_text)
+        attributes["duplicates_dropped"] = retriever.duplicates_dropped
+
+    review_count = len(context_docs)  # Count the reviews here
+    attributes["reviews"] = review_count
+    logger.debug("Retrieved %s reviews", review_count)
+    with timer.stage("context"):
+        # Exact counts and trends come from the stats snapshot, not from the retrieved sample
+        stats = format_stats_for_prompt(await stats_engine.asummarize(tenant.scope(filter_dict)))
+        history_text = _format_history(history)
+
+        if review_count > Config.MAP_REDUCE_THRESHOLD:
+            # Too many reviews for one prompt: summarize shards in parallel, stream the reduce step
+            context = [doc.page_content for doc in context_docs]
+            tokens = _map_reduce_answer(
+                user_query, context_docs, filter_dict, review_count, stats, history_text, tenant
+            )
+            attributes["map_reduce"] = True
+        else:
+            # Rank, diversify and trim the reviews to the prompt token budget
+            context_build = build_context(context_docs)
+            context = context_build.reviews
+            logger.debug(
+                "Context: %d of %d reviews, ~%d tokens (%d saved%s)",
+                context_build.included,
+                context_build.total,
+                context_build.tokens,
+                context_build.tokens_saved,
+                ", compact" if context_build.compact else "",
+            )
+            attributes["context_tokens"] = context_build.tokens
+            attributes["context_tokens_saved"] = context_build.tokens_saved
+            attributes["context_reviews"] = context_build.included
+            attributes["mmr_reordered"] = context_build.reordered
+            tokens = _stream_answer(
+                user_query, context_build.text, filter_dict, review_count, stats, history_text, tenant
+            )
+
+    if not context:
+        attributes["outcome"] = "no_results"
         yield {
             "answer": "There are no reviews matching your query.",
             "context": [],
@@ -102,37 +542,22 @@ async def get_streaming_rag_response(user_query: str) -> AsyncIterator[Dict[str,
         }
     }
 
-    # Now stream the answer in chunks
-    streaming_rag_chain = (
-        _rag_runnable(context, filter_dict, review_count)
-        | RESPONSE_PROMPT
-        | default_llm
-    )
+    # Tokens are forwarded as they arrive; coalescing into frames happens in app.streaming
+    answer_parts = []
+    async for token in tokens:
+        answer_parts.append(token)
+        yield {"chunk": token}
+    answer = "".join(answer_parts)
 
-    buffer = ""
-    async for chunk in streaming_rag_chain.astream({"question": user_query}):
-        if hasattr(chunk, "content"):
-            token = chunk.content
-        else:
-            token = str(chunk)
-            
-        buffer += token
-        
-        # Send chunks of approximately 5 characters or a single word
-        while " " in buffer:
-            if " " in buffer:
-                # Split at the first space to send a complete word
-                word, buffer = buffer.split(" ", 1)
-                word += " "  # Add the space back
-                yield {"chunk": word}
-            else:
-                # If no space but buffer is long enough, send the first 5 characters
-                yield {"chunk": buffer[:5]}
-                buffer = buffer[5:]
-
-    # Send any remaining text
-    if buffer:
-        yield {"chunk": buffer}
+    if cache_answers and not follow_up:
+        answer_cache.set(
+            query_embeddings["dense"], filter_dict, answer, context, stats_engine.signature
+        )
+    await _remember_turn(
+        session_id, session, user_query, answer, filter_dict,
+        [_review_payload(doc) for doc in context_docs],
+    )
 
+    attributes["outcome"] = "follow_up" if follow_up else "answered"
     # Send final message indicating completion
     yield {"done": True}
@@ -0,0 +1,165 @@
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from qdrant_client import AsyncQdrantClient, models
+
+from app.config import Config
+
+# Every field build_qdrant_filter can filter on. Created right after the collection,
+# before points arrive, so HNSW builds the extra filter-aware links while indexing.
+PAYLOAD_INDEXES = {
+    "rating": models.IntegerIndexParams(type=models.IntegerIndexType.INTEGER, lookup=True, range=True),
+    "createTime": models.FloatIndexParams(type=models.FloatIndexType.FLOAT),
+    # is_tenant groups each location's points together, so location filters stay
+    # fast however many tenants share the collection
+    "location_id": models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+}
+
+
+@dataclass(frozen=True)
+class CollectionProfile:
+    """Where the vectors, HNSW graph and payload live, and how vectors are quantized."""
+
+    quantization: Optional[str] = None  # "scalar" (int8) or "binary" (1 bit per dimension)
+    # Quantized candidates fetched per result before rescoring with the original vectors
+    oversampling: float = 1.0
+    on_disk_vectors: bool = False
+    hnsw_on_disk: bool = False
+    on_disk_payload: bool = False
+
+
+PROFILES = {
+    # Full-precision vectors, graph and payload in RAM: fastest, most memory
+    "memory": CollectionProfile(),
+    # int8 vectors in RAM (4x smaller), originals on disk for rescoring
+    "scalar": CollectionProfile(
+        quantization="scalar", oversampling=1.5, on_disk_vectors=True, on_disk_payload=True
+    ),
+    # 1-bit vectors in RAM (32x smaller), originals on disk; needs oversampling to keep recall
+    "binary": CollectionProfile(
+        quantization="binary", oversampling=3.0, on_disk_vectors=True, on_disk_payload=True
+    ),
+    # Everything on disk: least memory, relies on the page cache
+    "disk": CollectionProfile(on_disk_vectors=True, hnsw_on_disk=True, on_disk_payload=True),
+}
+
+
+def truncate_dense(vector: Sequence[float], size: Optional[int] = None) -> List[float]:
+    """First `size` dimensions of a Matryoshka embedding, renormalized to unit length.
+
+    text-embedding-004 front-loads information into the leading dimensions, so
+    the prefix is a usable lower-dimensional embedding of the same text.
+    """
+    size = size or Config.DENSE_SMALL_VECTOR_SIZE
+    prefix = list(vector[:size])
+    norm = math.sqrt(sum(value * value for value in prefix))
+    return [value / norm for value in prefix] if norm else prefix
+
+
+def get_profile(name: Optional[str] = None) -> CollectionProfile:
+    name = name or Config.COLLECTION_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown COLLECTION_PROFILE {name!r}; expected one of {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+def quantization_config(profile: CollectionProfile):
+    if profile.quantization == "scalar":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=0.99, always_ram=True
+            )
+        )
+    if profile.quantization == "binary":
+        return models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return None
+
+
+def dense_search_params(profile: Optional[CollectionProfile] = None) -> Optional[models.SearchParams]:
+    """Search params for the dense vector: oversample the quantized index, then rescore."""
+    profile = profile or get_profile()
+    hnsw_ef = Config.SEARCH_HNSW_EF or None
+    if profile.quantization is None:
+        return models.SearchParams(hnsw_ef=hnsw_ef) if hnsw_ef else None
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        quantization=models.QuantizationSearchParams(
+            rescore=Config.SEARCH_RESCORE,
+            oversampling=Config.SEARCH_OVERSAMPLING or profile.oversampling,
+        ),
+    )
+
+
+def hnsw_config(profile: CollectionProfile) -> models.HnswConfigDiff:
+    return models.HnswConfigDiff(
+        m=Config.HNSW_M, ef_construct=Config.HNSW_EF_CONSTRUCT, on_disk=profile.hnsw_on_disk
+    )
+
+
+def collection_config(
+    profile: Optional[CollectionProfile] = None,
+    small_size: Optional[int] = None,
+    dense_size: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Keyword arguments for create_collection."""
+    profile = profile or get_profile()
+    small_size = Config.DENSE_SMALL_VECTOR_SIZE if small_size is None else small_size
+    vectors = {
+        "dense": models.VectorParams(
+            size=dense_size or Config.DENSE_VECTOR_SIZE,
+            distance=models.Distance.COSINE,
+            on_disk=profile.on_disk_vectors,
+        ),
+    }
+    if small_size:
+        # The small vector carries the HNSW graph; the full one is only read to rescore
+        vectors["dense"].hnsw_config = models.HnswConfigDiff(m=0)
+        vectors["dense_small"] = models.VectorParams(size=small_size, distance=models.Distance.COSINE)
+    return {
+        "vectors_config": vectors,
+        "sparse_vectors_config": {
+            # BM25 term weights; Qdrant applies IDF from live collection statistics
+            "sparse": models.SparseVectorParams(
+                index=models.SparseIndexParams(on_disk=profile.hnsw_on_disk),
+                modifier=models.Modifier.IDF,
+            )
+        },
+        "hnsw_config": hnsw_config(profile),
+        "quantization_config": quantization_config(profile),
+        "on_disk_payload": profile.on_disk_payload,
+        "optimizers_config": models.OptimizersConfigDiff(default_segment_number=16),
+    }
+
+
+async def ensure_payload_indexes(
+    qdrant: AsyncQdrantClient,
+    collection_name: str,
+    existing: Optional[Dict[str, models.PayloadIndexInfo]] = None,
+) -> List[str]:
+    """Create payload indexes that are missing or have the wrong type; returns the fields indexed."""
+    existing = existing or {}
+    created = []
+    for field_name, schema in PAYLOAD_INDEXES.items():
+        info = existing.get(field_name)
+        if info is not None and info.data_type.value == schema.type.value:
+            continue
+        await qdrant.create_payload_index(
+            collection_name=collection_name, field_name=field_name, field_schema=schema, wait=True
+        )
+        created.append(field_name)
+    return created
+
+
+async def apply_profile(
+    qdrant: AsyncQdrantClient, collection_name: str, profile: Optional[CollectionProfile] = None
+) -> None:
+    """Move an existing collection to a profile; Qdrant rebuilds segments in the background."""
+    profile = profile or get_profile()
+    await qdrant.update_collection(
+        collection_name=collection_name,
+        vectors_config={"dense": models.VectorParamsDiff(on_disk=profile.on_disk_vectors)},
+        hnsw_config=hnsw_config(profile),
+        quantization_config=quantization_config(profile) or models.Disabled.DISABLED,
+        collection_params=models.CollectionParamsDiff(on_disk_payload=profile.on_disk_payload),
+    )
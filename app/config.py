@@ -9,6 +9,9 @@ class Config:
     # --------------------------
     ENV: str = os.getenv("ENVIRONMENT", "development")
     DEBUG: bool = os.getenv("DEBUG", "False").lower() == "true"
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO").upper()
+    # OpenTelemetry spans around each pipeline stage (needs opentelemetry-api and an SDK/exporter)
+    TRACING_ENABLED: bool = os.getenv("TRACING_ENABLED", "False").lower() == "true"
 
     # --------------------------
     # Vertex AI Configuration
@@ -20,18 +23,188 @@ class Config:
     THINKING_LLM_MODEL: str = "gemini-2.5-pro"  # More powerful model for complex tasks
     QUERY_PARSER_MODEL: str = "gemini-2.5-flash-lite"
 
+    # Ingestion: texts per get_embeddings request (the API accepts up to 250 and
+    # 20k tokens per request), concurrent requests and requests per minute
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+    EMBEDDING_CONCURRENCY: int = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_REQUESTS_PER_MINUTE: float = float(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "300"))
+
+    # On-disk embedding cache keyed by (model, dimensionality, text), with an LRU in front
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    EMBEDDING_CACHE_DIR: str = os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings")
+    EMBEDDING_CACHE_LRU_SIZE: int = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "4096"))
+
     # --------------------------
     # Vector Database
     # --------------------------
     QDRANT_HOST: str = os.getenv("QDRANT_HOST", "localhost")
     DENSE_VECTOR_SIZE: int = int(os.getenv("DENSE_VECTOR_SIZE", "768"))  # text-embedding-004 default size
-    SPARSE_VECTOR_SIZE: int = int(os.getenv("SPARSE_VECTOR_SIZE", "30522"))  # text-embedding-004 sparse size (if available)
+    # Matryoshka first pass: a "dense_small" vector holding the first N dimensions of the dense
+    # embedding (e.g. 256 or 384; 0 disables) is searched for DENSE_SMALL_OVERSAMPLING x the
+    # candidates, which are then rescored with the full vector
+    DENSE_SMALL_VECTOR_SIZE: int = int(os.getenv("DENSE_SMALL_VECTOR_SIZE", "0"))
+    DENSE_SMALL_OVERSAMPLING: float = float(os.getenv("DENSE_SMALL_OVERSAMPLING", "4"))
+    QDRANT_GRPC_PORT: int = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+    QDRANT_TIMEOUT: int = int(os.getenv("QDRANT_TIMEOUT", "10"))
     COLLECTION_NAME: str = os.getenv("QDRANT_COLLECTION", "reviews")
+    UPSERT_BATCH_SIZE: int = int(os.getenv("UPSERT_BATCH_SIZE", "256"))
+
+    # Long-lived client pool used by the API (one gRPC channel per client)
+    QDRANT_POOL_SIZE: int = int(os.getenv("QDRANT_POOL_SIZE", "2"))
+    QDRANT_HEALTH_CHECK_INTERVAL: float = float(os.getenv("QDRANT_HEALTH_CHECK_INTERVAL", "30"))
+    QDRANT_RECONNECT_ATTEMPTS: int = int(os.getenv("QDRANT_RECONNECT_ATTEMPTS", "5"))
+    QDRANT_RECONNECT_BACKOFF: float = float(os.getenv("QDRANT_RECONNECT_BACKOFF", "0.5"))
+
+    # Collection layout used when ingestion creates a collection (or with --apply-profile):
+    # "memory" keeps everything in RAM, "scalar"/"binary" keep int8/1-bit quantized vectors
+    # in RAM and the originals on disk, "disk" keeps vectors and the HNSW graph on disk
+    COLLECTION_PROFILE: str = os.getenv("COLLECTION_PROFILE", "memory").lower()
+    HNSW_M: int = int(os.getenv("HNSW_M", "16"))
+    HNSW_EF_CONSTRUCT: int = int(os.getenv("HNSW_EF_CONSTRUCT", "100"))
+    # Searching quantized vectors: SEARCH_OVERSAMPLING x limit candidates (0 = the profile's
+    # default) are rescored with the original vectors; SEARCH_HNSW_EF 0 = Qdrant's default
+    SEARCH_RESCORE: bool = os.getenv("SEARCH_RESCORE", "True").lower() == "true"
+    SEARCH_OVERSAMPLING: float = float(os.getenv("SEARCH_OVERSAMPLING", "0"))
+    SEARCH_HNSW_EF: int = int(os.getenv("SEARCH_HNSW_EF", "0"))
     
-    # Hybrid search weights (for when sparse is available)
+    # Local BM25 sparse encoder (IDF is applied server-side by Qdrant)
+    BM25_K1: float = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B: float = float(os.getenv("BM25_B", "0.75"))
+    BM25_AVG_DOC_LENGTH: float = float(os.getenv("BM25_AVG_DOC_LENGTH", "30"))
+
+    # Server-side fusion of the dense and sparse searches: "rrf", "dbsf" or "weighted"
+    FUSION_MODE: str = os.getenv("FUSION_MODE", "rrf").lower()
+    # Each branch fetches k * HYBRID_PREFETCH_FACTOR candidates before fusion
+    HYBRID_PREFETCH_FACTOR: int = int(os.getenv("HYBRID_PREFETCH_FACTOR", "2"))
+    # Hybrid search weights (used when FUSION_MODE is "weighted")
     DENSE_WEIGHT: float = float(os.getenv("DENSE_WEIGHT", "0.7"))
     SPARSE_WEIGHT: float = float(os.getenv("SPARSE_WEIGHT", "0.3"))
 
+    # Retrieval: results per Qdrant request when k is large, and the word-overlap
+    # (Jaccard) above which two reviews count as near-duplicates
+    RETRIEVAL_PAGE_SIZE: int = int(os.getenv("RETRIEVAL_PAGE_SIZE", "100"))
+    DEDUP_SIMILARITY_THRESHOLD: float = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.9"))
+    # Adaptive depth: at most RETRIEVAL_MAX_K reviews (fewer when the filter matches fewer),
+    # and after RETRIEVAL_MIN_K paging stops at the first review scoring below
+    # RETRIEVAL_RELATIVE_SCORE x the top score, or falling RETRIEVAL_SCORE_GAP x the top
+    # score below the previous review. Under FUSION_MODE=rrf the scores judged are the
+    # dense branch's cosine scores, since RRF scores only encode rank
+    RETRIEVAL_MAX_K: int = int(os.getenv("RETRIEVAL_MAX_K", "1000"))
+    RETRIEVAL_MIN_K: int = int(os.getenv("RETRIEVAL_MIN_K", "20"))
+    RETRIEVAL_RELATIVE_SCORE: float = float(os.getenv("RETRIEVAL_RELATIVE_SCORE", "0.3"))
+    RETRIEVAL_SCORE_GAP: float = float(os.getenv("RETRIEVAL_SCORE_GAP", "0.25"))
+
+    # --------------------------
+    # Tenants
+    # --------------------------
+    # JSON file listing the businesses served (see README); without it the default
+    # business below is answered from the whole collection
+    TENANTS_FILE: str = os.getenv("TENANTS_FILE", "")
+    DEFAULT_TENANT_ID: str = os.getenv("DEFAULT_TENANT_ID", "default")
+    DEFAULT_BUSINESS_NAME: str = os.getenv("DEFAULT_BUSINESS_NAME", "Duck and Decanter")
+    DEFAULT_BUSINESS_DESCRIPTION: str = os.getenv(
+        "DEFAULT_BUSINESS_DESCRIPTION",
+        "commonly referred to as the duck, a sandwich shop in Phoenix, AZ",
+    )
+
+    # --------------------------
+    # Context Assembly
+    # --------------------------
+    # Estimated tokens of review text sent to the answer LLM
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+    # MMR trade-off between relevance (1.0) and diversity (0.0), over the top N reviews
+    CONTEXT_MMR_LAMBDA: float = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    CONTEXT_MMR_CANDIDATES: int = int(os.getenv("CONTEXT_MMR_CANDIDATES", "200"))
+    # Longest review sent in full, and review length in the compact one-line form
+    CONTEXT_REVIEW_MAX_CHARS: int = int(os.getenv("CONTEXT_REVIEW_MAX_CHARS", "2000"))
+    CONTEXT_COMPACT_CHARS: int = int(os.getenv("CONTEXT_COMPACT_CHARS", "200"))
+
+    # --------------------------
+    # Map-Reduce Summarization
+    # --------------------------
+    # Above this many retrieved reviews, shards are summarized in parallel and then combined
+    MAP_REDUCE_THRESHOLD: int = int(os.getenv("MAP_REDUCE_THRESHOLD", "150"))
+    MAP_REDUCE_SHARD_SIZE: int = int(os.getenv("MAP_REDUCE_SHARD_SIZE", "50"))
+    MAP_REDUCE_CONCURRENCY: int = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+    # Partial summaries combined per intermediate reduce when they exceed the token budget
+    MAP_REDUCE_FAN_IN: int = int(os.getenv("MAP_REDUCE_FAN_IN", "8"))
+
+    # --------------------------
+    # Review Statistics
+    # --------------------------
+    # How often the materialized rating/date snapshot is reloaded from Qdrant
+    STATS_REFRESH_SECONDS: float = float(os.getenv("STATS_REFRESH_SECONDS", "300"))
+    STATS_SCROLL_BATCH: int = int(os.getenv("STATS_SCROLL_BATCH", "5000"))
+    # Summaries kept per snapshot, keyed by filter; computed off the event loop on a miss
+    STATS_SUMMARY_CACHE_SIZE: int = int(os.getenv("STATS_SUMMARY_CACHE_SIZE", "256"))
+    # Answer pure count/average/trend questions from aggregates without retrieval or the LLM
+    AGGREGATE_FAST_PATH: bool = os.getenv("AGGREGATE_FAST_PATH", "True").lower() == "true"
+
+    # --------------------------
+    # Streaming
+    # --------------------------
+    # Tokens are coalesced into one SSE frame until either limit is reached
+    STREAM_COALESCE_MAX_CHARS: int = int(os.getenv("STREAM_COALESCE_MAX_CHARS", "32"))
+    STREAM_COALESCE_MAX_DELAY: float = float(os.getenv("STREAM_COALESCE_MAX_DELAY_MS", "50")) / 1000
+    # Events buffered per stream before the LLM stream is paused for a slow client
+    STREAM_QUEUE_SIZE: int = int(os.getenv("STREAM_QUEUE_SIZE", "64"))
+
+    # --------------------------
+    # Query Parser Cache
+    # --------------------------
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+    QUERY_CACHE_TTL: float = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "3600"))
+
+    # --------------------------
+    # Sessions
+    # --------------------------
+    # "memory" keeps sessions per process; "sqlite" shares them between workers on one host
+    SESSION_BACKEND: str = os.getenv("SESSION_BACKEND", "memory").lower()
+    SESSION_DB_PATH: str = os.getenv("SESSION_DB_PATH", ".cache/sessions.sqlite3")
+    SESSION_MAX_SESSIONS: int = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+    SESSION_TTL: float = float(os.getenv("SESSION_TTL_SECONDS", "86400"))
+    # Turns of chat history given to the LLM, and reviews kept for follow-up questions
+    SESSION_HISTORY_TURNS: int = int(os.getenv("SESSION_HISTORY_TURNS", "5"))
+    SESSION_MAX_REVIEWS: int = int(os.getenv("SESSION_MAX_REVIEWS", "300"))
+
+    # --------------------------
+    # Answer Cache
+    # --------------------------
+    # Paraphrased questions with the same parsed filter reuse an earlier answer
+    # when their query embeddings are at least this cosine-similar
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "True").lower() == "true"
+    ANSWER_CACHE_SIZE: int = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+    # --------------------------
+    # Concurrency
+    # --------------------------
+    # Threads available to synchronous SDK calls made from async code
+    BLOCKING_POOL_SIZE: int = int(os.getenv("BLOCKING_POOL_SIZE", "8"))
+
+    # Embed the raw query while the parser LLM runs, and reuse that vector when the
+    # parsed query_embedding_text is at least this similar to the raw query
+    SPECULATIVE_EMBEDDING: bool = os.getenv("SPECULATIVE_EMBEDDING", "True").lower() == "true"
+    SPECULATION_SIMILARITY_THRESHOLD: float = float(os.getenv("SPECULATION_SIMILARITY_THRESHOLD", "0.8"))
+
+    # Concurrent identical queries without a session share one pipeline run
+    COALESCE_REQUESTS: bool = os.getenv("COALESCE_REQUESTS", "True").lower() == "true"
+
+    # --------------------------
+    # Startup
+    # --------------------------
+    # Models are created on first use. Warm-up creates these ahead of traffic:
+    # "background" starts serving immediately, "blocking" waits for them, "off" skips it
+    MODEL_WARMUP: str = os.getenv("MODEL_WARMUP", "background").lower()
+    MODEL_WARMUP_NAMES: list = [
+        name.strip()
+        for name in os.getenv(
+            "MODEL_WARMUP_NAMES", "query_parser_llm,default_llm,embeddings,embedding_cache"
+        ).split(",")
+        if name.strip()
+    ]
+
     @classmethod
     def is_production(cls) -> bool:
         return cls.ENV == "production"
@@ -42,6 +215,3 @@ class Config:
         if cls.is_production() and cls.DEBUG:
             raise ValueError("DEBUG mode should not be enabled in production")
 
-
-# Validate configuration when imported
-Config.validate_config()
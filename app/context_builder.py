@@ -0,0 +1,169 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Sequence
+
+from app.config import Config
+from app.text_similarity import jaccard, word_set
+
+# Running totals across requests, reported at /metrics/caches
+_context_stats = {
+    "requests": 0,
+    "compact": 0,
+    "tokens_sent": 0,
+    "tokens_saved": 0,
+    "reviews_in": 0,
+    "reviews_sent": 0,
+    "mmr_reordered": 0,
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for Gemini models (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+@dataclass
+class ContextBuild:
+    text: str
+    reviews: List[str]
+    total: int
+    tokens: int
+    tokens_saved: int
+    compact: bool
+    # Reviews MMR moved away from their retrieval rank
+    reordered: int = 0
+
+    @property
+    def included(self) -> int:
+        return len(self.reviews)
+
+
+def get_context_stats() -> dict:
+    requests = _context_stats["requests"]
+    return {
+        **_context_stats,
+        "compact_rate": _context_stats["compact"] / requests if requests else 0.0,
+    }
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    if len(text) <= max_chars:
+        return text
+    return text[: max_chars - 1].rsplit(" ", 1)[0] + "…"
+
+
+def _compact_line(doc: Any, max_chars: int) -> str:
+    """One line per review: rating, date and the start of the text."""
+    rating = doc.metadata.get("rating")
+    created = doc.metadata.get("createTime")
+    date = (
+        datetime.fromtimestamp(created, tz=timezone.utc).strftime("%Y-%m-%d")
+        if created is not None
+        else "unknown date"
+    )
+    stars = f"{rating}★" if rating is not None else "?★"
+    return f"- {stars} {date}: {_truncate(doc.page_content, max_chars)}"
+
+
+def mmr_order(docs: Sequence[Any], lambda_mult: float, candidates: int) -> List[Any]:
+    """Order docs by maximal marginal relevance.
+
+    Relevance is the retrieval score scaled to [0, 1] and redundancy is word
+    overlap with the already selected reviews. Only the top `candidates` docs
+    take part in MMR; the rest keep their retrieval order after them.
+    """
+    pool = list(docs[:candidates])
+    rest = list(docs[candidates:])
+    if not pool:
+        return rest
+    top_score = max(doc.metadata.get("score") or 0.0 for doc in pool) or 1.0
+    relevance = [(doc.metadata.get("score") or 0.0) / top_score for doc in pool]
+    words = [word_set(doc.page_content) for doc in pool]
+    # Highest similarity of each remaining doc to anything selected so far
+    redundancy = [0.0] * len(pool)
+    remaining = list(range(len(pool)))
+    ordered = []
+    while remaining:
+        best = max(
+            remaining,
+            key=lambda i: lambda_mult * relevance[i] - (1 - lambda_mult) * redundancy[i],
+        )
+        remaining.remove(best)
+        ordered.append(pool[best])
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], jaccard(words[i], words[best]))
+    return ordered + rest
+
+
+def record_context_stats(builds: Sequence[ContextBuild]) -> None:
+    """Add one request's contexts, one per map-reduce shard, to the running totals."""
+    _context_stats["requests"] += 1
+    _context_stats["compact"] += int(any(build.compact for build in builds))
+    _context_stats["tokens_sent"] += sum(build.tokens for build in builds)
+    _context_stats["tokens_saved"] += sum(build.tokens_saved for build in builds)
+    _context_stats["reviews_in"] += sum(build.total for build in builds)
+    _context_stats["reviews_sent"] += sum(build.included for build in builds)
+    _context_stats["mmr_reordered"] += sum(build.reordered for build in builds)
+
+
+def build_context(
+    docs: Sequence[Any],
+    token_budget: Optional[int] = None,
+    lambda_mult: Optional[float] = None,
+    record: bool = True,
+) -> ContextBuild:
+    """Assemble the prompt context from retrieved reviews within a token budget.
+
+    Reviews are ordered by MMR and sent in full while they fit. When they
+    don't all fit, each review is reduced to a single line carrying its rating
+    and date, which is used if it covers more reviews than the full text.
+    Pass record=False when several builds make up one request, and record them
+    together with record_context_stats.
+    """
+    token_budget = Config.CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    lambda_mult = Config.CONTEXT_MMR_LAMBDA if lambda_mult is None else lambda_mult
+
+    docs = [doc for doc in docs if doc.page_content and doc.page_content.strip()]
+    naive_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in docs))
+    ordered = mmr_order(docs, lambda_mult, Config.CONTEXT_MMR_CANDIDATES)
+
+    def fill(entries: List[str], separator: str, header: str = ""):
+        used = estimate_tokens(header)
+        chosen = []
+        for entry in entries:
+            cost = estimate_tokens(entry + separator)
+            if used + cost > token_budget:
+                break
+            chosen.append(entry)
+            used += cost
+        return chosen, used
+
+    full_entries = [_truncate(doc.page_content, Config.CONTEXT_REVIEW_MAX_CHARS) for doc in ordered]
+    chosen, used = fill(full_entries, "\n\n")
+    compact = False
+    reviews = [doc.page_content for doc in ordered[: len(chosen)]]
+    text = "\n\n".join(chosen)
+
+    if len(chosen) < len(ordered):
+        header = f"Showing {{shown}} of {len(ordered)} reviews, one per line as rating, date and text:\n"
+        compact_entries = [_compact_line(doc, Config.CONTEXT_COMPACT_CHARS) for doc in ordered]
+        compact_chosen, compact_used = fill(compact_entries, "\n", header)
+        if len(compact_chosen) > len(chosen):
+            compact = True
+            chosen, used = compact_chosen, compact_used
+            reviews = [doc.page_content for doc in ordered[: len(chosen)]]
+            text = header.format(shown=len(chosen)) + "\n".join(chosen)
+
+    build = ContextBuild(
+        text=text,
+        reviews=reviews,
+        total=len(docs),
+        tokens=used,
+        tokens_saved=max(0, naive_tokens - used),
+        compact=compact,
+        reordered=sum(1 for before, after in zip(docs, ordered) if before is not after),
+    )
+    if record:
+        record_context_stats([build])
+    return build
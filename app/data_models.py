@@ -7,6 +7,8 @@ class ChatMessage(BaseModel):
 
 class QueryRequest(BaseModel):
     query: str
+    # Business whose reviews are queried; None means the default tenant
+    tenant_id: Optional[str] = None
     session_id: Optional[str] = None
     chat_history: Optional[List[ChatMessage]] = []
 
@@ -14,7 +16,3 @@ class QueryResponse(BaseModel):
     answer: str
     context: List[str]
     parsed_filter: Optional[Dict[str, Any]] = None
-
-# Simple in-memory storage (use Redis/DB in production)
-last_contexts: Dict[str, List[str]] = {}
-last_filters: Dict[str, Dict] = {}
\ No newline at end of file
@@ -0,0 +1,146 @@
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.cache import TTLCache
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace differences don't change the embedding we want to reuse."""
+    return " ".join(text.split())
+
+
+class EmbeddingCache:
+    """Content-addressed cache of dense vectors for one (model, dimensionality).
+
+    Vectors are appended as float32 rows to `vectors.f32` and memory-mapped for
+    reads; `index.tsv` maps each key to its row. An in-process LRU of float32
+    arrays sits in front of the mapped file. The index is loaded on construction,
+    so a new process starts with every vector embedded by earlier runs.
+    """
+
+    def __init__(self, directory: str, model: str, dimensionality: int, lru_size: int = 4096):
+        self.model = model
+        self.dimensionality = dimensionality
+        self.directory = Path(directory) / f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model)}-{dimensionality}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = self.directory / "vectors.f32"
+        self._index_path = self.directory / "index.tsv"
+        self._row_bytes = dimensionality * np.dtype(np.float32).itemsize
+
+        self._lock = threading.Lock()
+        self._lru = TTLCache(maxsize=lru_size)
+        self._index: Dict[str, int] = {}
+        self._mmap: Optional[np.memmap] = None
+        self._mapped_rows = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def key(self, text: str) -> str:
+        material = f"{self.model}|{self.dimensionality}|{normalize_text(text)}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _load_index(self) -> None:
+        if not self._index_path.exists():
+            return
+        rows_on_disk = self._rows_on_disk()
+        # A row rewritten after a torn write belongs to the key indexed last
+        owners: Dict[int, str] = {}
+        with open(self._index_path, "r") as f:
+            for line in f:
+                key, _, row = line.rstrip("\n").partition("\t")
+                # Skip lines from an interrupted write or pointing past the vector file
+                if row.isdigit() and int(row) < rows_on_disk:
+                    owners[int(row)] = key
+        self._index = {key: row for row, key in owners.items()}
+
+    def _rows_on_disk(self) -> int:
+        if not self._vectors_path.exists():
+            return 0
+        return self._vectors_path.stat().st_size // self._row_bytes
+
+    def _row(self, row: int) -> np.ndarray:
+        if row >= self._mapped_rows:
+            self._mapped_rows = self._rows_on_disk()
+            self._mmap = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._mapped_rows, self.dimensionality),
+            )
+        return np.array(self._mmap[row])
+
+    def get(self, text: str) -> Optional[List[float]]:
+        key = self.key(text)
+        vector = self._lru.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector.tolist()
+        with self._lock:
+            row = self._index.get(key)
+            if row is None:
+                self.misses += 1
+                return None
+            vector = self._row(row)
+        self.disk_hits += 1
+        self._lru.set(key, vector)
+        return vector.tolist()
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        return [self.get(text) for text in texts]
+
+    def put(self, text: str, vector: Sequence[float]) -> None:
+        self.put_many([text], [vector])
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        new = {}
+        for text, vector in zip(texts, vectors):
+            if len(vector) != self.dimensionality:
+                continue
+            key = self.key(text)
+            array = np.asarray(vector, dtype=np.float32)
+            self._lru.set(key, array)
+            if key not in self._index:
+                new[key] = array
+        if not new:
+            return
+        array = np.stack(list(new.values()))
+
+        with self._lock, open(self._vectors_path, "ab") as vectors_file, open(self._index_path, "a") as index_file:
+            # Other workers may append to the same files, so rows are assigned under a file lock
+            fcntl.flock(index_file, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(vectors_file.fileno()).st_size
+                first_row = size // self._row_bytes
+                if size % self._row_bytes:
+                    # Drop a partial row left by an interrupted write so new rows stay aligned
+                    vectors_file.truncate(first_row * self._row_bytes)
+                vectors_file.write(array.tobytes())
+                vectors_file.flush()
+                index_file.write(
+                    "".join(f"{key}\t{first_row + i}\n" for i, key in enumerate(new))
+                )
+                index_file.flush()
+            finally:
+                fcntl.flock(index_file, fcntl.LOCK_UN)
+            for i, key in enumerate(new):
+                self._index[key] = first_row + i
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self._index),
+        }
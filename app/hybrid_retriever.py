@@ -0,0 +1,215 @@
+import logging
+from typing import Any, Dict, List, Optional
+
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from qdrant_client import models
+
+from app.config import Config
+from app.text_similarity import jaccard, word_set
+from app.vectorstore import adense_scores, ahybrid_search, dense_scores, hybrid_search
+from app.vertexai_models import aget_query_embeddings, get_query_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Only these payload fields are needed to build the prompt
+RETRIEVAL_PAYLOAD_FIELDS = ["text", "rating", "createTime"]
+
+# Running totals across requests, reported at /metrics/caches
+_dedup_stats = {"results": 0, "duplicates_dropped": 0}
+
+
+def get_dedup_stats() -> Dict[str, Any]:
+    results = _dedup_stats["results"]
+    return {
+        **_dedup_stats,
+        "duplicate_rate": _dedup_stats["duplicates_dropped"] / results if results else 0.0,
+    }
+
+
+def dedupe_results(results: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """Drop reviews whose word sets overlap an earlier (higher scored) review by >= threshold.
+
+    Jaccard similarity can't reach the threshold when the word counts differ by
+    more than that ratio, which skips most comparisons.
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_words: List[frozenset] = []
+    for result in results:
+        text = (result.get("payload") or {}).get("text") or ""
+        words = word_set(text)
+        if not words:
+            continue
+        duplicate = False
+        for other in kept_words:
+            smaller, larger = sorted((len(words), len(other)))
+            if smaller < threshold * larger:
+                continue
+            if jaccard(words, other) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(result)
+            kept_words.append(words)
+    return kept
+
+
+def adaptive_cutoff(
+    scores: List[float], min_k: int, relative_threshold: float, score_gap: float
+) -> Optional[int]:
+    """Number of results worth keeping, or None if relevance hasn't dropped off yet.
+
+    The first `min_k` results are always kept. After that, results stop at the
+    first one scoring below `relative_threshold` x the top score, or falling more
+    than `score_gap` x the top score below the one before it.
+
+    Only meaningful for relevance scores (cosine, DBSF, weighted sums). RRF scores
+    are 1/(k + rank) whatever the query, so they would always cut at min_k; rank-fused
+    searches are judged on the dense branch's cosine scores instead.
+    """
+    if not scores or scores[0] <= 0:
+        return None
+    top = scores[0]
+    for i in range(max(min_k, 1), len(scores)):
+        if scores[i] < relative_threshold * top or scores[i - 1] - scores[i] > score_gap * top:
+            return i
+    return None
+
+
+def _to_document(result: Dict[str, Any]) -> Document:
+    payload = result["payload"]
+    return Document(
+        page_content=payload["text"],
+        metadata={
+            "rating": payload.get("rating"),
+            "createTime": payload.get("createTime"),
+            "score": result["score"],
+        },
+    )
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieves reviews with hybrid search, paging through large k and dropping near-duplicates.
+
+    Paging stops early once relevance scores show diminishing returns (see
+    adaptive_cutoff), so k is an upper bound rather than a fixed depth. RRF scores
+    say nothing about relevance, so rank-fused results are cut where the cosine
+    scores of a payload-free dense search drop off.
+    """
+
+    qdrant_filter: Optional[models.Filter] = None
+    collection_name: str = Config.COLLECTION_NAME
+    k: int = 20
+    query_embeddings: Optional[Dict[str, Any]] = None
+    page_size: int = Config.RETRIEVAL_PAGE_SIZE
+    dedupe_threshold: float = Config.DEDUP_SIMILARITY_THRESHOLD
+    min_k: int = Config.RETRIEVAL_MIN_K
+    relative_threshold: float = Config.RETRIEVAL_RELATIVE_SCORE
+    score_gap: float = Config.RETRIEVAL_SCORE_GAP
+    # Set by the last search, for per-request telemetry
+    duplicates_dropped: int = 0
+
+    def _pages(self):
+        """(offset, limit) for each page needed to fetch k results."""
+        for offset in range(0, self.k, self.page_size):
+            yield offset, min(self.page_size, self.k - offset)
+
+    def _cutoff(self, results: List[Dict[str, Any]], relevance: Optional[List[float]] = None) -> Optional[int]:
+        """Where to stop, judged on the results' own scores or, when rank-fused, on `relevance`."""
+        if not self._rank_fused(results):
+            relevance = [result["score"] for result in results]
+        depth = adaptive_cutoff(relevance or [], self.min_k, self.relative_threshold, self.score_gap)
+        return depth if depth is not None and depth <= len(results) else None
+
+    @staticmethod
+    def _rank_fused(page: List[Dict[str, Any]]) -> bool:
+        return any(result.get("rank_fused") for result in page)
+
+    def _warn_if_empty(self, relevance: List[float]) -> List[float]:
+        if not relevance:
+            logger.warning("No dense scores to judge rank-fused results by; fetching up to k=%s", self.k)
+        return relevance
+
+    def _finish(self, results: List[Dict[str, Any]]) -> List[Document]:
+        kept = dedupe_results(results, self.dedupe_threshold)
+        self.duplicates_dropped = len(results) - len(kept)
+        _dedup_stats["results"] += len(results)
+        _dedup_stats["duplicates_dropped"] += self.duplicates_dropped
+        return [_to_document(result) for result in kept]
+
+    def _page_request(self, query_embeddings: Dict[str, Any], offset: int, limit: int) -> Dict[str, Any]:
+        return {
+            "qdrant_filter": self.qdrant_filter,
+            "k": limit,
+            "query_embeddings": query_embeddings,
+            "offset": offset,
+            "with_payload": RETRIEVAL_PAYLOAD_FIELDS,
+            "collection_name": self.collection_name,
+        }
+
+    def _extend(
+        self,
+        results: List[Dict[str, Any]],
+        page: List[Dict[str, Any]],
+        limit: int,
+        relevance: Optional[List[float]] = None,
+    ) -> bool:
+        """Add a page to results, trimming at the cutoff; True once no more pages are needed."""
+        results.extend(page)
+        cutoff = self._cutoff(results, relevance)
+        if cutoff is not None:
+            del results[cutoff:]
+            return True
+        return len(page) < limit
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        # Embed once and reuse the vectors for every page
+        query_embeddings = self.query_embeddings or get_query_embeddings(query)
+        results: List[Dict[str, Any]] = []
+        relevance = None
+        for offset, limit in self._pages():
+            page = hybrid_search(query, **self._page_request(query_embeddings, offset, limit))
+            if relevance is None and self._rank_fused(page):
+                relevance = self._warn_if_empty(dense_scores(
+                    query_embeddings, self.qdrant_filter, self.k, self.collection_name
+                ))
+            if self._extend(results, page, limit, relevance):
+                break
+        return self._finish(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        query_embeddings = self.query_embeddings or await aget_query_embeddings(query)
+        results: List[Dict[str, Any]] = []
+        relevance = None
+        for offset, limit in self._pages():
+            page = await ahybrid_search(query, **self._page_request(query_embeddings, offset, limit))
+            if relevance is None and self._rank_fused(page):
+                # One scores-only dense search, after the first page shows the fusion is by rank
+                relevance = self._warn_if_empty(await adense_scores(
+                    query_embeddings, self.qdrant_filter, self.k, self.collection_name
+                ))
+            if self._extend(results, page, limit, relevance):
+                break
+        return self._finish(results)
+
+
+def create_hybrid_retriever(
+    qdrant_filter: Optional[models.Filter] = None,
+    k: int = 20,
+    query_embeddings: Optional[Dict[str, Any]] = None,
+    collection_name: str = Config.COLLECTION_NAME,
+) -> HybridRetriever:
+    return HybridRetriever(
+        qdrant_filter=qdrant_filter,
+        k=k,
+        query_embeddings=query_embeddings,
+        collection_name=collection_name,
+    )
@@ -1,59 +1,144 @@
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from app.config import Config
 from app.data_models import QueryRequest
-from app.chains import get_streaming_rag_response
+from app.answer_cache import get_answer_cache_stats
+from app.chains import get_coalescing_stats, get_speculation_stats, stream_rag_response
+from app.context_builder import get_context_stats
+from app.hybrid_retriever import get_dedup_stats
+from app.query_parser import get_parse_cache_stats
+from app.vertexai_models import get_embedding_cache, models
+from app.qdrant_pool import qdrant_pool
+from app.review_stats import stats_for
+from app.session_store import session_store
+from app.streaming import sse_stream
+from app.tenants import tenants
 
-import time
-import json
+logging.basicConfig(
+    level=Config.LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+# Seconds spent in each startup step, reported at /metrics/startup
+startup_report = {"import": round(time.perf_counter() - _import_started, 3)}
+
+
+async def _warm_up_models() -> None:
+    start = time.perf_counter()
+    try:
+        startup_report["models"] = await models.warm_up(Config.MODEL_WARMUP_NAMES)
+    except Exception as e:
+        logger.warning("Model warm-up failed, models will load on first use: %s", e)
+    startup_report["model_warmup"] = round(time.perf_counter() - start, 3)
+
+
+# -------- Lifespan --------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    Config.validate_config()
+
+    step = time.perf_counter()
+    await qdrant_pool.start()
+    startup_report["qdrant"] = round(time.perf_counter() - step, 3)
+
+    # Snapshots load in the background; requests see "stats unavailable" until they land
+    stats_engines = [stats_for(collection) for collection in tenants.collections()]
+    for engine in stats_engines:
+        await engine.start()
+
+    warm_up = None
+    if Config.MODEL_WARMUP == "blocking":
+        await _warm_up_models()
+    elif Config.MODEL_WARMUP == "background":
+        warm_up = asyncio.create_task(_warm_up_models())
+
+    startup_report["ready"] = round(time.perf_counter() - started, 3)
+    logger.info("Startup report (seconds): %s", startup_report)
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+    for engine in stats_engines:
+        await engine.stop()
+    await qdrant_pool.close()
 
 
 # -------- FastAPI app --------
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 # -------- Routes --------
 @app.post("/rag/streaming-query")
 async def rag_streaming_query(request: QueryRequest):
     """Streaming endpoint that returns chunks of the answer as they're generated."""
-    async def generate():
-        try:
-            # Send start of stream
-            yield f"data: {json.dumps({'status': 'start'})}\n\n"
-            
-            full_answer = ""  # Collect the full answer
-            
-            async for chunk in get_streaming_rag_response(request.query):
-                # If this contains metadata, send it separately
-                if "metadata" in chunk:
-                    metadata = chunk["metadata"]
-                    yield f"data: {json.dumps({'type': 'metadata', 'data': metadata})}\n\n"
-                    continue
-                    
-                # If this is a chunk of the answer
-                if "chunk" in chunk:
-                    text = chunk["chunk"]
-                    full_answer += text
-                    yield f"data: {json.dumps({'type': 'token', 'text': text})}\n\n"
-                    time.sleep(.1)
-                
-                # If we have a complete answer in one go
-                if "answer" in chunk and chunk["answer"]:
-                    full_answer = chunk["answer"]
-                    yield f"data: {json.dumps({'type': 'answer', 'text': chunk['answer']})}\n\n"
-                
-                # If we're done
-                if chunk.get("done", False):
-                    yield f"data: {json.dumps({'type': 'end', 'text': full_answer})}\n\n"
-        
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-    
+    tenant = tenants.get(request.tenant_id)
+    if tenant is None:
+        if request.tenant_id is None:
+            raise HTTPException(status_code=400, detail="tenant_id is required")
+        raise HTTPException(status_code=404, detail=f"Unknown tenant: {request.tenant_id}")
     return StreamingResponse(
-        generate(),
-        media_type="text/event-stream"
+        sse_stream(
+            stream_rag_response(
+                request.query,
+                session_id=request.session_id,
+                chat_history=[
+                    {"human": message.human, "ai": message.ai}
+                    for message in request.chat_history or []
+                ],
+                tenant=tenant,
+            )
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latency histograms, request counters and in-flight gauge in Prometheus format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/metrics/startup")
+def startup_metrics():
+    """Time spent importing, connecting and warming up, and which models are loaded."""
+    return {"steps": startup_report, "models": models.report()}
+
+
+@app.get("/metrics/qdrant")
+def qdrant_metrics():
+    """Connection reuse and search latency of the pooled Qdrant clients."""
+    return qdrant_pool.metrics()
+
+
+@app.get("/metrics/caches")
+def cache_metrics():
+    """Hit rates of the parser, answer, speculative embedding, embedding and session caches,
+    how many requests joined an identical one in flight, and what deduplication and
+    context assembly trimmed from the prompts."""
+    # Reporting shouldn't be what loads the embedding cache index
+    embedding_cache = get_embedding_cache() if models.is_loaded("embedding_cache") else None
+    return {
+        "query_parser": get_parse_cache_stats(),
+        "answers": get_answer_cache_stats(),
+        "speculative_embedding": get_speculation_stats(),
+        "embeddings": embedding_cache.stats() if embedding_cache is not None else None,
+        "sessions": session_store.stats(),
+        "coalescing": get_coalescing_stats(),
+        "dedup": get_dedup_stats(),
+        "context": get_context_stats(),
+    }
+
+
 @app.get("/")
 def homepage():
     return {"title": "gromopo - review based rag llm"}
@@ -2,7 +2,9 @@ from langchain_core.prompts import PromptTemplate
 
 QUERY_PARSER_PROMPT = """
 Today's date is: {current_date}.
-You are a query parser for customer reviews of Duck and Decanter, a sandwich shop in Phoenix, AZ.
+You are a query parser for customer reviews of {business}.
+
+The user's previous question in this conversation was: "{previous_query}".
 
 First, determine if the user's query: "{user_query}" is related to customer reviews, business feedback, or restaurant operations.
 
@@ -16,6 +18,13 @@ If the query is NOT related to customer reviews (e.g., weather, sports, politics
 If the query IS related to customer reviews, extract:
 - query_embedding_text: main text for semantic search
 - filter: rating, createTime
+- intent: "aggregate" if the query only asks for counts, average ratings, rating breakdowns or
+  rating trends that the filter fully describes (e.g. "how many 1-star reviews this year"),
+  otherwise "search" (anything about what reviews say, topics, reasons or examples)
+- follow_up: true only if the query asks about the same reviews as the previous question
+  (e.g. "tell me more", "which of those mention the price"), otherwise false. If the query
+  depends on the previous question but changes the topic or filter (e.g. "and last month?"),
+  set follow_up to false and write query_embedding_text and filter as a standalone query.
 
 Reviews have these fields:
 - comment: review text (string)
@@ -31,6 +40,8 @@ Important notes:
 Return ONLY a JSON object matching:
 {{
   "off_topic"?: boolean;
+  "intent"?: "aggregate" | "search";
+  "follow_up"?: boolean;
   "query_embedding_text": string;
   "filter"?: {{
     "rating"?: {{ "$in"?: number[]; "$gte"?: number; "$lte"?: number }};
@@ -41,13 +52,73 @@ Return ONLY a JSON object matching:
 
 RESPONSE_PROMPT = PromptTemplate.from_template(
     """
-    You are talking to an owner/manager of Duck and Decanter, commonly referred to as the duck, 
-    a sandwich shop in Phoenix, AZ. Please answer the user's query: {question} based on the following info:
+    You are talking to an owner/manager of {business}.
+    Please answer the user's query: {question} based on the following info:
     
+    Conversation so far: {history}
+
     Reviews/feedback provided by customers: {context}
     Criteria: {criteria}
     Number of Reviews Retrieved: {review_count}
+    Exact statistics for all reviews matching the criteria (use these for counts and trends):
+    {stats}
+
+    Please be concise and focus on the most relevant information.
+    """
+)
+
+# Map step of the map-reduce chain: each shard of reviews is summarized independently
+MAP_PROMPT = PromptTemplate.from_template(
+    """
+    You are helping the owner/manager of {business},
+    answer this question: {question}
+
+    Below is one batch of {review_count} customer reviews out of a larger set.
+    Criteria used to select the reviews: {criteria}
+
+    Reviews:
+    {context}
+
+    Summarize only what this batch says that is relevant to the question. Count how many
+    reviews mention each recurring theme, complaint or praise, and keep short representative
+    quotes. Do not answer the question yet and do not speculate beyond these reviews.
+    """
+)
+
+# Intermediate reduce levels: batch summaries are merged into one summary, not an answer
+COLLAPSE_PROMPT = PromptTemplate.from_template(
+    """
+    You are helping the owner/manager of {business},
+    answer this question: {question}
+
+    Below are summaries of batches of customer reviews out of a larger set.
+    Criteria used to select the reviews: {criteria}
+
+    Batch summaries:
+    {summaries}
+
+    Merge these into one summary in the same form. Add up the counts for the same theme,
+    complaint or praise across batches, keep themes that appear in only one batch and keep
+    the most representative quotes. Do not answer the question yet.
+    """
+)
+
+# Reduce step: partial summaries are combined into the final answer
+REDUCE_PROMPT = PromptTemplate.from_template(
+    """
+    You are talking to an owner/manager of {business}.
+    Please answer the user's query: {question}
+
+    Conversation so far: {history}
+
+    The {review_count} reviews matching the criteria {criteria} were summarized in batches.
+    Batch summaries:
+    {summaries}
+
+    Exact statistics for all reviews matching the criteria (use these for counts and trends):
+    {stats}
 
+    Combine the batch summaries, adding up counts for the same theme across batches.
     Please be concise and focus on the most relevant information.
     """
 )
@@ -0,0 +1,245 @@
+import asyncio
+import itertools
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import grpc
+from qdrant_client import AsyncQdrantClient, QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+# gRPC statuses that mean the channel, not the request, is at fault
+_TRANSPORT_STATUS_CODES = {grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED}
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether a failed call points at the connection rather than at the request itself."""
+    if isinstance(error, grpc.RpcError):
+        code = getattr(error, "code", None)
+        return callable(code) and code() in _TRANSPORT_STATUS_CODES
+    # ResponseHandlingException wraps REST transport failures
+    return isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError, ResponseHandlingException))
+
+
+class QdrantClientPool:
+    """Long-lived AsyncQdrantClient instances shared by all requests.
+
+    Each client owns one gRPC channel that multiplexes concurrent calls, so
+    clients are handed out round-robin rather than checked out exclusively.
+    Code running outside the event loop shares one synchronous client instead.
+    """
+
+    def __init__(
+        self,
+        size: int = Config.QDRANT_POOL_SIZE,
+        host: str = Config.QDRANT_HOST,
+        grpc_port: int = Config.QDRANT_GRPC_PORT,
+        timeout: int = Config.QDRANT_TIMEOUT,
+        health_check_interval: float = Config.QDRANT_HEALTH_CHECK_INTERVAL,
+        reconnect_attempts: int = Config.QDRANT_RECONNECT_ATTEMPTS,
+        reconnect_backoff: float = Config.QDRANT_RECONNECT_BACKOFF,
+    ):
+        self.size = max(1, size)
+        self.host = host
+        self.grpc_port = grpc_port
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_backoff = reconnect_backoff
+
+        self._clients: List[Optional[AsyncQdrantClient]] = [None] * self.size
+        self._unhealthy: set = set()
+        self._cursor = itertools.cycle(range(self.size))
+        self._start_lock = asyncio.Lock()
+        # One reconnect at a time, so concurrent requests don't each rebuild a client
+        self._reconnect_lock = asyncio.Lock()
+        self._started = False
+        self._health_task: Optional[asyncio.Task] = None
+        self._sync_client: Optional[QdrantClient] = None
+        self._sync_lock = threading.Lock()
+
+        # Metrics
+        self.clients_created = 0
+        self.acquisitions = 0
+        self.reconnects = 0
+        self.failures = 0
+        self._latencies: deque = deque(maxlen=1024)
+
+    def _new_client(self) -> AsyncQdrantClient:
+        self.clients_created += 1
+        return AsyncQdrantClient(
+            host=self.host,
+            grpc_port=self.grpc_port,
+            prefer_grpc=True,
+            timeout=self.timeout,
+        )
+
+    def sync_client(self) -> QdrantClient:
+        """The shared synchronous client, created on first use."""
+        with self._sync_lock:
+            if self._sync_client is None:
+                self.clients_created += 1
+                self._sync_client = QdrantClient(
+                    host=self.host,
+                    grpc_port=self.grpc_port,
+                    prefer_grpc=True,
+                    timeout=self.timeout,
+                )
+            self.acquisitions += 1
+            return self._sync_client
+
+    async def _connect(self) -> AsyncQdrantClient:
+        """Create a client and verify it can reach Qdrant, backing off between attempts."""
+        last_error = None
+        for attempt in range(self.reconnect_attempts):
+            client = self._new_client()
+            try:
+                await client.get_collections()
+                return client
+            except Exception as e:
+                last_error = e
+                await client.close()
+                if attempt == self.reconnect_attempts - 1:
+                    break
+                delay = self.reconnect_backoff * (2 ** attempt)
+                logger.warning(
+                    "Qdrant connection attempt %s failed, retrying in %.1fs: %s", attempt + 1, delay, e
+                )
+                await asyncio.sleep(delay)
+        raise ConnectionError(f"Could not connect to Qdrant at {self.host}:{self.grpc_port}") from last_error
+
+    async def start(self) -> None:
+        """Connect the clients; if Qdrant is down the pool starts degraded instead of failing.
+
+        Unconnected clients are marked unhealthy, and the health check or the next
+        acquire reconnects them once Qdrant is reachable.
+        """
+        async with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.size):
+                try:
+                    self._clients[i] = await self._connect()
+                except ConnectionError as e:
+                    # The remaining clients would fail the same way; don't wait for each
+                    logger.warning("Qdrant unavailable at startup, serving degraded: %s", e)
+                    self._unhealthy.update(range(i, self.size))
+                    break
+            self._started = True
+            if self.health_check_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        for i, client in enumerate(self._clients):
+            if client is not None:
+                await client.close()
+                self._clients[i] = None
+        self._unhealthy.clear()
+        self._started = False
+        with self._sync_lock:
+            if self._sync_client is not None:
+                self._sync_client.close()
+                self._sync_client = None
+
+    async def _reconnect(self, index: int) -> None:
+        old = self._clients[index]
+        self._clients[index] = await self._connect()
+        self._unhealthy.discard(index)
+        self.reconnects += 1
+        if old is not None:
+            await old.close()
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            for i, client in enumerate(self._clients):
+                try:
+                    if i in self._unhealthy or client is None:
+                        raise ConnectionError("marked unhealthy")
+                    await client.get_collections()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Qdrant client %s failed health check, reconnecting: %s", i, e)
+                    try:
+                        async with self._reconnect_lock:
+                            await self._reconnect(i)
+                    except ConnectionError as reconnect_error:
+                        logger.warning("Qdrant client %s still unavailable: %s", i, reconnect_error)
+
+    async def acquire(self) -> AsyncQdrantClient:
+        """Return the next pooled client, starting the pool on first use."""
+        if not self._started:
+            await self.start()
+        self.acquisitions += 1
+        for _ in range(self.size):
+            index = next(self._cursor)
+            if index not in self._unhealthy and self._clients[index] is not None:
+                return self._clients[index]
+        # Every client is unhealthy; reconnect one inline rather than failing the request.
+        # Callers queued on the lock reuse the client the first one reconnected.
+        async with self._reconnect_lock:
+            for index, client in enumerate(self._clients):
+                if index not in self._unhealthy and client is not None:
+                    return client
+            index = next(self._cursor)
+            await self._reconnect(index)
+            return self._clients[index]
+
+    @asynccontextmanager
+    async def client(self) -> AsyncIterator[AsyncQdrantClient]:
+        """Acquire a client and record the latency of the calls made with it."""
+        qdrant = await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield qdrant
+        except Exception as e:
+            # Errors like NOT_FOUND say nothing about the channel, which other requests still use
+            if is_transport_error(e):
+                self.report_failure(qdrant)
+            raise
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+    def report_failure(self, qdrant: AsyncQdrantClient) -> None:
+        """Mark a client unhealthy so requests skip it until it is reconnected."""
+        self.failures += 1
+        if qdrant in self._clients:
+            self._unhealthy.add(self._clients.index(qdrant))
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+        return {
+            "pool_size": self.size,
+            "clients_created": self.clients_created,
+            "acquisitions": self.acquisitions,
+            "reuse_ratio": (
+                max(0.0, 1 - self.clients_created / self.acquisitions) if self.acquisitions else 0.0
+            ),
+            "reconnects": self.reconnects,
+            "failures": self.failures,
+            "unhealthy_clients": len(self._unhealthy),
+            "search_latency_p50": percentile(0.5),
+            "search_latency_p95": percentile(0.95),
+            "search_latency_mean": statistics.fmean(latencies) if latencies else None,
+        }
+
+
+qdrant_pool = QdrantClientPool()
@@ -1,20 +1,41 @@
+import copy
 import json
-from typing import Dict, Any
-from app.vertexai_models import query_parser_llm
-from app.prompts import QUERY_PARSER_PROMPT
-from datetime import datetime
+from typing import Dict, Any, Optional
+from app.vertexai_models import aget_query_parser_llm, get_query_parser_llm
+from app.cache import TTLCache
+from app.config import Config
+from app.tenants import Tenant, tenants
+from app.utils import get_current_date
 
+# tenant + normalized query + normalized previous query + current_date -> parsed JSON
+_parse_cache = TTLCache(maxsize=Config.QUERY_CACHE_SIZE, ttl=Config.QUERY_CACHE_TTL)
+
+
+def normalize_query(user_query: str) -> str:
+    """Case, whitespace and trailing punctuation don't change how a query parses."""
+    return " ".join(user_query.lower().split()).rstrip("?!. ")
+
+
+def _cache_key(
+    user_query: str, previous_query: Optional[str], current_date: str, tenant: Optional[Tenant] = None
+) -> tuple:
+    # Relative dates in the parsed filter depend on current_date, follow-ups on the previous
+    # query, and everything on the tenant's prompt
+    tenant_id = (tenant or tenants.default).tenant_id
+    return (tenant_id, normalize_query(user_query), normalize_query(previous_query or ""), current_date)
 
-def parse_query_with_llm(user_query: str) -> Dict[str, Any]:
-    # to simulate streaming reviews we use the day after the most recent review (2025-05-25)
-    current_date = datetime(2025, 5, 25).strftime("%Y-%m-%d")
-    prompt = QUERY_PARSER_PROMPT.format(
-        user_query=user_query, current_date=current_date
-    )
-    response = query_parser_llm.invoke(prompt)
-    # Extract content from AIMessage object
-    content = response.content if hasattr(response, "content") else str(response)
 
+def is_parse_cached(
+    user_query: str, previous_query: Optional[str] = None, tenant: Optional[Tenant] = None
+) -> bool:
+    return _cache_key(user_query, previous_query, get_current_date(), tenant) in _parse_cache
+
+
+def get_parse_cache_stats() -> Dict[str, Any]:
+    return _parse_cache.stats()
+
+
+def _parse_llm_output(content: str) -> Dict[str, Any]:
     # Clean the response - remove markdown code block markers if present
     content = content.strip()
     if content.startswith("```json"):
@@ -28,3 +49,59 @@ def parse_query_with_llm(user_query: str) -> Dict[str, Any]:
         return json.loads(content)
     except json.JSONDecodeError as e:
         raise ValueError(f"Failed to parse LLM output: {content}") from e
+
+
+def _build_prompt(
+    user_query: str,
+    current_date: str,
+    previous_query: Optional[str] = None,
+    tenant: Optional[Tenant] = None,
+) -> str:
+    tenant = tenant or tenants.default
+    return tenant.parser_prompt().format(
+        user_query=user_query,
+        current_date=current_date,
+        previous_query=previous_query or "none",
+        business=tenant.business,
+    )
+
+
+def parse_query_with_llm(
+    user_query: str, previous_query: Optional[str] = None, tenant: Optional[Tenant] = None
+) -> Dict[str, Any]:
+    current_date = get_current_date()
+    cache_key = _cache_key(user_query, previous_query, current_date, tenant)
+    cached = _parse_cache.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    response = get_query_parser_llm().invoke(
+        _build_prompt(user_query, current_date, previous_query, tenant)
+    )
+    # Extract content from AIMessage object
+    content = response.content if hasattr(response, "content") else str(response)
+
+    parsed = _parse_llm_output(content)
+    _parse_cache.set(cache_key, parsed)
+    return copy.deepcopy(parsed)
+
+
+async def aparse_query_with_llm(
+    user_query: str, previous_query: Optional[str] = None, tenant: Optional[Tenant] = None
+) -> Dict[str, Any]:
+    """Async variant of parse_query_with_llm sharing the same cache."""
+    current_date = get_current_date()
+    cache_key = _cache_key(user_query, previous_query, current_date, tenant)
+    cached = _parse_cache.get(cache_key)
+    if cached is not None:
+        return copy.deepcopy(cached)
+
+    parser_llm = await aget_query_parser_llm()
+    response = await parser_llm.ainvoke(
+        _build_prompt(user_query, current_date, previous_query, tenant)
+    )
+    content = response.content if hasattr(response, "content") else str(response)
+
+    parsed = _parse_llm_output(content)
+    _parse_cache.set(cache_key, parsed)
+    return copy.deepcopy(parsed)
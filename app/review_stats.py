@@ -0,0 +1,286 @@
+import asyncio
+import json
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.cache import TTLCache
+from app.config import Config
+from app.qdrant_pool import qdrant_pool
+from app.utils import get_current_date, iso8601_to_timestamp, run_blocking
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"week": 7, "month": 30, "year": 365}
+_DAY = 86400.0
+
+
+def _reference_timestamp() -> float:
+    """'Now' for relative periods; matches the date given to the query parser."""
+    return datetime.fromisoformat(get_current_date()).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _average(ratings: np.ndarray) -> Optional[float]:
+    rated = ratings[ratings > 0]
+    return round(float(rated.mean()), 2) if rated.size else None
+
+
+def _content_digest(hashes: List[Optional[str]]) -> int:
+    """Order-independent digest of the content hashes written by ingestion.
+
+    The sum of each hash's leading 64 bits changes when any review's text or
+    fields change, not just when reviews are added or removed.
+    """
+    prefixes = np.fromiter(
+        (int(h[:16], 16) if h else 0 for h in hashes), dtype=np.uint64, count=len(hashes)
+    )
+    return int(prefixes.sum(dtype=np.uint64))
+
+
+def _filter_key(filter_dict: Optional[Dict[str, Any]]) -> str:
+    return json.dumps(filter_dict or {}, sort_keys=True, default=str)
+
+
+class ReviewStatsSnapshot:
+    """Materialized ratings and creation times of every review in the collection.
+
+    Any filter that build_qdrant_filter can express is evaluated with numpy masks
+    over these arrays, so counts and averages never touch Qdrant or the LLM.
+    Summaries are kept per filter for the life of the snapshot.
+    """
+
+    def __init__(
+        self,
+        ratings: np.ndarray,
+        timestamps: np.ndarray,
+        refreshed_at: Optional[float] = None,
+        locations: Optional[np.ndarray] = None,
+        content_digest: int = 0,
+    ):
+        self.ratings = np.asarray(ratings, dtype=np.int8)
+        self.timestamps = np.asarray(timestamps, dtype=np.float64)
+        self.locations = (
+            np.asarray(locations, dtype=str)
+            if locations is not None
+            else np.full(len(self.ratings), "", dtype=str)
+        )
+        self.refreshed_at = time.time() if refreshed_at is None else refreshed_at
+        self.content_digest = content_digest
+        self._summaries = TTLCache(maxsize=Config.STATS_SUMMARY_CACHE_SIZE)
+
+    @classmethod
+    def from_payloads(cls, payloads: List[Dict[str, Any]]) -> "ReviewStatsSnapshot":
+        ratings = np.fromiter(
+            ((p.get("rating") or 0) for p in payloads), dtype=np.int8, count=len(payloads)
+        )
+        timestamps = np.fromiter(
+            (p["createTime"] if p.get("createTime") is not None else np.nan for p in payloads),
+            dtype=np.float64,
+            count=len(payloads),
+        )
+        locations = np.array([p.get("location_id") or "" for p in payloads], dtype=str)
+        digest = _content_digest([p.get("content_hash") for p in payloads])
+        return cls(ratings, timestamps, locations=locations, content_digest=digest)
+
+    @property
+    def signature(self) -> tuple:
+        """Changes whenever reviews are added, removed or edited."""
+        latest = float(np.nanmax(self.timestamps)) if np.isfinite(self.timestamps).any() else None
+        return (len(self.ratings), latest, int(self.ratings.sum()), self.content_digest)
+
+    def mask(self, filter_dict: Optional[Dict[str, Any]]) -> np.ndarray:
+        mask = np.ones(len(self.ratings), dtype=bool)
+        if not filter_dict:
+            return mask
+        rating = filter_dict.get("rating") or {}
+        if "$in" in rating:
+            mask &= np.isin(self.ratings, rating["$in"])
+        if "$gte" in rating:
+            mask &= self.ratings >= rating["$gte"]
+        if "$lte" in rating:
+            mask &= self.ratings <= rating["$lte"]
+        create_time = filter_dict.get("createTime") or {}
+        if "$gte" in create_time:
+            mask &= self.timestamps >= iso8601_to_timestamp(create_time["$gte"])
+        location = filter_dict.get("location_id") or {}
+        if "$in" in location:
+            mask &= np.isin(self.locations, [str(value) for value in location["$in"]])
+        return mask
+
+    def cached_summary(self, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        return self._summaries.get((_filter_key(filter_dict), get_current_date()))
+
+    def summarize(self, filter_dict: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        key = (_filter_key(filter_dict), get_current_date())
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._summarize(filter_dict)
+            self._summaries.set(key, summary)
+        return summary
+
+    def _summarize(self, filter_dict: Optional[Dict[str, Any]], months: int = 12) -> Dict[str, Any]:
+        mask = self.mask(filter_dict)
+        ratings = self.ratings[mask]
+        timestamps = self.timestamps[mask]
+        now = _reference_timestamp()
+
+        periods = {}
+        for period, days in PERIODS.items():
+            in_period = timestamps >= now - days * _DAY
+            periods[period] = {
+                "count": int(in_period.sum()),
+                "average_rating": _average(ratings[in_period]),
+                "by_rating": {r: int((ratings[in_period] == r).sum()) for r in range(1, 6)},
+            }
+
+        # Monthly counts and averages for the trailing months, plus a 3-month rolling average
+        reference = datetime.fromtimestamp(now, tz=timezone.utc)
+        month_keys = []
+        year, month = reference.year, reference.month
+        for _ in range(months):
+            month_keys.append((year, month))
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        month_keys.reverse()
+        valid = np.isfinite(timestamps)
+        review_months = np.full(len(timestamps), -1, dtype=np.int64)
+        review_months[valid] = (
+            timestamps[valid].astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+        )
+        month_ids = [(y - 1970) * 12 + (m - 1) for y, m in month_keys]
+        trend = []
+        for (y, m), month_id in zip(month_keys, month_ids):
+            in_month = review_months == month_id
+            in_window = (review_months > month_id - 3) & (review_months <= month_id)
+            trend.append({
+                "month": f"{y}-{m:02d}",
+                "count": int(in_month.sum()),
+                "average_rating": _average(ratings[in_month]),
+                "rolling_3m_average": _average(ratings[in_window]),
+            })
+
+        return {
+            "count": int(mask.sum()),
+            "average_rating": _average(ratings),
+            "by_rating": {r: int((ratings == r).sum()) for r in range(1, 6)},
+            "periods": periods,
+            "monthly_trend": trend,
+        }
+
+
+def format_stats_for_prompt(summary: Optional[Dict[str, Any]]) -> str:
+    """Render a summary as a few compact lines for the answer prompt."""
+    if summary is None:
+        return "unavailable"
+    lines = [
+        f"Total matching reviews: {summary['count']} (average rating {summary['average_rating']})",
+        "By rating: " + ", ".join(f"{r}★ {n}" for r, n in summary["by_rating"].items()),
+        "Recent: " + "; ".join(
+            f"last {PERIODS[p]} days {s['count']} (avg {s['average_rating']})"
+            for p, s in summary["periods"].items()
+        ),
+        "Monthly (count, avg, 3-month rolling avg): " + "; ".join(
+            f"{t['month']} {t['count']}, {t['average_rating']}, {t['rolling_3m_average']}"
+            for t in summary["monthly_trend"]
+            if t["count"]
+        ),
+    ]
+    return "\n".join(lines)
+
+
+class ReviewStatsEngine:
+    """Keeps a ReviewStatsSnapshot of one collection fresh in the background."""
+
+    def __init__(
+        self,
+        refresh_interval: float = Config.STATS_REFRESH_SECONDS,
+        collection_name: str = Config.COLLECTION_NAME,
+    ):
+        self.refresh_interval = refresh_interval
+        self.collection_name = collection_name
+        self.snapshot: Optional[ReviewStatsSnapshot] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(self) -> ReviewStatsSnapshot:
+        payloads = []
+        offset = None
+        async with qdrant_pool.client() as qdrant:
+            while True:
+                points, offset = await qdrant.scroll(
+                    collection_name=self.collection_name,
+                    limit=Config.STATS_SCROLL_BATCH,
+                    offset=offset,
+                    with_payload=["rating", "createTime", "location_id", "content_hash"],
+                    with_vectors=False,
+                )
+                payloads.extend(point.payload or {} for point in points)
+                if offset is None:
+                    break
+        return await run_blocking(ReviewStatsSnapshot.from_payloads, payloads)
+
+    async def refresh(self) -> None:
+        start = time.perf_counter()
+        try:
+            self.snapshot = await self._load()
+        except Exception as e:
+            logger.warning(
+                "Review stats refresh of %s failed, keeping previous snapshot: %s", self.collection_name, e
+            )
+            return
+        logger.info(
+            "Review stats of %s refreshed: %d reviews in %.2fs",
+            self.collection_name,
+            len(self.snapshot.ratings),
+            time.perf_counter() - start,
+        )
+
+    async def _refresh_loop(self) -> None:
+        await self.refresh()
+        while self.refresh_interval > 0:
+            await asyncio.sleep(self.refresh_interval)
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Load the snapshot in the background; until it lands, stats are reported unavailable."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    @property
+    def signature(self) -> Optional[tuple]:
+        return self.snapshot.signature if self.snapshot is not None else None
+
+    async def asummarize(self, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Summary of the reviews matching a filter; the numpy work runs off the event loop."""
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        summary = snapshot.cached_summary(filter_dict)
+        if summary is None:
+            summary = await run_blocking(snapshot.summarize, filter_dict)
+        return summary
+
+    async def acount(self, filter_dict: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        # The summary is needed for the prompt later in the request, so count through it
+        summary = await self.asummarize(filter_dict)
+        return summary["count"] if summary is not None else None
+
+
+_engines: Dict[str, ReviewStatsEngine] = {}
+
+
+def stats_for(collection_name: str) -> ReviewStatsEngine:
+    """The stats engine of a collection; tenants sharing a collection share its snapshot."""
+    engine = _engines.get(collection_name)
+    if engine is None:
+        engine = _engines[collection_name] = ReviewStatsEngine(collection_name=collection_name)
+    return engine
+
+
+review_stats = stats_for(Config.COLLECTION_NAME)
@@ -0,0 +1,163 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from app.cache import TTLCache
+from app.config import Config
+
+
+@dataclass
+class SessionState:
+    """What a follow-up question needs from earlier turns of a conversation."""
+
+    history: List[Dict[str, str]] = field(default_factory=list)
+    last_query: Optional[str] = None
+    last_filter: Optional[Dict[str, Any]] = None
+    # Reviews behind the last answer as {"text", "rating", "createTime", "score"}
+    last_reviews: List[Dict[str, Any]] = field(default_factory=list)
+
+    def record_turn(
+        self,
+        query: str,
+        answer: str,
+        filter_dict: Optional[Dict[str, Any]],
+        reviews: Optional[List[Dict[str, Any]]],
+        max_turns: int,
+        max_reviews: int,
+    ) -> None:
+        self.history = (self.history + [{"human": query, "ai": answer}])[-max_turns:] if max_turns > 0 else []
+        self.last_query = query
+        # Turns answered without retrieval keep the previous reviews for the next follow-up
+        if reviews is not None:
+            self.last_filter = filter_dict
+            self.last_reviews = reviews[:max_reviews]
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str) -> "SessionState":
+        return cls(**json.loads(data))
+
+
+class MemorySessionStore:
+    """Sessions in a bounded LRU of this process; not shared between workers."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, timer: Callable[[], float] = time.monotonic):
+        # Serialized so callers can't mutate the stored copy
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, timer=timer)
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        data = self._cache.get(session_id)
+        return SessionState.from_json(data) if data is not None else None
+
+    def save(self, session_id: str, state: SessionState) -> None:
+        self._cache.set(session_id, state.to_json())
+
+    def delete(self, session_id: str) -> None:
+        self._cache.pop(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+
+class SqliteSessionStore:
+    """Sessions in a local SQLite file, shared by every worker on the host.
+
+    Rows older than `ttl` are ignored on read and deleted periodically, along
+    with the least recently updated sessions beyond `maxsize`.
+    """
+
+    _PRUNE_EVERY = 100
+
+    def __init__(self, path: str, maxsize: int, ttl: Optional[float] = None, timer: Callable[[], float] = time.time):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._local = threading.local()
+        self._saves = 0
+        self.hits = 0
+        self.misses = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared across threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _oldest_valid(self) -> float:
+        return self._timer() - self.ttl if self.ttl else float("-inf")
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        row = self._connection().execute(
+            "SELECT data FROM sessions WHERE id = ? AND updated_at >= ?",
+            (session_id, self._oldest_valid()),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return SessionState.from_json(row[0])
+
+    def save(self, session_id: str, state: SessionState) -> None:
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT INTO sessions (id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (session_id, state.to_json(), self._timer()),
+            )
+        self._saves += 1
+        if self._saves % self._PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, session_id: str) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def prune(self) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE updated_at < ?", (self._oldest_valid(),))
+            conn.execute(
+                "DELETE FROM sessions WHERE id NOT IN "
+                "(SELECT id FROM sessions ORDER BY updated_at DESC LIMIT ?)",
+                (self.maxsize,),
+            )
+
+    def __len__(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "sqlite",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self),
+            "maxsize": self.maxsize,
+        }
+
+
+def create_session_store():
+    if Config.SESSION_BACKEND == "sqlite":
+        return SqliteSessionStore(Config.SESSION_DB_PATH, Config.SESSION_MAX_SESSIONS, Config.SESSION_TTL)
+    return MemorySessionStore(Config.SESSION_MAX_SESSIONS, Config.SESSION_TTL)
+
+
+session_store = create_session_store()
@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+
+class _Signal:
+    """An asyncio.Event that wakes everyone waiting on it and re-arms itself."""
+
+    def __init__(self):
+        self._event = asyncio.Event()
+
+    def notify(self) -> None:
+        # Wake everyone waiting on the current event, then give later waiters a fresh one
+        self._event.set()
+        self._event = asyncio.Event()
+
+    async def wait(self) -> None:
+        await self._event.wait()
+
+
+class _Flight:
+    """Events of one upstream run, kept so subscribers can replay from the start."""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # Subscriber id -> index of the next event it will read
+        self.positions: Dict[int, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.produced = _Signal()
+        self.consumed = _Signal()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self.positions)
+
+    def pending(self) -> int:
+        """Events produced that even the furthest-along subscriber hasn't read yet."""
+        return len(self.events) - max(self.positions.values(), default=len(self.events))
+
+
+class SingleFlight:
+    """Share one run of an async event stream between concurrent identical requests.
+
+    The first subscriber for a key starts the upstream stream; anyone subscribing
+    with the same key while it runs gets every event already produced and then
+    the rest as they arrive. The upstream pauses while `max_pending` events are
+    unread by every subscriber, and is cancelled once nobody listens.
+
+    Pacing follows the fastest subscriber so one stalled client can't hold up
+    everyone sharing its flight; slower ones read behind it from the replay list.
+    """
+
+    def __init__(self, max_pending: int = 64, on_join: Optional[Callable[[], None]] = None):
+        self.max_pending = max(1, max_pending)
+        self.on_join = on_join
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._ids = itertools.count()
+        self.started = 0
+        self.joined = 0
+
+    async def _run(self, key: Hashable, flight: _Flight, factory: Callable[[], AsyncIterator[Any]]) -> None:
+        try:
+            async for event in factory():
+                # Backpressure, as the bounded SSE queue gives a request answered on its own
+                while flight.pending() >= self.max_pending:
+                    await flight.consumed.wait()
+                flight.events.append(event)
+                flight.produced.notify()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.produced.notify()
+
+    async def subscribe(self, key: Hashable, factory: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.create_task(self._run(key, flight, factory))
+            self.started += 1
+        else:
+            self.joined += 1
+            if self.on_join is not None:
+                self.on_join()
+        subscriber = next(self._ids)
+        flight.positions[subscriber] = 0
+
+        index = 0
+        try:
+            while True:
+                while index < len(flight.events):
+                    yield flight.events[index]
+                    index += 1
+                    flight.positions[subscriber] = index
+                    flight.consumed.notify()
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.produced.wait()
+        finally:
+            del flight.positions[subscriber]
+            flight.consumed.notify()
+            if flight.subscribers == 0 and not flight.done:
+                # Nobody is listening any more; stop paying for the upstream pipeline
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def is_running(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.started + self.joined
+        return {
+            "started": self.started,
+            "joined": self.joined,
+            "in_flight": len(self._flights),
+            "coalesced_rate": self.joined / total if total else 0.0,
+        }
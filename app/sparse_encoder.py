@@ -0,0 +1,81 @@
+import re
+import zlib
+from collections import Counter
+from typing import Dict, List
+
+from app.config import Config
+
+# Bump when tokenization or weighting changes so ingestion rewrites stored sparse vectors
+SPARSE_ENCODER_VERSION = "bm25-v1"
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset(
+    """
+    a about above after again all am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each few for from
+    further had has have having he her here hers herself him himself his how i if in into
+    is it its itself just me more most my myself no nor not of off on once only or other
+    our ours ourselves out over own same she should so some such than that the their
+    theirs them themselves then there these they this those through to too under until
+    up very was we were what when where which while who whom why will with would you
+    your yours yourself yourselves s t
+    """.split()
+)
+
+
+def _stem(token: str) -> str:
+    """Light plural stripping so "sandwiches" and "sandwich" share a term."""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith(("ches", "shes", "sses", "xes")):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def token_index(token: str) -> int:
+    """Hash a term into the sparse index space; stable across processes, no vocabulary file."""
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _to_sparse(weights: Dict[int, float]) -> Dict[str, List]:
+    indices = sorted(weights)
+    return {"indices": indices, "values": [weights[i] for i in indices]}
+
+
+class BM25Encoder:
+    """BM25 term weights for documents and queries.
+
+    Documents carry the saturated, length-normalized term frequency; queries
+    carry a weight of 1 per term. The IDF factor is applied by Qdrant at search
+    time (`Modifier.IDF` on the sparse vector), so it always reflects the
+    current collection and never needs re-ingestion.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_length: float = 30.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    def encode_document(self, text: str) -> Dict[str, List]:
+        tokens = tokenize(text)
+        length_norm = 1 - self.b + self.b * len(tokens) / self.avg_doc_length
+        weights: Dict[int, float] = {}
+        for token, tf in Counter(tokens).items():
+            index = token_index(token)
+            weights[index] = weights.get(index, 0.0) + tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+        return _to_sparse(weights)
+
+    def encode_query(self, text: str) -> Dict[str, List]:
+        return _to_sparse({token_index(token): 1.0 for token in set(tokenize(text))})
+
+
+sparse_encoder = BM25Encoder(
+    k1=Config.BM25_K1, b=Config.BM25_B, avg_doc_length=Config.BM25_AVG_DOC_LENGTH
+)
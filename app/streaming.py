@@ -0,0 +1,142 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.config import Config
+
+# --------------------------
+# SSE frame encoding
+# --------------------------
+_json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+_FRAME_PREFIX = b"data: "
+_FRAME_SUFFIX = b"\n\n"
+_TOKEN_PREFIX = b'data: {"type":"token","text":'
+_END_PREFIX = b'data: {"type":"end","text":'
+_OBJECT_SUFFIX = b"}\n\n"
+
+
+def encode_sse_event(event: Dict[str, Any]) -> bytes:
+    """Serialize an event dict into a single SSE `data:` frame."""
+    return _FRAME_PREFIX + _json_encoder.encode(event).encode("utf-8") + _FRAME_SUFFIX
+
+
+def encode_token_frame(text: str) -> bytes:
+    """Token frames are the hot path, so only the text itself is JSON-encoded."""
+    return _TOKEN_PREFIX + _json_encoder.encode(text).encode("utf-8") + _OBJECT_SUFFIX
+
+
+def encode_end_frame(text: str) -> bytes:
+    return _END_PREFIX + _json_encoder.encode(text).encode("utf-8") + _OBJECT_SUFFIX
+
+
+START_FRAME = encode_sse_event({"status": "start"})
+
+_STREAM_END = object()
+
+
+class _StreamError:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def _pump(source: AsyncIterator[Dict[str, Any]], queue: asyncio.Queue) -> None:
+    """Move events from the pipeline into a bounded queue.
+
+    `queue.put` blocks when the client falls behind, which stops us from pulling
+    more tokens out of the LLM stream until the client catches up.
+    """
+    try:
+        async for event in source:
+            await queue.put(event)
+    except Exception as e:
+        await queue.put(_StreamError(e))
+        return
+    await queue.put(_STREAM_END)
+
+
+async def sse_stream(
+    events: AsyncIterator[Dict[str, Any]],
+    max_chars: Optional[int] = None,
+    max_delay: Optional[float] = None,
+    queue_size: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """Turn pipeline events into SSE frames, coalescing answer tokens.
+
+    Buffered tokens are flushed once `max_chars` characters are pending or the
+    oldest pending token is `max_delay` seconds old, whichever comes first.
+    """
+    max_chars = Config.STREAM_COALESCE_MAX_CHARS if max_chars is None else max_chars
+    max_delay = Config.STREAM_COALESCE_MAX_DELAY if max_delay is None else max_delay
+    queue_size = Config.STREAM_QUEUE_SIZE if queue_size is None else queue_size
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    producer = asyncio.create_task(_pump(events, queue))
+
+    answer_parts: List[str] = []
+    pending: List[str] = []
+    pending_chars = 0
+    pending_since = 0.0
+
+    def flush() -> bytes:
+        nonlocal pending, pending_chars
+        text = "".join(pending)
+        pending = []
+        pending_chars = 0
+        return encode_token_frame(text)
+
+    try:
+        yield START_FRAME
+        while True:
+            if pending:
+                timeout = max(0.0, pending_since + max_delay - time.monotonic())
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    yield flush()
+                    continue
+            else:
+                event = await queue.get()
+
+            if event is _STREAM_END:
+                break
+
+            if isinstance(event, _StreamError):
+                if pending:
+                    yield flush()
+                yield encode_sse_event({"type": "error", "message": str(event.error)})
+                break
+
+            # If this is a chunk of the answer
+            if "chunk" in event:
+                text = event["chunk"]
+                if text:
+                    if not pending:
+                        pending_since = time.monotonic()
+                    pending.append(text)
+                    pending_chars += len(text)
+                    answer_parts.append(text)
+                    if pending_chars >= max_chars:
+                        yield flush()
+                continue
+
+            # Anything else keeps its position relative to the tokens
+            if pending:
+                yield flush()
+
+            # If this contains metadata, send it separately
+            if "metadata" in event:
+                yield encode_sse_event({"type": "metadata", "data": event["metadata"]})
+                continue
+
+            # If we have a complete answer in one go
+            if "answer" in event and event["answer"]:
+                answer_parts = [event["answer"]]
+                yield encode_sse_event({"type": "answer", "text": event["answer"]})
+
+            # If we're done
+            if event.get("done", False):
+                yield encode_end_frame("".join(answer_parts))
+    finally:
+        producer.cancel()
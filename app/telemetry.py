@@ -0,0 +1,97 @@
+import json
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+from app.config import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    from opentelemetry import trace
+except ImportError:  # tracing is optional
+    trace = None
+
+_tracer = trace.get_tracer(__name__) if trace is not None and Config.TRACING_ENABLED else None
+
+# Stages of get_streaming_rag_response; first_token and total are measured from request start
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Latency of each stage of the RAG pipeline",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+REQUESTS = Counter(
+    "rag_requests_total",
+    "RAG requests by how they were answered",
+    ["outcome"],
+)
+COALESCED = Counter(
+    "rag_coalesced_requests_total",
+    "RAG requests served by joining an identical request already in flight",
+)
+IN_FLIGHT = Gauge("rag_requests_in_flight", "RAG requests currently being answered")
+
+
+class RequestTimer:
+    """Per-request stage timings, exported as histograms, spans and one log line.
+
+    Stages must not span a `yield` of the streaming generator: the OpenTelemetry
+    context is attached per stage, and the generator may resume in another context.
+    """
+
+    def __init__(self, name: str = "rag.request"):
+        self.start = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self._span = _tracer.start_span(name) if _tracer is not None else None
+        self._finished = False
+        IN_FLIGHT.inc()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        if self._span is None:
+            try:
+                yield
+            finally:
+                self._record(name, time.perf_counter() - start)
+            return
+        context = trace.set_span_in_context(self._span)
+        with _tracer.start_as_current_span(f"rag.{name}", context=context):
+            try:
+                yield
+            finally:
+                self._record(name, time.perf_counter() - start)
+
+    def mark(self, name: str) -> None:
+        """Record the time from request start, once (e.g. first_token)."""
+        if name not in self.timings:
+            self._record(name, time.perf_counter() - self.start)
+
+    def _record(self, name: str, seconds: float) -> None:
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+        STAGE_SECONDS.labels(stage=name).observe(seconds)
+
+    def finish(self, outcome: str, attributes: Optional[Dict[str, object]] = None) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        self.mark("total")
+        IN_FLIGHT.dec()
+        REQUESTS.labels(outcome=outcome).inc()
+        if self._span is not None:
+            self._span.set_attribute("rag.outcome", outcome)
+            for key, value in (attributes or {}).items():
+                self._span.set_attribute(f"rag.{key}", value)
+            self._span.end()
+        logger.info(
+            "rag_request %s",
+            json.dumps({
+                "outcome": outcome,
+                **(attributes or {}),
+                **{f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in self.timings.items()},
+            }),
+        )
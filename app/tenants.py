@@ -0,0 +1,166 @@
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.prompts import PromptTemplate
+
+from app.config import Config
+from app.prompts import (
+    COLLAPSE_PROMPT,
+    MAP_PROMPT,
+    QUERY_PARSER_PROMPT,
+    REDUCE_PROMPT,
+    RESPONSE_PROMPT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Templates a tenant can override; each may use {business}
+_DEFAULT_PROMPTS = {
+    "response": RESPONSE_PROMPT,
+    "map": MAP_PROMPT,
+    "collapse": COLLAPSE_PROMPT,
+    "reduce": REDUCE_PROMPT,
+}
+
+
+def review_location_id(review_name: str) -> Optional[str]:
+    """Location of a review resource name like accounts/1/locations/2/reviews/abc."""
+    parts = review_name.split("/")
+    if "locations" in parts:
+        index = parts.index("locations") + 1
+        if index < len(parts):
+            return parts[index]
+    return None
+
+
+@dataclass
+class Tenant:
+    """A business whose reviews are answered from one collection.
+
+    Tenants sharing a collection are kept apart by the indexed `location_id`
+    payload field; a tenant with its own collection needs no location_ids.
+    """
+
+    tenant_id: str
+    name: str
+    description: str = ""
+    collection_name: str = Config.COLLECTION_NAME
+    location_ids: List[str] = field(default_factory=list)
+    # Template overrides by name: "query_parser", "response", "map", "collapse" or "reduce"
+    prompts: Dict[str, str] = field(default_factory=dict)
+    _templates: Dict[str, PromptTemplate] = field(default_factory=dict, init=False, repr=False)
+
+    @property
+    def business(self) -> str:
+        return f"{self.name}, {self.description}" if self.description else self.name
+
+    def scope(self, filter_dict: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """The parsed filter restricted to this tenant's locations."""
+        if not self.location_ids:
+            return filter_dict
+        return {**(filter_dict or {}), "location_id": {"$in": list(self.location_ids)}}
+
+    def parser_prompt(self) -> str:
+        return self.prompts.get("query_parser", QUERY_PARSER_PROMPT)
+
+    def prompt(self, name: str) -> PromptTemplate:
+        template = self._templates.get(name)
+        if template is None:
+            template = (
+                PromptTemplate.from_template(self.prompts[name])
+                if name in self.prompts
+                else _DEFAULT_PROMPTS[name]
+            )
+            if "business" in template.input_variables:
+                template = template.partial(business=self.business)
+            self._templates[name] = template
+        return template
+
+
+class TenantRegistry:
+    def __init__(self, tenants: List[Tenant], default_id: Optional[str] = None):
+        if not tenants:
+            raise ValueError("At least one tenant is required")
+        for tenant in tenants:
+            # Session keys are "<tenant_id>:<session_id>", so the id must end at the first colon
+            if ":" in tenant.tenant_id:
+                raise ValueError(f"Tenant id {tenant.tenant_id!r} must not contain ':'")
+        self._tenants = {tenant.tenant_id: tenant for tenant in tenants}
+        self._check_shared_collections(tenants)
+        self.default: Optional[Tenant] = self._tenants.get(default_id)
+        if self.default is None:
+            if len(tenants) == 1:
+                self.default = tenants[0]
+            else:
+                # Guessing would answer from another business's reviews
+                logger.warning(
+                    "DEFAULT_TENANT_ID %r matches no tenant; requests must send tenant_id", default_id
+                )
+        self._location_collections = {
+            location_id: tenant.collection_name
+            for tenant in tenants
+            for location_id in tenant.location_ids
+        }
+
+    @staticmethod
+    def _check_shared_collections(tenants: List[Tenant]) -> None:
+        """Tenants sharing a collection must each be scoped to their own locations."""
+        by_collection: Dict[str, List[Tenant]] = {}
+        for tenant in tenants:
+            by_collection.setdefault(tenant.collection_name, []).append(tenant)
+        for collection, sharing in by_collection.items():
+            unscoped = [tenant.tenant_id for tenant in sharing if not tenant.location_ids]
+            if len(sharing) > 1 and unscoped:
+                raise ValueError(
+                    f"Tenants {unscoped} share collection '{collection}' without location_ids "
+                    "and would see every other tenant's reviews"
+                )
+
+    @classmethod
+    def from_file(cls, path: str, default_id: Optional[str] = None) -> "TenantRegistry":
+        """Load tenants from a JSON file of the form {"tenants": [{"tenant_id": ..., ...}]}."""
+        with open(path, "r") as f:
+            entries = json.load(f)["tenants"]
+        tenants = [
+            Tenant(
+                tenant_id=entry["tenant_id"],
+                name=entry["name"],
+                description=entry.get("description", ""),
+                collection_name=entry.get("collection") or Config.COLLECTION_NAME,
+                location_ids=[str(location) for location in entry.get("location_ids", [])],
+                prompts=entry.get("prompts", {}),
+            )
+            for entry in entries
+        ]
+        return cls(tenants, default_id)
+
+    def get(self, tenant_id: Optional[str] = None) -> Optional[Tenant]:
+        """The tenant with this id, the default tenant for None, or None if unknown or no default."""
+        if tenant_id is None:
+            return self.default
+        return self._tenants.get(tenant_id)
+
+    def __iter__(self):
+        return iter(self._tenants.values())
+
+    def collection_for_location(self, location_id: Optional[str]) -> str:
+        """Where ingestion puts a review; unknown locations go to the shared collection."""
+        return self._location_collections.get(location_id, Config.COLLECTION_NAME)
+
+    def collections(self) -> List[str]:
+        """Collections some tenant answers from; the shared one only if a tenant uses it."""
+        return sorted({tenant.collection_name for tenant in self._tenants.values()})
+
+
+def load_tenants() -> TenantRegistry:
+    if Config.TENANTS_FILE:
+        return TenantRegistry.from_file(Config.TENANTS_FILE, Config.DEFAULT_TENANT_ID)
+    # Single-business deployments: one tenant answering from the whole collection
+    return TenantRegistry(
+        [Tenant(Config.DEFAULT_TENANT_ID, Config.DEFAULT_BUSINESS_NAME, Config.DEFAULT_BUSINESS_DESCRIPTION)]
+    )
+
+
+tenants = load_tenants()
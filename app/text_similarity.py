@@ -0,0 +1,13 @@
+import re
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def word_set(text: str) -> frozenset:
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
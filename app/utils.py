@@ -1,6 +1,43 @@
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-import qdrant_client
+from functools import partial
+from app.config import Config
+import asyncio
+import time
+
+# Bounded pool for the synchronous SDK calls left on the request path, so they
+# can't starve the event loop or grow the default executor without limit
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=Config.BLOCKING_POOL_SIZE, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking call in the bounded thread pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args, **kwargs))
+
+
+class AsyncRateLimiter:
+    """Token bucket allowing `rate` acquisitions per `period` seconds."""
+
+    def __init__(self, rate: float, period: float = 60.0):
+        self.capacity = max(1.0, rate)
+        self.fill_rate = rate / period
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.fill_rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.fill_rate)
 
 
 def iso8601_to_timestamp(dt_str):
@@ -9,41 +46,7 @@ def iso8601_to_timestamp(dt_str):
         dt_str = dt_str[:-1] + "+00:00"
     return datetime.fromisoformat(dt_str).timestamp()
 
-# TODO: Finish implementing and use in prompts
-def get_review_stats_parallel(qdrant_client, collection_name, models: qdrant_client.models):
-    """Get review stats for each rating (1-5) over the last week, month, and year."""
-    now = datetime.now(timezone.utc)
-    periods = {
-        "week": now - timedelta(days=7),
-        "month": now - timedelta(days=30),
-        "year": now - timedelta(days=365),
-    }
-
-    def count_for(period, rating, since):
-        filter_ = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="rating", match=models.MatchValue(value=rating)
-                ),
-                models.FieldCondition(
-                    key="createTime",
-                    range=models.Range(gte=iso8601_to_timestamp(since.isoformat())),
-                ),
-            ]
-        )
-        count = qdrant_client.count(
-            collection_name=collection_name, filter=filter_
-        ).count
-        return (period, rating, count)
-
-    stats = {period: {} for period in periods}
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(count_for, period, rating, since)
-            for period, since in periods.items()
-            for rating in range(1, 6)
-        ]
-        for future in futures:
-            period, rating, count = future.result()
-            stats[period][rating] = count
-    return stats
\ No newline at end of file
+
+def get_current_date() -> str:
+    # to simulate streaming reviews we use the day after the most recent review (2025-05-25)
+    return datetime(2025, 5, 25).strftime("%Y-%m-%d")
@@ -1,13 +1,15 @@
-from qdrant_client import QdrantClient, models
+import logging
+import math
+from dataclasses import dataclass
+from qdrant_client import models
+from app.collection_schema import dense_search_params, truncate_dense
 from app.config import Config
+from app.qdrant_pool import is_transport_error, qdrant_pool
 from app.utils import iso8601_to_timestamp
-from app.vertexai_models import get_query_embeddings
-from typing import List, Dict, Any
+from app.vertexai_models import aget_query_embeddings, get_query_embeddings
+from typing import FrozenSet, List, Dict, Any, Optional, Tuple, Union
 
-
-def get_qdrant():
-    qdrant_host = Config.QDRANT_HOST
-    return QdrantClient(host=qdrant_host, prefer_grpc=True)
+logger = logging.getLogger(__name__)
 
 
 def build_qdrant_filter(parsed_filter: dict) -> models.Filter:
@@ -33,58 +35,284 @@ def build_qdrant_filter(parsed_filter: dict) -> models.Filter:
     if "createTime" in parsed_filter and "$gte" in parsed_filter["createTime"]:
         ts = iso8601_to_timestamp(parsed_filter["createTime"]["$gte"])
         must.append(models.FieldCondition(key="createTime", range=models.Range(gte=ts)))
+    # Added by Tenant.scope, never by the parser; served by the tenant index on location_id
+    if "location_id" in parsed_filter:
+        must.append(
+            models.FieldCondition(
+                key="location_id", match=models.MatchAny(any=parsed_filter["location_id"]["$in"])
+            )
+        )
     return models.Filter(must=must) if must else None
 
 
-def hybrid_search(query_text: str, qdrant_filter: models.Filter = None, k: int = 20) -> List[Dict[str, Any]]:
-    """Perform hybrid search using both dense and sparse vectors (if available)."""
-    qdrant = get_qdrant()
-    
-    # Get query embeddings
-    query_embeddings = get_query_embeddings(query_text)
-    dense_vector = query_embeddings['dense']
-    
-    # For now, only use dense search since sparse embeddings may not be available
-    # with the current text-embedding-004 model
-    try:
-        dense_results = qdrant.search(
-            collection_name=Config.COLLECTION_NAME,
-            query_vector=models.NamedVector(name="dense", vector=dense_vector),
-            query_filter=qdrant_filter,
-            limit=k,
-            with_payload=True,
+@dataclass(frozen=True)
+class CollectionVectors:
+    """The vectors a collection was created with, which decide the search plans it can serve."""
+
+    dense: FrozenSet[str] = frozenset()  # Named dense vectors; empty for a single unnamed vector
+    sparse: FrozenSet[str] = frozenset()
+
+    @classmethod
+    def from_info(cls, info: models.CollectionInfo) -> "CollectionVectors":
+        params = info.config.params
+        dense = frozenset(params.vectors) if isinstance(params.vectors, dict) else frozenset()
+        return cls(dense=dense, sparse=frozenset(params.sparse_vectors or {}))
+
+    def has(self, name: str) -> bool:
+        return name in self.dense or name in self.sparse
+
+
+# Read once per collection; dropped when a search fails, in case the collection was recreated
+_collection_vectors: Dict[str, CollectionVectors] = {}
+
+
+def _rank_fused(request: Dict[str, Any]) -> bool:
+    """Whether a plan's scores come from RRF, which reflects only rank, not relevance."""
+    query = request.get("query")
+    return isinstance(query, models.FusionQuery) and query.fusion == models.Fusion.RRF
+
+
+def _to_results(points, rank_fused: bool = False) -> List[Dict[str, Any]]:
+    """Convert scored points to the format expected by the retriever."""
+    return [
+        {"payload": point.payload, "score": point.score, "rank_fused": rank_fused}
+        for point in points
+    ]
+
+
+def _fusion_query():
+    if Config.FUSION_MODE == "dbsf":
+        return models.FusionQuery(fusion=models.Fusion.DBSF)
+    if Config.FUSION_MODE == "weighted":
+        # $score[i] is the score from the i-th prefetch (dense first, then sparse)
+        return models.FormulaQuery(
+            formula=models.SumExpression(
+                sum=[
+                    models.MultExpression(mult=[Config.DENSE_WEIGHT, "$score[0]"]),
+                    models.MultExpression(mult=[Config.SPARSE_WEIGHT, "$score[1]"]),
+                ]
+            ),
+            defaults={"$score[0]": 0.0, "$score[1]": 0.0},
         )
-        
-        # Convert results to the expected format
-        combined_results = []
-        for result in dense_results:
-            combined_results.append({
-                "payload": result.payload, 
-                "score": result.score
-            })
-        
-        return combined_results
-        
-    except Exception as e:
-        # Fallback to default vector search if named vectors don't exist yet
-        print(f"Named vector search failed, trying default vector: {e}")
+    return models.FusionQuery(fusion=models.Fusion.RRF)
+
+
+def _dense_prefetch(
+    dense_vector: List[float],
+    qdrant_filter: Optional[models.Filter],
+    limit: int,
+    params: Optional[models.SearchParams],
+    two_stage: bool,
+) -> models.Prefetch:
+    """The dense branch; two-stage searches "dense_small" and rescores with the full vector."""
+    if not two_stage:
+        return models.Prefetch(
+            query=dense_vector, using="dense", filter=qdrant_filter, limit=limit, params=params
+        )
+    return models.Prefetch(
+        prefetch=models.Prefetch(
+            query=truncate_dense(dense_vector),
+            using="dense_small",
+            filter=qdrant_filter,
+            limit=math.ceil(limit * Config.DENSE_SMALL_OVERSAMPLING),
+            params=params,
+        ),
+        query=dense_vector,
+        using="dense",
+        limit=limit,
+    )
+
+
+def _search_plans(
+    query_embeddings: Dict[str, Any],
+    qdrant_filter: Optional[models.Filter],
+    k: int,
+    offset: int = 0,
+    with_payload: Union[bool, List[str]] = True,
+    collection_name: str = Config.COLLECTION_NAME,
+    vectors: Optional[CollectionVectors] = None,
+    dense_only: bool = False,
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Query API requests to try in order, from full hybrid down to legacy layouts.
+
+    With `vectors`, only the plans the collection can serve are built; without,
+    every layout is tried. `dense_only` leaves out the fused plans.
+    """
+
+    def supports(name: str) -> bool:
+        return vectors is None or vectors.has(name)
+
+    dense_vector = query_embeddings['dense']
+    sparse_vector = query_embeddings.get('sparse')
+    # Oversampling and rescoring when the collection profile quantizes the dense vector
+    dense_params = dense_search_params()
+    common = {
+        "collection_name": collection_name,
+        "query_filter": qdrant_filter,
+        "limit": k,
+        "offset": offset,
+        "with_payload": with_payload,
+    }
+    prefetch_limit = (offset + k) * Config.HYBRID_PREFETCH_FACTOR
+    plans = []
+    small_vector = Config.DENSE_SMALL_VECTOR_SIZE and supports("dense_small")
+    for two_stage in ([True, False] if small_vector else [False]):
+        prefix = "two-stage " if two_stage else ""
+        if not dense_only and sparse_vector and sparse_vector["indices"] and supports("sparse"):
+            # Dense and sparse candidates are fused server-side in a single round trip
+            plans.append((
+                prefix + "hybrid",
+                {
+                    **common,
+                    "prefetch": [
+                        _dense_prefetch(dense_vector, qdrant_filter, prefetch_limit, dense_params, two_stage),
+                        models.Prefetch(
+                            query=models.SparseVector(**sparse_vector),
+                            using="sparse",
+                            filter=qdrant_filter,
+                            limit=prefetch_limit,
+                        ),
+                    ],
+                    "query": _fusion_query(),
+                },
+            ))
+        if two_stage:
+            plans.append((
+                prefix + "dense",
+                {
+                    **common,
+                    "prefetch": _dense_prefetch(dense_vector, qdrant_filter, prefetch_limit, dense_params, True),
+                    "query": dense_vector,
+                    "using": "dense",
+                },
+            ))
+    # Collections created before sparse vectors were added
+    if supports("dense"):
+        plans.append((
+            "dense",
+            {**common, "query": dense_vector, "using": "dense", "search_params": dense_params},
+        ))
+    # Collections with a single unnamed vector
+    if vectors is None or not vectors.dense:
+        plans.append(("default vector", {**common, "query": dense_vector}))
+    return plans
+
+
+def hybrid_search(
+    query_text: str,
+    qdrant_filter: models.Filter = None,
+    k: int = 20,
+    query_embeddings: Optional[Dict[str, Any]] = None,
+    offset: int = 0,
+    with_payload: Union[bool, List[str]] = True,
+    collection_name: str = Config.COLLECTION_NAME,
+    dense_only: bool = False,
+) -> List[Dict[str, Any]]:
+    """Perform hybrid search fusing dense and BM25 sparse results in Qdrant."""
+    qdrant = qdrant_pool.sync_client()
+
+    # Get query embeddings
+    if query_embeddings is None:
+        query_embeddings = get_query_embeddings(query_text)
+
+    vectors = _collection_vectors.get(collection_name)
+    if vectors is None:
         try:
-            dense_results = qdrant.search(
-                collection_name=Config.COLLECTION_NAME,
-                query_vector=dense_vector,
-                query_filter=qdrant_filter,
-                limit=k,
-                with_payload=True,
-            )
-            
-            combined_results = []
-            for result in dense_results:
-                combined_results.append({
-                    "payload": result.payload, 
-                    "score": result.score
-                })
-            
-            return combined_results
-        except Exception as fallback_error:
-            print(f"All search methods failed: {fallback_error}")
+            vectors = CollectionVectors.from_info(qdrant.get_collection(collection_name))
+        except Exception as e:
+            if is_transport_error(e):
+                raise
+            logger.warning("Reading collection %s failed: %s", collection_name, e)
             return []
+        _collection_vectors[collection_name] = vectors
+
+    for name, request in _search_plans(
+        query_embeddings, qdrant_filter, k, offset, with_payload, collection_name, vectors, dense_only
+    ):
+        try:
+            return _to_results(qdrant.query_points(**request).points, _rank_fused(request))
+        except Exception as e:
+            if is_transport_error(e):
+                raise
+            _collection_vectors.pop(collection_name, None)
+            logger.warning("%s search failed: %s", name.capitalize(), e)
+    return []
+
+
+async def ahybrid_search(
+    query_text: str,
+    qdrant_filter: models.Filter = None,
+    k: int = 20,
+    query_embeddings: Optional[Dict[str, Any]] = None,
+    offset: int = 0,
+    with_payload: Union[bool, List[str]] = True,
+    collection_name: str = Config.COLLECTION_NAME,
+    dense_only: bool = False,
+) -> List[Dict[str, Any]]:
+    """Async variant of hybrid_search; embedding and search never block the event loop.
+
+    Pass `query_embeddings` to reuse vectors that were already computed for the query,
+    `offset` to fetch later pages, `with_payload` to project payload fields,
+    `collection_name` to search a tenant's own collection and `dense_only` to skip fusion.
+    """
+    if query_embeddings is None:
+        query_embeddings = await aget_query_embeddings(query_text)
+
+    async with qdrant_pool.client() as qdrant:
+        vectors = _collection_vectors.get(collection_name)
+        if vectors is None:
+            try:
+                vectors = CollectionVectors.from_info(await qdrant.get_collection(collection_name))
+            except Exception as e:
+                if is_transport_error(e):
+                    raise
+                logger.warning("Reading collection %s failed: %s", collection_name, e)
+                return []
+            _collection_vectors[collection_name] = vectors
+
+        for name, request in _search_plans(
+            query_embeddings, qdrant_filter, k, offset, with_payload, collection_name, vectors, dense_only
+        ):
+            try:
+                response = await qdrant.query_points(**request)
+                return _to_results(response.points, _rank_fused(request))
+            except Exception as e:
+                # Other plans can't help when the connection itself failed; let the pool see it
+                if is_transport_error(e):
+                    raise
+                # Read the vectors again next time, in case the collection was recreated
+                _collection_vectors.pop(collection_name, None)
+                logger.warning("%s search failed: %s", name.capitalize(), e)
+        return []
+
+
+def dense_scores(
+    query_embeddings: Dict[str, Any],
+    qdrant_filter: Optional[models.Filter] = None,
+    k: int = 20,
+    collection_name: str = Config.COLLECTION_NAME,
+) -> List[float]:
+    """Cosine scores of the top k dense matches, best first, without payloads.
+
+    RRF scores only encode rank, so this is the relevance signal that judges how
+    deep a rank-fused search should go.
+    """
+    results = hybrid_search(
+        "", qdrant_filter, k, query_embeddings, with_payload=False,
+        collection_name=collection_name, dense_only=True,
+    )
+    return [result["score"] for result in results]
+
+
+async def adense_scores(
+    query_embeddings: Dict[str, Any],
+    qdrant_filter: Optional[models.Filter] = None,
+    k: int = 20,
+    collection_name: str = Config.COLLECTION_NAME,
+) -> List[float]:
+    """Async variant of dense_scores."""
+    results = await ahybrid_search(
+        "", qdrant_filter, k, query_embeddings, with_payload=False,
+        collection_name=collection_name, dense_only=True,
+    )
+    return [result["score"] for result in results]
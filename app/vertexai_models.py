@@ -1,31 +1,163 @@
-import vertexai
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
 from app.config import Config
-from vertexai.language_models import TextEmbeddingModel
-from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
+from app.utils import run_blocking
+from app.embedding_cache import EmbeddingCache
+from app.sparse_encoder import sparse_encoder
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Creates model clients on first use, once per process.
+
+    Nothing is constructed at import. The app lifespan can warm up the models
+    a deployment is expected to use, and tests or benchmarks can `set` stand-ins
+    before anything asks for the real client.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        # One lock per model, so building one model never waits on another
+        self._name_locks: Dict[str, threading.Lock] = {}
+        self.load_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        self._factories[name] = factory
+
+    def set(self, name: str, instance: Any) -> None:
+        with self._lock:
+            self._instances[name] = instance
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def get(self, name: str) -> Any:
+        """The model, constructing it on first use; blocks, so async code should use aget."""
+        if name in self._instances:
+            return self._instances[name]
+        with self._lock:
+            name_lock = self._name_locks.setdefault(name, threading.Lock())
+        with name_lock:
+            if name not in self._instances:
+                start = time.perf_counter()
+                self._instances[name] = self._factories[name]()
+                self.load_seconds[name] = time.perf_counter() - start
+                logger.info("Loaded %s in %.2fs", name, self.load_seconds[name])
+            return self._instances[name]
+
+    async def aget(self, name: str) -> Any:
+        """Like get, but a first-time construction runs off the event loop."""
+        if name in self._instances:
+            return self._instances[name]
+        return await run_blocking(self.get, name)
+
+    async def warm_up(self, names: List[str]) -> Dict[str, float]:
+        """Construct the named models concurrently; returns their load times."""
+        await asyncio.gather(*(self.aget(name) for name in names if name in self._factories))
+        return {name: round(self.load_seconds.get(name, 0.0), 3) for name in names}
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "loaded": {name: round(seconds, 3) for name, seconds in self.load_seconds.items()},
+            "not_loaded": sorted(name for name in self._factories if name not in self._instances),
+        }
+
+
+_vertexai_ready = False
+
+
+def _init_vertexai() -> None:
+    global _vertexai_ready
+    if not _vertexai_ready:
+        import vertexai
+
+        vertexai.init(project=Config.PROJECT, location=Config.LOCATION)
+        _vertexai_ready = True
+
+
+def _chat_model(model: str) -> Callable[[], Any]:
+    def factory():
+        from langchain_google_vertexai import ChatVertexAI
+
+        _init_vertexai()
+        return ChatVertexAI(model=model, project=Config.PROJECT, location=Config.LOCATION)
+    return factory
+
+
+def _embeddings_model():
+    # Use the native Vertex AI model for hybrid embeddings
+    from vertexai.language_models import TextEmbeddingModel
+
+    _init_vertexai()
+    return TextEmbeddingModel.from_pretrained(Config.EMBEDDING_MODEL)
+
+
+def _legacy_embeddings_model():
+    # Legacy embedding model for compatibility (if needed)
+    from langchain_google_vertexai import VertexAIEmbeddings
+
+    _init_vertexai()
+    return VertexAIEmbeddings(
+        model_name=Config.EMBEDDING_MODEL,
+        project=Config.PROJECT,
+        location=Config.LOCATION,
+    )
+
 
-# Initialize Vertex AI
-vertexai.init(project=Config.PROJECT, location=Config.LOCATION)
+def _embedding_cache() -> Optional[EmbeddingCache]:
+    # Vertex only returns dense vectors for text-embedding-004, so only those are cached
+    if not Config.EMBEDDING_CACHE_ENABLED:
+        return None
+    return EmbeddingCache(
+        Config.EMBEDDING_CACHE_DIR,
+        Config.EMBEDDING_MODEL,
+        Config.DENSE_VECTOR_SIZE,
+        lru_size=Config.EMBEDDING_CACHE_LRU_SIZE,
+    )
 
-default_llm = ChatVertexAI(
-    model=Config.DEFAULT_LLM_MODEL,
-    project=Config.PROJECT,
-    location=Config.LOCATION,
-)
 
+models = ModelRegistry()
+models.register("default_llm", _chat_model(Config.DEFAULT_LLM_MODEL))
 # More powerful model for complex tasks like recommendations
-thinking_llm = ChatVertexAI(
-    model=Config.THINKING_LLM_MODEL,
-    project=Config.PROJECT,
-    location=Config.LOCATION,
-)
-
-query_parser_llm = ChatVertexAI(
-    model=Config.QUERY_PARSER_MODEL,
-    project=Config.PROJECT,
-    location=Config.LOCATION,
-)
-
-def get_llm_for_query(user_query: str) -> ChatVertexAI:
+models.register("thinking_llm", _chat_model(Config.THINKING_LLM_MODEL))
+models.register("query_parser_llm", _chat_model(Config.QUERY_PARSER_MODEL))
+models.register("embeddings", _embeddings_model)
+models.register("legacy_embeddings", _legacy_embeddings_model)
+models.register("embedding_cache", _embedding_cache)
+
+
+def get_default_llm():
+    return models.get("default_llm")
+
+
+async def aget_default_llm():
+    return await models.aget("default_llm")
+
+
+def get_query_parser_llm():
+    return models.get("query_parser_llm")
+
+
+async def aget_query_parser_llm():
+    return await models.aget("query_parser_llm")
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    return models.get("embedding_cache")
+
+
+async def aget_embedding_cache() -> Optional[EmbeddingCache]:
+    return await models.aget("embedding_cache")
+
+
+def get_llm_for_query(user_query: str):
     """Select the appropriate LLM based on the query type."""
     query_lower = user_query.lower()
     
@@ -41,92 +173,169 @@ def get_llm_for_query(user_query: str) -> ChatVertexAI:
     ]
     
     if any(keyword in query_lower for keyword in pro_keywords):
-        print(f"Using Pro model for query: {user_query[:50]}...")
-        return thinking_llm
+        logger.debug("Using Pro model for query: %s...", user_query[:50])
+        return models.get("thinking_llm")
     else:
-        return default_llm
+        return get_default_llm()
+
+def _cache_lookup(text: str, embedding_cache: Optional[EmbeddingCache] = None):
+    embedding_cache = embedding_cache or get_embedding_cache()
+    if embedding_cache is None:
+        return None
+    dense_vector = embedding_cache.get(text)
+    if dense_vector is None:
+        return None
+    return {
+        'dense': dense_vector,
+        'sparse': None
+    }
 
-# Use the native Vertex AI model for hybrid embeddings
-embeddings_model = TextEmbeddingModel.from_pretrained(Config.EMBEDDING_MODEL)
+def _cache_lookup_many(texts: List[str], embedding_cache: Optional[EmbeddingCache] = None) -> List[Optional[dict]]:
+    return [_cache_lookup(text, embedding_cache) for text in texts]
 
-# Legacy embedding model for compatibility (if needed)
-legacy_embeddings_model = VertexAIEmbeddings(
-    model_name=Config.EMBEDDING_MODEL,
-    project=Config.PROJECT,
-    location=Config.LOCATION,
-)
+def _cache_store(
+    texts: List[str], results: List[dict], embedding_cache: Optional[EmbeddingCache] = None
+) -> None:
+    embedding_cache = embedding_cache or get_embedding_cache()
+    if embedding_cache is None:
+        return
+    cacheable = [(text, result['dense']) for text, result in zip(texts, results) if result['sparse'] is None]
+    if cacheable:
+        embedding_cache.put_many([text for text, _ in cacheable], [dense for _, dense in cacheable])
+
+def _to_hybrid(embedding):
+    """Extract dense and sparse vectors from a TextEmbedding response."""
+    dense_vector = embedding.values  # Dense vector
+    sparse_vector = None
+
+    # Check if sparse embedding is available in the response
+    # Note: text-embedding-004 may not support sparse embeddings yet
+    if hasattr(embedding, 'sparse_embedding') and embedding.sparse_embedding:
+        sparse_vector = embedding.sparse_embedding
+    elif hasattr(embedding, 'sparse') and embedding.sparse:
+        sparse_vector = embedding.sparse
+
+    return {
+        'dense': dense_vector,
+        'sparse': sparse_vector
+    }
+
+def _with_local_sparse(result: dict, text: str, is_query: bool) -> dict:
+    """Fill in BM25 sparse vectors from the local encoder when Vertex didn't return any."""
+    if result['sparse'] is None:
+        encode = sparse_encoder.encode_query if is_query else sparse_encoder.encode_document
+        result = {**result, 'sparse': encode(text)}
+    return result
+
+def _embed_dense(text: str):
+    cached = _cache_lookup(text)
+    if cached is not None:
+        return cached
+    embeddings = models.get("embeddings").get_embeddings(
+        [text],
+        output_dimensionality=Config.DENSE_VECTOR_SIZE
+    )
+    result = _to_hybrid(embeddings[0])
+    _cache_store([text], [result])
+    return result
 
 def get_hybrid_embeddings(text: str):
     """Get both dense and sparse embeddings for hybrid search."""
     try:
         # Get embeddings without task_type since it's not supported
-        embeddings = embeddings_model.get_embeddings(
-            [text],
-            output_dimensionality=Config.DENSE_VECTOR_SIZE
-        )
-        
-        embedding = embeddings[0]
-        
-        # Extract dense vector
-        dense_vector = embedding.values  # Dense vector
-        sparse_vector = None
-        
-        # Check if sparse embedding is available in the response
-        # Note: text-embedding-004 may not support sparse embeddings yet
-        if hasattr(embedding, 'sparse_embedding') and embedding.sparse_embedding:
-            sparse_vector = embedding.sparse_embedding
-        elif hasattr(embedding, 'sparse') and embedding.sparse:
-            sparse_vector = embedding.sparse
-        
-        return {
-            'dense': dense_vector,
-            'sparse': sparse_vector
-        }
+        result = _embed_dense(text)
     except Exception as e:
-        print(f"Error getting hybrid embeddings: {e}")
+        logger.warning("Error getting hybrid embeddings: %s", e)
         # Fallback to legacy embeddings model
         try:
-            dense_vector = legacy_embeddings_model.embed_query(text)
-            return {
-                'dense': dense_vector,
+            result = {
+                'dense': models.get("legacy_embeddings").embed_query(text),
                 'sparse': None
             }
         except Exception as fallback_error:
-            print(f"Fallback embedding also failed: {fallback_error}")
+            logger.warning("Fallback embedding also failed: %s", fallback_error)
             raise e
+    return _with_local_sparse(result, text, is_query=False)
 
 def get_query_embeddings(text: str):
     """Get embeddings optimized for query."""
     try:
-        embeddings = embeddings_model.get_embeddings(
-            [text],
-            output_dimensionality=Config.DENSE_VECTOR_SIZE
-        )
-        
-        embedding = embeddings[0]
-        
-        # Extract dense and sparse vectors
-        dense_vector = embedding.values
-        sparse_vector = None
-        
-        if hasattr(embedding, 'sparse_embedding') and embedding.sparse_embedding:
-            sparse_vector = embedding.sparse_embedding
-        elif hasattr(embedding, 'sparse') and embedding.sparse:
-            sparse_vector = embedding.sparse
-        
-        return {
-            'dense': dense_vector,
-            'sparse': sparse_vector
-        }
+        result = _embed_dense(text)
     except Exception as e:
-        print(f"Error getting query embeddings: {e}")
+        logger.warning("Error getting query embeddings: %s", e)
         # Fallback to legacy embeddings model
         try:
-            dense_vector = legacy_embeddings_model.embed_query(text)
-            return {
-                'dense': dense_vector,
+            result = {
+                'dense': models.get("legacy_embeddings").embed_query(text),
                 'sparse': None
             }
         except Exception as fallback_error:
-            print(f"Fallback embedding also failed: {fallback_error}")
+            logger.warning("Fallback embedding also failed: %s", fallback_error)
             raise e
+    return _with_local_sparse(result, text, is_query=True)
+
+async def aget_query_embeddings(text: str):
+    """Async variant of get_query_embeddings for the request path."""
+    embedding_cache = await aget_embedding_cache()
+    # The cache reads an mmap and appends with fsync, so it stays off the event loop too
+    result = await run_blocking(_cache_lookup, text, embedding_cache) if embedding_cache else None
+    if result is None:
+        try:
+            embeddings_model = await models.aget("embeddings")
+            embeddings = await embeddings_model.get_embeddings_async(
+                [text],
+                output_dimensionality=Config.DENSE_VECTOR_SIZE
+            )
+            result = _to_hybrid(embeddings[0])
+            if embedding_cache:
+                await run_blocking(_cache_store, [text], [result], embedding_cache)
+        except Exception as e:
+            logger.warning("Error getting query embeddings: %s", e)
+            # The legacy model only has a blocking client, keep it off the event loop
+            try:
+                legacy_embeddings = await models.aget("legacy_embeddings")
+                result = {
+                    'dense': await run_blocking(legacy_embeddings.embed_query, text),
+                    'sparse': None
+                }
+            except Exception as fallback_error:
+                logger.warning("Fallback embedding also failed: %s", fallback_error)
+                raise e
+    return _with_local_sparse(result, text, is_query=True)
+
+async def aget_hybrid_embeddings_batch(texts: List[str]):
+    """Embed a batch of documents with a single request (up to Config.EMBEDDING_BATCH_SIZE).
+
+    Texts already in the embedding cache are not sent to Vertex.
+    """
+    embedding_cache = await aget_embedding_cache()
+    results = (
+        await run_blocking(_cache_lookup_many, texts, embedding_cache)
+        if embedding_cache
+        else [None] * len(texts)
+    )
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        try:
+            embeddings_model = await models.aget("embeddings")
+            embeddings = await embeddings_model.get_embeddings_async(
+                missing_texts,
+                output_dimensionality=Config.DENSE_VECTOR_SIZE
+            )
+            embedded = [_to_hybrid(embedding) for embedding in embeddings]
+            if embedding_cache:
+                await run_blocking(_cache_store, missing_texts, embedded, embedding_cache)
+        except Exception as e:
+            logger.warning("Error getting batch embeddings: %s", e)
+            # Fallback to legacy embeddings model
+            try:
+                legacy_embeddings = await models.aget("legacy_embeddings")
+                dense_vectors = await run_blocking(legacy_embeddings.embed_documents, missing_texts)
+                embedded = [{'dense': dense_vector, 'sparse': None} for dense_vector in dense_vectors]
+            except Exception as fallback_error:
+                logger.warning("Fallback embedding also failed: %s", fallback_error)
+                raise e
+        for i, result in zip(missing, embedded):
+            results[i] = result
+    return [_with_local_sparse(result, text, is_query=False) for text, result in zip(texts, results)]
@@ -0,0 +1,139 @@
+"""Local stand-ins for Gemini and the Vertex embedding models.
+
+They only simulate cost: a fixed latency before the first token, a steady
+token rate and a per-request embedding latency. Embeddings are hashed bags of
+words, so paraphrases land close together and search results are meaningful.
+"""
+
+import asyncio
+import json
+import re
+import time
+import zlib
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.sparse_encoder import tokenize
+
+_USER_QUERY_RE = re.compile(r'user\'s query: "(.*?)" is related', re.DOTALL)
+_WORDS = (
+    "customers mention the roast duck sandwich fresh bread friendly staff slow service "
+    "on busy weekends prices feel high parking is limited overall reviews are positive"
+).split()
+
+
+def fake_parse(user_query: str) -> dict:
+    """A plausible parser response for common review questions."""
+    query = user_query.lower()
+    if re.search(r"\b(weather|sports|politics|stock)\b", query):
+        return {"off_topic": True, "query_embedding_text": user_query, "filter": {}}
+    parsed: dict = {"query_embedding_text": user_query, "filter": {}}
+    if re.search(r"\b(complain\w*|negative|bad|worst|dislike)\b", query):
+        parsed["filter"]["rating"] = {"$in": [1, 2]}
+    elif re.search(r"\b(praise|positive|love|best)\b", query):
+        parsed["filter"]["rating"] = {"$gte": 4}
+    if re.search(r"\b(this year|last year|over time|trend)\b", query):
+        parsed["filter"]["createTime"] = {"$gte": "2024-05-25T00:00:00Z"}
+    elif "last month" in query:
+        parsed["filter"]["createTime"] = {"$gte": "2025-04-25T00:00:00Z"}
+    return parsed
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model with Gemini-like timing. `parser=True` answers with parser JSON."""
+
+    first_token_latency: float = 0.3
+    tokens_per_second: float = 60.0
+    answer_tokens: int = 120
+    parser: bool = False
+
+    @property
+    def _llm_type(self) -> str:
+        return "benchmark-fake"
+
+    def _text(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        if self.parser:
+            match = _USER_QUERY_RE.search(prompt)
+            return json.dumps(fake_parse(match.group(1) if match else prompt))
+        return " ".join(_WORDS[i % len(_WORDS)] for i in range(self.answer_tokens)) + "."
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        return re.findall(r"\S+\s*", self._text(messages))
+
+    def _duration(self, tokens: int) -> float:
+        return self.first_token_latency + tokens / self.tokens_per_second
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages)
+        time.sleep(self._duration(len(self._tokens(messages))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._text(messages)
+        await asyncio.sleep(self._duration(len(self._tokens(messages))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(1 / self.tokens_per_second)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for token in self._tokens(messages):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(1 / self.tokens_per_second)
+
+
+def hashed_embedding(text: str, dimensionality: int) -> List[float]:
+    """Sum of a fixed random direction per term, normalized."""
+    vector = np.zeros(dimensionality, dtype=np.float32)
+    for token in tokenize(text) or [text]:
+        rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+        vector += rng.standard_normal(dimensionality, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return (vector / norm if norm else vector).tolist()
+
+
+class FakeTextEmbeddingModel:
+    """Stands in for vertexai TextEmbeddingModel (get_embeddings and get_embeddings_async)."""
+
+    def __init__(self, latency: float = 0.05, dimensionality: int = 768):
+        self.latency = latency
+        self.dimensionality = dimensionality
+        self.requests = 0
+
+    def _embed(self, texts: List[str], output_dimensionality: Optional[int]):
+        self.requests += 1
+        size = output_dimensionality or self.dimensionality
+        return [SimpleNamespace(values=hashed_embedding(text, size)) for text in texts]
+
+    def get_embeddings(self, texts: List[str], output_dimensionality: Optional[int] = None, **kwargs):
+        time.sleep(self.latency)
+        return self._embed(texts, output_dimensionality)
+
+    async def get_embeddings_async(self, texts: List[str], output_dimensionality: Optional[int] = None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return self._embed(texts, output_dimensionality)
+
+
+class FakeLegacyEmbeddings:
+    """Stands in for langchain VertexAIEmbeddings, which is only used as a fallback."""
+
+    def __init__(self, dimensionality: int = 768, **kwargs: Any):
+        self.dimensionality = dimensionality
+
+    def embed_query(self, text: str) -> List[float]:
+        return hashed_embedding(text, self.dimensionality)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [hashed_embedding(text, self.dimensionality) for text in texts]
@@ -0,0 +1,340 @@
+"""Replay a query corpus against /rag/streaming-query with local stand-ins.
+
+Qdrant runs in-process (local mode, in memory) and is seeded from reviews/;
+Gemini and the Vertex embedding models are replaced by the fakes in
+benchmarks.fakes through the model registry. Requests go straight to the FastAPI ASGI app, so the
+measured path is the real endpoint: parsing, embedding, search, context
+assembly, streaming and SSE framing.
+
+    python -m benchmarks.run_benchmark --concurrency 16 --requests 400
+    python -m benchmarks.run_benchmark --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from unittest.mock import patch
+
+import numpy as np
+
+# Settings that keep runs comparable; anything already set in the environment wins
+BENCHMARK_ENV = {
+    "MODEL_WARMUP": "off",
+    "QDRANT_POOL_SIZE": "1",
+    "QDRANT_HEALTH_CHECK_INTERVAL": "0",
+    "STATS_REFRESH_SECONDS": "0",
+    "SESSION_BACKEND": "memory",
+    "EMBEDDING_CACHE_ENABLED": "False",
+    "EMBEDDING_REQUESTS_PER_MINUTE": "1000000",
+    "LOG_LEVEL": "WARNING",
+}
+# Applied unless --with-caches, so every request pays the full pipeline cost
+NO_CACHE_ENV = {
+    "QUERY_CACHE_SIZE": "0",
+    "ANSWER_CACHE_ENABLED": "False",
+    "COALESCE_REQUESTS": "False",
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming RAG endpoint offline.")
+    parser.add_argument("--queries", default="benchmarks/queries.txt", help="Query corpus, one per line")
+    parser.add_argument("--reviews-dir", default="reviews", help="Review exports used to seed Qdrant")
+    parser.add_argument("--copies", type=int, default=50, help="Synthetic variants per review to enlarge the corpus")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests sent first")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at once")
+    parser.add_argument("--parser-latency-ms", type=float, default=250, help="Query parser LLM latency")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="Answer LLM time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Answer LLM token rate")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens per generated answer")
+    parser.add_argument("--embed-latency-ms", type=float, default=60, help="Embedding request latency")
+    parser.add_argument("--with-caches", action="store_true", help="Keep the parse and answer caches enabled")
+    parser.add_argument("--trace-memory", action="store_true", help="Also report the Python heap peak (slower)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON from an earlier run to compare against")
+    return parser.parse_args()
+
+
+def load_queries(path: str) -> List[str]:
+    lines = Path(path).read_text().splitlines()
+    return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+
+def synthetic_reviews(reviews_dir: str, copies: int, seed: int) -> List[Dict[str, Any]]:
+    """The exported reviews plus `copies` mixed variants of each, with spread-out dates."""
+    from scripts.embed_reviews import load_reviews
+
+    originals = []
+    for review_file in sorted(Path(reviews_dir).glob("*.json")):
+        originals.extend(load_reviews(review_file))
+    rng = random.Random(seed)
+    reference = datetime(2025, 5, 25, tzinfo=timezone.utc)
+    reviews = list(originals)
+    for copy in range(1, copies):
+        for review in originals:
+            other = rng.choice(originals)
+            created = reference - timedelta(days=rng.uniform(0, 730))
+            reviews.append({
+                **review,
+                "comment": f"{review['comment']} {other['comment']}",
+                "createTime": created.isoformat().replace("+00:00", "Z"),
+                "name": f"{review['name']}-{copy}",
+            })
+    return reviews
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "mean": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "p50": round(float(p50) * 1000, 1),
+        "p95": round(float(p95) * 1000, 1),
+        "p99": round(float(p99) * 1000, 1),
+        "mean": round(float(np.mean(values)) * 1000, 1),
+    }
+
+
+def stage_totals() -> Dict[str, tuple]:
+    """(seconds, observations) per pipeline stage from the Prometheus histogram."""
+    from prometheus_client import REGISTRY
+
+    totals: Dict[str, list] = {}
+    for metric in REGISTRY.collect():
+        if metric.name != "rag_stage_seconds":
+            continue
+        for sample in metric.samples:
+            entry = totals.setdefault(sample.labels.get("stage"), [0.0, 0.0])
+            if sample.name.endswith("_sum"):
+                entry[0] = sample.value
+            elif sample.name.endswith("_count"):
+                entry[1] = sample.value
+    return {stage: tuple(entry) for stage, entry in totals.items()}
+
+
+def stage_means(before: Dict[str, tuple], after: Dict[str, tuple]) -> Dict[str, float]:
+    """Mean milliseconds per stage over the measured requests only."""
+    means = {}
+    for stage, (seconds, count) in after.items():
+        seconds -= before.get(stage, (0.0, 0.0))[0]
+        count -= before.get(stage, (0.0, 0.0))[1]
+        if count:
+            means[stage] = round(seconds / count * 1000, 1)
+    return means
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_query(app, query: str) -> Dict[str, Any]:
+    """POST one query straight to the ASGI app, timing each SSE frame as it is sent.
+
+    httpx's ASGITransport buffers the whole body before returning, which would
+    hide time to first token, so the request is driven at the ASGI level.
+    """
+    body = json.dumps({"query": query}).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/rag/streaming-query",
+        "raw_path": b"/rag/streaming-query",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    finished = asyncio.Event()
+    request_sent = False
+    start = time.perf_counter()
+    result: Dict[str, Any] = {"ttft": None, "latency": None, "error": None, "status": None}
+    buffer = b""
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal buffer
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            return
+        buffer += message.get("body", b"")
+        while b"\n\n" in buffer:
+            frame, buffer = buffer.split(b"\n\n", 1)
+            if not frame.startswith(b"data: "):
+                continue
+            event = json.loads(frame[6:])
+            if event.get("type") in ("token", "answer") and result["ttft"] is None:
+                result["ttft"] = time.perf_counter() - start
+            elif event.get("type") == "error":
+                result["error"] = event.get("message")
+        if not message.get("more_body", False):
+            result["latency"] = time.perf_counter() - start
+            finished.set()
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    if result["status"] != 200 and result["error"] is None:
+        result["error"] = f"HTTP {result['status']}"
+    return result
+
+
+async def replay(app, queries: List[str], total: int, concurrency: int) -> List[Dict[str, Any]]:
+    results: List[Dict[str, Any]] = []
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < total:
+            query = queries[next_index % len(queries)]
+            next_index += 1
+            try:
+                results.append(await run_query(app, query))
+            except Exception as e:
+                results.append({"ttft": None, "latency": None, "error": repr(e)})
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def benchmark(args) -> Dict[str, Any]:
+    from qdrant_client import AsyncQdrantClient
+
+    from app.main import app
+    from app.qdrant_pool import qdrant_pool
+    from scripts.embed_reviews import ReviewIngester
+
+    local_qdrant = AsyncQdrantClient(location=":memory:")
+    reviews = synthetic_reviews(args.reviews_dir, args.copies, args.seed)
+    ingester = ReviewIngester(local_qdrant, concurrency=4)
+    await ingester.prepare(recreate=True)
+    await ingester.sync(reviews, batch_size=250)
+
+    queries = load_queries(args.queries)
+    with patch.object(qdrant_pool, "_new_client", lambda: local_qdrant):
+        async with app.router.lifespan_context(app):
+            await replay(app, queries, args.warmup, args.concurrency)
+            if args.trace_memory:
+                tracemalloc.start()
+            stages_before = stage_totals()
+            started = time.perf_counter()
+            results = await replay(app, queries, args.requests, args.concurrency)
+            duration = time.perf_counter() - started
+            stages = stage_means(stages_before, stage_totals())
+            heap_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+            if args.trace_memory:
+                tracemalloc.stop()
+
+    ok = [r for r in results if r["error"] is None and r["latency"] is not None]
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "reviews": len(reviews),
+            "queries": len(queries),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        },
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(ok) / duration, 2) if duration else None,
+        "ttft_ms": percentiles([r["ttft"] for r in ok if r["ttft"] is not None]),
+        "latency_ms": percentiles([r["latency"] for r in ok]),
+        "stage_mean_ms": stages,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "python_heap_peak_mb": round(heap_peak / 2**20, 1) if heap_peak is not None else None,
+    }
+
+
+def install_fakes(args) -> None:
+    """Register the fakes in the model registry so the Vertex clients are never built."""
+    from app.vertexai_models import models
+    from benchmarks.fakes import FakeChatModel, FakeLegacyEmbeddings, FakeTextEmbeddingModel
+
+    answer_llm = FakeChatModel(
+        first_token_latency=args.first_token_ms / 1000,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+    )
+    models.set("default_llm", answer_llm)
+    models.set("thinking_llm", answer_llm)
+    # The parser gets its own fake so it can answer with JSON
+    models.set(
+        "query_parser_llm",
+        FakeChatModel(parser=True, first_token_latency=args.parser_latency_ms / 1000, tokens_per_second=1e6),
+    )
+    models.set("embeddings", FakeTextEmbeddingModel(latency=args.embed_latency_ms / 1000))
+    models.set("legacy_embeddings", FakeLegacyEmbeddings())
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    def delta(path: List[str]) -> str:
+        if baseline is None:
+            return ""
+        old, new = baseline, result
+        for key in path:
+            old, new = (old or {}).get(key), (new or {}).get(key)
+        if not old or new is None:
+            return ""
+        return f"  ({(new - old) / old * 100:+.1f}% vs {baseline['meta'].get('commit')})"
+
+    meta = result["meta"]
+    print(f"commit {meta['commit']}  reviews {meta['reviews']}  concurrency {meta['args']['concurrency']}")
+    print(f"requests {result['requests']}  errors {result['errors']}  duration {result['duration_s']}s")
+    print(f"throughput {result['throughput_rps']} req/s{delta(['throughput_rps'])}")
+    for metric in ("ttft_ms", "latency_ms"):
+        for stat in ("p50", "p95", "p99"):
+            print(f"{metric[:-3]:>8} {stat}: {result[metric][stat]} ms{delta([metric, stat])}")
+    print("stage means (ms): " + ", ".join(f"{k} {v}" for k, v in sorted(result["stage_mean_ms"].items())))
+    print(f"peak RSS {result['peak_rss_mb']} MB{delta(['peak_rss_mb'])}")
+    if result["python_heap_peak_mb"] is not None:
+        print(f"python heap peak {result['python_heap_peak_mb']} MB")
+
+
+def main():
+    args = parse_args()
+    for key, value in {**BENCHMARK_ENV, **({} if args.with_caches else NO_CACHE_ENV)}.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+    install_fakes(args)
+    result = asyncio.run(benchmark(args))
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(result, baseline)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
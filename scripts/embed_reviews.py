@@ -1,12 +1,26 @@
+import asyncio
+import hashlib
+import itertools
 import json
+import os
+import uuid
 from pathlib import Path
-from qdrant_client import models
+from qdrant_client import AsyncQdrantClient, models
 from tqdm import tqdm
+from app.collection_schema import (
+    apply_profile,
+    collection_config,
+    ensure_payload_indexes,
+    get_profile,
+    truncate_dense,
+)
 from app.config import Config
-from qdrant_client.models import VectorParams, Distance, SparseVectorParams, SparseIndexParams
-from app.vertexai_models import get_hybrid_embeddings
-from app.vectorstore import get_qdrant
+from app.sparse_encoder import SPARSE_ENCODER_VERSION
+from app.tenants import review_location_id, tenants
+from app.utils import AsyncRateLimiter
+from app.vertexai_models import aget_hybrid_embeddings_batch
 from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import argparse
 
@@ -20,6 +34,40 @@ def parse_args():
         default=".",
         help="Path to the directory containing review files (default: current directory)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=Config.EMBEDDING_BATCH_SIZE,
+        help="Reviews per embedding request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=Config.EMBEDDING_CONCURRENCY,
+        help="Embedding requests in flight at once (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=str,
+        default=None,
+        help="Checkpoint file used to resume an interrupted run (default: <dir>/.embed_checkpoint.json)",
+    )
+    parser.add_argument(
+        "--recreate",
+        action="store_true",
+        help="Drop the collection and re-embed every review instead of syncing incrementally",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete every stored review missing from these files, not only those at the "
+        "locations the files cover",
+    )
+    parser.add_argument(
+        "--apply-profile",
+        action="store_true",
+        help="Move existing collections to COLLECTION_PROFILE (HNSW, quantization, on-disk storage)",
+    )
     return parser.parse_args()
 
 
@@ -29,6 +77,320 @@ def iso8601_to_timestamp(dt_str):
     return datetime.fromisoformat(dt_str).timestamp()
 
 
+# Map starRating (string) to int
+STAR_MAP = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5}
+
+
+# Point IDs are derived from the review resource name so they are stable across runs
+REVIEW_ID_NAMESPACE = uuid.UUID("7b0e3f1c-3d5e-4c2a-9a57-1f0d2b6c8e41")
+
+
+def load_reviews(review_file: Path) -> List[Dict]:
+    """Embeddable reviews from one export file."""
+    with open(review_file, "r") as f:
+        reviews = json.load(f)["reviews"]
+    return [review for review in reviews if "comment" in review and "name" in review]
+
+
+def review_point_id(review: Dict) -> str:
+    return str(uuid.uuid5(REVIEW_ID_NAMESPACE, review["name"]))
+
+
+def review_payload(review: Dict) -> Dict:
+    create_time_str = review.get("createTime")
+    return {
+        "text": review["comment"],
+        "rating": STAR_MAP.get(review.get("starRating", ""), None),
+        "createTime": iso8601_to_timestamp(create_time_str) if create_time_str else None,
+        "author": review.get("reviewer", {}).get("displayName", "Unknown"),
+        "review_id": review["name"].split("/")[-1],
+        "location_id": review_location_id(review["name"]),
+    }
+
+
+def content_hash(payload: Dict) -> str:
+    """Hash of everything that ends up in a point; a change means the point must be rewritten."""
+    material = {
+        **payload,
+        "embedding_model": Config.EMBEDDING_MODEL,
+        "dense_vector_size": Config.DENSE_VECTOR_SIZE,
+        "sparse_encoder": SPARSE_ENCODER_VERSION,
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Checkpoint:
+    """Records finished files so an interrupted run can resume where it stopped.
+
+    The point IDs of each finished file are kept as well, because removed
+    reviews can only be detected once every file has been seen.
+    """
+
+    def __init__(self, path: Path, collection_name: str):
+        self.path = path
+        self.collection_name = collection_name
+        self.completed_files: Dict[str, List[str]] = {}
+        if path.exists():
+            with open(path, "r") as f:
+                state = json.load(f)
+            if state.get("collection") == collection_name:
+                self.completed_files = state.get("completed_files", {})
+
+    def mark_completed(self, file_name: str, point_ids: List[str]) -> None:
+        self.completed_files[file_name] = point_ids
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"collection": self.collection_name, "completed_files": self.completed_files}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.completed_files = {}
+        if self.path.exists():
+            self.path.unlink()
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+def target_collections() -> List[str]:
+    """Collections ingestion writes to; reviews from unknown locations go to the shared one."""
+    return sorted({Config.COLLECTION_NAME, *tenants.collections()})
+
+
+def group_by_collection(reviews: Iterable[Dict]) -> Dict[str, List[Dict]]:
+    """Reviews per target collection, routed by the tenant owning each review's location."""
+    groups: Dict[str, List[Dict]] = {}
+    for review in reviews:
+        collection = tenants.collection_for_location(review_location_id(review["name"]))
+        groups.setdefault(collection, []).append(review)
+    return groups
+
+
+class ReviewIngester:
+    """Syncs reviews into one Qdrant collection, embedding only new or changed reviews.
+
+    Batches are embedded concurrently and upserted as they complete. At most
+    `concurrency` batches are held in memory at any time, so memory use is
+    independent of the corpus size.
+    """
+
+    def __init__(
+        self, qdrant: AsyncQdrantClient, concurrency: int, collection_name: str = Config.COLLECTION_NAME
+    ):
+        self.qdrant = qdrant
+        self.concurrency = concurrency
+        self.collection_name = collection_name
+        self.rate_limiter = AsyncRateLimiter(Config.EMBEDDING_REQUESTS_PER_MINUTE)
+        # point id -> content hash and location of everything currently in the collection
+        self.existing_hashes: Dict[str, str] = {}
+        self.existing_locations: Dict[str, Optional[str]] = {}
+        # Collections created before BM25 vectors were added have no "sparse" vector
+        self.has_sparse = True
+        # Collections created before the Matryoshka first pass have no "dense_small" vector
+        self.has_small = bool(Config.DENSE_SMALL_VECTOR_SIZE)
+        self._collection_ready = False
+        self._collection_lock = asyncio.Lock()
+
+    async def prepare(self, recreate: bool = False, apply_profile: bool = False) -> None:
+        exists = await self.qdrant.collection_exists(collection_name=self.collection_name)
+        if exists and recreate:
+            await self.qdrant.delete_collection(collection_name=self.collection_name)
+            exists = False
+        if exists:
+            self._collection_ready = True
+            info = await self.qdrant.get_collection(collection_name=self.collection_name)
+            self.has_sparse = "sparse" in (info.config.params.sparse_vectors or {})
+            if not self.has_sparse:
+                print(
+                    f"⚠️  Collection '{self.collection_name}' has no sparse vectors; "
+                    "run with --recreate to enable hybrid search."
+                )
+            vectors = info.config.params.vectors
+            self.has_small = self.has_small and isinstance(vectors, dict) and "dense_small" in vectors
+            if Config.DENSE_SMALL_VECTOR_SIZE and not self.has_small:
+                print(
+                    f"⚠️  Collection '{self.collection_name}' has no dense_small vector; "
+                    "run scripts.migrate_dense_small to enable the two-stage search."
+                )
+            # Older collections may predate some of the payload indexes
+            created = await ensure_payload_indexes(self.qdrant, self.collection_name, info.payload_schema)
+            if created:
+                print(f"🗂️  Indexed {', '.join(created)} in '{self.collection_name}'")
+            if apply_profile:
+                await self._apply_profile()
+            await self._load_existing()
+
+    async def _apply_profile(self) -> None:
+        await apply_profile(self.qdrant, self.collection_name)
+        print(f"⚙️  Applied profile '{Config.COLLECTION_PROFILE}' to '{self.collection_name}'")
+
+    async def _load_existing(self) -> None:
+        offset = None
+        while True:
+            points, offset = await self.qdrant.scroll(
+                collection_name=self.collection_name,
+                limit=1000,
+                offset=offset,
+                with_payload=["content_hash", "location_id"],
+                with_vectors=False,
+            )
+            for point in points:
+                payload = point.payload or {}
+                self.existing_hashes[str(point.id)] = payload.get("content_hash")
+                self.existing_locations[str(point.id)] = payload.get("location_id")
+            if offset is None:
+                return
+
+    async def _ensure_collection(self) -> None:
+        async with self._collection_lock:
+            if self._collection_ready:
+                return
+
+            await self.qdrant.create_collection(
+                collection_name=self.collection_name, **collection_config()
+            )
+            await ensure_payload_indexes(self.qdrant, self.collection_name)
+            self._collection_ready = True
+
+    async def _embed_and_upsert(self, batch: List[Tuple[str, Dict]]) -> int:
+        await self.rate_limiter.acquire()
+        embeddings = await aget_hybrid_embeddings_batch([payload["text"] for _, payload in batch])
+
+        points = []
+        for (point_id, payload), embedding in zip(batch, embeddings):
+            vectors = {"dense": embedding["dense"]}
+            if self.has_small:
+                vectors["dense_small"] = truncate_dense(embedding["dense"])
+            if self.has_sparse and embedding["sparse"] is not None:
+                vectors["sparse"] = models.SparseVector(**embedding["sparse"])
+            points.append(models.PointStruct(id=point_id, vector=vectors, payload=payload))
+
+        await self._ensure_collection()
+        for chunk in batched(points, Config.UPSERT_BATCH_SIZE):
+            await self.qdrant.upsert(collection_name=self.collection_name, points=chunk)
+        return len(points)
+
+    def _changed(self, reviews: Iterable[Dict], seen: List[str]) -> Iterator[Tuple[str, Dict]]:
+        """Yield (point id, payload) for reviews whose content hash differs from the stored one."""
+        for review in reviews:
+            point_id = review_point_id(review)
+            seen.append(point_id)
+            payload = review_payload(review)
+            payload["content_hash"] = content_hash(payload)
+            if self.existing_hashes.get(point_id) != payload["content_hash"]:
+                yield point_id, payload
+
+    async def sync(self, reviews: Iterable[Dict], batch_size: int) -> Tuple[int, List[str]]:
+        """Upsert new and changed reviews; returns the upsert count and every point id seen."""
+        upserted = 0
+        seen: List[str] = []
+        pending = set()
+        progress = tqdm(desc="reviews", unit="review")
+
+        def collect(done) -> None:
+            nonlocal upserted
+            for task in done:
+                count = task.result()
+                upserted += count
+                progress.update(count)
+
+        try:
+            for batch in batched(self._changed(reviews, seen), batch_size):
+                if len(pending) >= self.concurrency:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                pending.add(asyncio.create_task(self._embed_and_upsert(batch)))
+            if pending:
+                done, _ = await asyncio.wait(pending)
+                collect(done)
+        except BaseException:
+            for task in pending:
+                task.cancel()
+            raise
+        finally:
+            progress.close()
+        return upserted, seen
+
+    async def delete_removed(self, seen_ids: Set[str], locations: Optional[Set[Optional[str]]] = None) -> int:
+        """Delete points whose reviews are no longer in any export file.
+
+        With `locations`, only points at those locations are candidates, so a run
+        over one tenant's exports leaves every other tenant's reviews alone.
+        """
+        removed = [
+            point_id
+            for point_id in self.existing_hashes
+            if point_id not in seen_ids
+            and (locations is None or self.existing_locations.get(point_id) in locations)
+        ]
+        for chunk in batched(removed, Config.UPSERT_BATCH_SIZE):
+            await self.qdrant.delete(
+                collection_name=self.collection_name,
+                points_selector=models.PointIdsList(points=chunk),
+            )
+        return len(removed)
+
+
+async def ingest(
+    review_files: List[Path],
+    batch_size: int,
+    concurrency: int,
+    checkpoint: Checkpoint,
+    recreate: bool = False,
+    apply_profile: bool = False,
+    prune: bool = False,
+) -> Dict[str, int]:
+    qdrant = AsyncQdrantClient(
+        host=Config.QDRANT_HOST, grpc_port=Config.QDRANT_GRPC_PORT, prefer_grpc=True
+    )
+    try:
+        if recreate:
+            checkpoint.clear()
+        ingesters = {
+            collection: ReviewIngester(qdrant, concurrency=concurrency, collection_name=collection)
+            for collection in target_collections()
+        }
+        for ingester in ingesters.values():
+            await ingester.prepare(recreate=recreate, apply_profile=apply_profile)
+
+        seen_ids: Set[str] = set()
+        # Locations covered by these files; removals elsewhere aren't this run's to make
+        seen_locations: Set[Optional[str]] = set()
+        upserted = 0
+        for review_file in review_files:
+            reviews = load_reviews(review_file)
+            seen_locations.update(review_location_id(review["name"]) for review in reviews)
+            if review_file.name in checkpoint.completed_files:
+                print(f"⏭️  Skipping {review_file.name} (completed in a previous run)")
+                seen_ids.update(checkpoint.completed_files[review_file.name])
+                continue
+            print(f"🧠 Syncing {len(reviews)} reviews from {review_file.name}...")
+            file_seen: List[str] = []
+            for collection, group in group_by_collection(reviews).items():
+                group_upserted, group_seen = await ingesters[collection].sync(group, batch_size=batch_size)
+                upserted += group_upserted
+                file_seen.extend(group_seen)
+            checkpoint.mark_completed(review_file.name, file_seen)
+            seen_ids.update(file_seen)
+        total = len(seen_ids)
+
+        deleted = 0
+        for ingester in ingesters.values():
+            deleted += await ingester.delete_removed(seen_ids, None if prune else seen_locations)
+        checkpoint.clear()
+        return {
+            "total": total,
+            "upserted": upserted,
+            "unchanged": total - upserted,
+            "deleted": deleted,
+        }
+    finally:
+        await qdrant.close()
+
+
 def main():
     args = parse_args()
     reviews_dir = Path(args.dir)
@@ -43,79 +405,26 @@ def main():
         print(f"No files starting with 'reviews' found in {reviews_dir}")
         return
 
-    all_points = []
-    idx = 0
-    for review_file in review_files:
-        with open(review_file, "r") as f:
-            reviews = json.load(f)["reviews"]
-        print(f"🧠 Embedding {len(reviews)} reviews from {review_file.name}...")
-        for review in tqdm(reviews, desc=review_file.name):
-            if "comment" not in review or "name" not in review:
-                continue
-            text = review["comment"]
-            
-            # Get hybrid embeddings (dense and sparse)
-            embeddings = get_hybrid_embeddings(text)
-            dense_vector = embeddings['dense']
-            sparse_vector = embeddings['sparse']
-            
-            # Map starRating (string) to int
-            star_map = {"ONE": 1, "TWO": 2, "THREE": 3, "FOUR": 4, "FIVE": 5}
-            rating = star_map.get(review.get("starRating", ""), None)
-            create_time_str = review.get("createTime")
-            create_time_ts = (
-                iso8601_to_timestamp(create_time_str) if create_time_str else None
-            )
-            author = review.get("reviewer", {}).get("displayName", "Unknown")
-            review_id = review["name"].split("/")[-1]
-            
-            # Create vectors dict for both dense and sparse
-            vectors = {"dense": dense_vector}
-            if sparse_vector is not None:
-                vectors["sparse"] = sparse_vector
-            
-            all_points.append(
-                models.PointStruct(
-                    id=idx,
-                    vector=vectors,
-                    payload={
-                        "text": text,
-                        "rating": rating,
-                        "createTime": create_time_ts,
-                        "author": author,
-                        "review_id": review_id,
-                    },
-                )
-            )
-            idx += 1
-
-    total_reviews = len(all_points)
-    qdrant = get_qdrant()
-    if qdrant.collection_exists(collection_name=Config.COLLECTION_NAME):
-        qdrant.delete_collection(collection_name=Config.COLLECTION_NAME)
-    
-    # Create vectors config for both dense and sparse vectors
-    vectors_config = {
-        "dense": VectorParams(size=Config.DENSE_VECTOR_SIZE, distance=Distance.COSINE),
-    }
-    
-    # Add sparse vector config if we have sparse vectors
-    if any(point.vector.get("sparse") is not None for point in all_points if isinstance(point.vector, dict)):
-        vectors_config["sparse"] = SparseVectorParams(
-            index=SparseIndexParams(
-                on_disk=False,  # Keep in memory for better performance
-            )
+    get_profile()  # fail on an unknown COLLECTION_PROFILE before embedding anything
+    checkpoint_path = Path(args.checkpoint) if args.checkpoint else reviews_dir / ".embed_checkpoint.json"
+    collections = ", ".join(target_collections())
+    checkpoint = Checkpoint(checkpoint_path, collections)
+    result = asyncio.run(
+        ingest(
+            review_files,
+            args.batch_size,
+            args.concurrency,
+            checkpoint,
+            recreate=args.recreate,
+            apply_profile=args.apply_profile,
+            prune=args.prune,
         )
-    
-    qdrant.create_collection(
-        collection_name=Config.COLLECTION_NAME,
-        vectors_config=vectors_config,
-        optimizers_config=models.OptimizersConfigDiff(default_segment_number=16),
     )
-    qdrant.upsert(collection_name=Config.COLLECTION_NAME, points=all_points)
 
     print(
-        f"✅ Inserted {total_reviews} reviews from {len(review_files)} files into collection '{Config.COLLECTION_NAME}'."
+        f"✅ Synced {result['total']} reviews from {len(review_files)} files into "
+        f"{collections}: {result['upserted']} upserted, {result['unchanged']} unchanged, "
+        f"{result['deleted']} deleted."
     )
 
 
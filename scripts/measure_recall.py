@@ -0,0 +1,151 @@
+import argparse
+import random
+import time
+from typing import Dict, List, Optional, Sequence
+
+from qdrant_client import QdrantClient, models
+
+from app.config import Config
+
+# Bytes per dimension held in RAM for the dense vector under each storage mode
+BYTES_PER_DIMENSION = {"full precision": 4.0, "scalar": 1.0, "binary": 1 / 8}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Measure recall@k of quantized dense search against exact full-precision search."
+    )
+    parser.add_argument("--collection", default=Config.COLLECTION_NAME, help="Collection to measure")
+    parser.add_argument("--samples", type=int, default=100, help="Stored reviews used as queries")
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 50], help="Cut-offs to report")
+    parser.add_argument(
+        "--oversampling",
+        type=float,
+        nargs="+",
+        default=[1.0, 2.0, 3.0],
+        help="Oversampling factors to try with rescoring",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def recall_at_k(expected: Sequence, found: Sequence, k: int) -> float:
+    """Share of the true top k that a search returned in its top k."""
+    truth = set(expected[:k])
+    if not truth:
+        return 1.0
+    return len(truth.intersection(found[:k])) / len(truth)
+
+
+def sample_query_vectors(qdrant: QdrantClient, collection: str, samples: int, seed: int) -> List[List[float]]:
+    """Dense vectors of randomly chosen stored reviews; no embedding calls needed."""
+    ids = []
+    offset = None
+    while True:
+        points, offset = qdrant.scroll(
+            collection_name=collection, limit=1000, offset=offset, with_payload=False, with_vectors=False
+        )
+        ids.extend(point.id for point in points)
+        if offset is None:
+            break
+    chosen = random.Random(seed).sample(ids, min(samples, len(ids)))
+    points = qdrant.retrieve(collection_name=collection, ids=chosen, with_vectors=["dense"])
+    return [point.vector["dense"] for point in points]
+
+
+def search_ids(
+    qdrant: QdrantClient, collection: str, vector: List[float], limit: int, params: models.SearchParams
+) -> List:
+    response = qdrant.query_points(
+        collection_name=collection,
+        query=vector,
+        using="dense",
+        limit=limit,
+        search_params=params,
+        with_payload=False,
+    )
+    return [point.id for point in response.points]
+
+
+def measure(
+    qdrant: QdrantClient,
+    collection: str,
+    vectors: List[List[float]],
+    ks: List[int],
+    modes: Dict[str, models.SearchParams],
+) -> Dict[str, Dict[str, float]]:
+    limit = max(ks)
+    exact = models.SearchParams(exact=True)
+    truths = [search_ids(qdrant, collection, vector, limit, exact) for vector in vectors]
+    results = {}
+    for name, params in modes.items():
+        recalls = {k: 0.0 for k in ks}
+        start = time.perf_counter()
+        for vector, truth in zip(vectors, truths):
+            found = search_ids(qdrant, collection, vector, limit, params)
+            for k in ks:
+                recalls[k] += recall_at_k(truth, found, k)
+        elapsed = time.perf_counter() - start
+        results[name] = {
+            **{f"recall@{k}": recalls[k] / len(vectors) for k in ks},
+            "mean_ms": 1000 * elapsed / len(vectors),
+        }
+    return results
+
+
+def search_modes(oversampling: List[float]) -> Dict[str, models.SearchParams]:
+    modes = {
+        "full precision (HNSW)": models.SearchParams(
+            quantization=models.QuantizationSearchParams(ignore=True)
+        ),
+        "quantized, no rescore": models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=False)
+        ),
+    }
+    for factor in oversampling:
+        modes[f"quantized, rescore x{factor:g}"] = models.SearchParams(
+            quantization=models.QuantizationSearchParams(rescore=True, oversampling=factor)
+        )
+    return modes
+
+
+def quantization_mode(info) -> Optional[str]:
+    config = info.config.quantization_config
+    dense = info.config.params.vectors.get("dense") if isinstance(info.config.params.vectors, dict) else None
+    config = (dense.quantization_config if dense is not None else None) or config
+    if isinstance(config, models.ScalarQuantization):
+        return "scalar"
+    if isinstance(config, models.BinaryQuantization):
+        return "binary"
+    return None
+
+
+def main():
+    args = parse_args()
+    qdrant = QdrantClient(host=Config.QDRANT_HOST, grpc_port=Config.QDRANT_GRPC_PORT, prefer_grpc=True)
+    info = qdrant.get_collection(collection_name=args.collection)
+    mode = quantization_mode(info)
+    if mode is None:
+        print(f"⚠️  '{args.collection}' is not quantized; run ingestion with COLLECTION_PROFILE=scalar or binary "
+              "and --apply-profile first. Quantized modes below will match full precision.")
+
+    points = info.points_count or 0
+    for name, size in BYTES_PER_DIMENSION.items():
+        megabytes = points * Config.DENSE_VECTOR_SIZE * size / 2**20
+        marker = " (this collection)" if name == (mode or "full precision") else ""
+        print(f"dense vectors in RAM, {name}: {megabytes:,.1f} MB{marker}")
+
+    vectors = sample_query_vectors(qdrant, args.collection, args.samples, args.seed)
+    print(f"\nMeasuring {len(vectors)} queries against exact search in '{args.collection}'...")
+    results = measure(qdrant, args.collection, vectors, args.k, search_modes(args.oversampling))
+
+    columns = [f"recall@{k}" for k in args.k] + ["mean_ms"]
+    width = max(len(name) for name in results)
+    print(f"{'mode':<{width}}  " + "  ".join(f"{c:>10}" for c in columns))
+    for name, row in results.items():
+        print(f"{name:<{width}}  " + "  ".join(f"{row[c]:>10.3f}" for c in columns))
+    qdrant.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import asyncio
+from typing import Optional
+
+from qdrant_client import AsyncQdrantClient, models
+from tqdm import tqdm
+
+from app.collection_schema import collection_config, ensure_payload_indexes, truncate_dense
+from app.config import Config
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Copy a collection into one with a Matryoshka dense_small vector, without re-embedding."
+    )
+    parser.add_argument("--source", default=Config.COLLECTION_NAME, help="Collection to migrate")
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=Config.DENSE_SMALL_VECTOR_SIZE or 256,
+        help="Dimensions of the dense_small vector (default: %(default)s)",
+    )
+    parser.add_argument("--target", default=None, help="New collection (default: <source>_small<size>)")
+    parser.add_argument("--batch-size", type=int, default=Config.UPSERT_BATCH_SIZE)
+    return parser.parse_args()
+
+
+def _migrated_point(point, size: int) -> Optional[models.PointStruct]:
+    vector = point.vector
+    if isinstance(vector, list):  # Collections with a single unnamed vector
+        vector = {"dense": vector}
+    if not vector or "dense" not in vector:
+        return None
+    vectors = {"dense": vector["dense"], "dense_small": truncate_dense(vector["dense"], size)}
+    if "sparse" in vector:
+        vectors["sparse"] = vector["sparse"]
+    return models.PointStruct(id=point.id, vector=vectors, payload=point.payload)
+
+
+async def migrate(
+    qdrant: AsyncQdrantClient, source: str, target: str, size: int, batch_size: int
+) -> int:
+    """Copy every point of `source` into `target`, adding dense_small from the stored dense vector.
+
+    Upserts keep point ids, so an interrupted migration can simply be run again.
+    """
+    if not await qdrant.collection_exists(collection_name=target):
+        info = await qdrant.get_collection(collection_name=source)
+        vectors = info.config.params.vectors
+        dense = vectors["dense"] if isinstance(vectors, dict) else vectors
+        await qdrant.create_collection(
+            collection_name=target, **collection_config(small_size=size, dense_size=dense.size)
+        )
+        await ensure_payload_indexes(qdrant, target)
+
+    copied = 0
+    offset = None
+    progress = tqdm(desc="points", unit="point")
+    try:
+        while True:
+            points, offset = await qdrant.scroll(
+                collection_name=source,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            batch = [p for p in (_migrated_point(point, size) for point in points) if p is not None]
+            if batch:
+                await qdrant.upsert(collection_name=target, points=batch)
+                copied += len(batch)
+                progress.update(len(batch))
+            if offset is None:
+                return copied
+    finally:
+        progress.close()
+
+
+async def run(args) -> None:
+    target = args.target or f"{args.source}_small{args.size}"
+    qdrant = AsyncQdrantClient(
+        host=Config.QDRANT_HOST, grpc_port=Config.QDRANT_GRPC_PORT, prefer_grpc=True
+    )
+    try:
+        copied = await migrate(qdrant, args.source, target, args.size, args.batch_size)
+    finally:
+        await qdrant.close()
+    print(f"✅ Copied {copied} points from '{args.source}' into '{target}' with {args.size}-d dense_small vectors.")
+    print(
+        f"Next: set QDRANT_COLLECTION={target} (or the tenant's collection) and "
+        f"DENSE_SMALL_VECTOR_SIZE={args.size}, restart the API, then delete '{args.source}'."
+    )
+
+
+def main():
+    asyncio.run(run(parse_args()))
+
+
+if __name__ == "__main__":
+    main()
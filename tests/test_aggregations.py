@@ -0,0 +1,55 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+from app.aggregations import classify_intent, render_aggregate_answer
+from app.review_stats import ReviewStatsSnapshot
+
+
+def test_classify_intent():
+    """Counts and trends over the parsed filter skip retrieval; questions about content don't."""
+    assert classify_intent("How many 1-star reviews this year?", {}) == "aggregate"
+    assert classify_intent("Has our average rating increased over time?", {}) == "aggregate"
+    assert classify_intent("How many reviews mention the bread?", {}) == "search"
+    assert classify_intent("What do people complain about?", {}) == "search"
+    # The parser's intent wins over the heuristics
+    assert classify_intent("How many 1-star reviews?", {"intent": "search"}) == "search"
+
+
+def test_render_aggregate_answer():
+    summary = ReviewStatsSnapshot.from_payloads(
+        [{"rating": 1, "createTime": 1747000000.0}, {"rating": 2, "createTime": 1746000000.0}]
+    ).summarize()
+    filter_dict = {"rating": {"$in": [1, 2]}, "createTime": {"$gte": "2025-01-01T00:00:00Z"}}
+
+    answer = render_aggregate_answer("how many bad reviews", filter_dict, summary)
+
+    assert "**2** reviews rated 1★ or 2★ and posted since 2025-01-01" in answer
+    assert "average rating of **1.5★**" in answer
+    assert "Monthly trend" not in answer
+    assert "Monthly trend" in render_aggregate_answer("rating trend", None, summary)
+
+
+@patch("app.chains.aparse_query_with_llm", new_callable=AsyncMock)
+def test_aggregate_query_skips_retrieval_and_llm(mock_parse):
+    """An aggregate query is answered with one templated answer event."""
+    from app.chains import get_streaming_rag_response
+
+    mock_parse.return_value = {
+        "intent": "aggregate",
+        "query_embedding_text": "1-star reviews",
+        "filter": {"rating": {"$in": [1]}},
+    }
+    snapshot = ReviewStatsSnapshot.from_payloads([{"rating": 1, "createTime": None}] * 3)
+
+    async def run():
+        return [event async for event in get_streaming_rag_response("how many 1-star reviews")]
+
+    with patch("app.review_stats.review_stats.snapshot", snapshot), \
+            patch("app.chains._prepare_query") as prepare, \
+            patch("app.chains._start_speculative_embedding", return_value=None):
+        events = asyncio.run(run())
+
+    prepare.assert_not_called()
+    assert len(events) == 1
+    assert events[0]["done"] is True
+    assert "**3** reviews rated 1★" in events[0]["answer"]
@@ -0,0 +1,100 @@
+from app.answer_cache import SemanticAnswerCache, filter_key, split_for_replay
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+NEGATIVE = {"rating": {"$in": [2, 1]}}
+
+
+def test_paraphrase_hits_only_with_same_filter():
+    """A nearby query vector hits; the same vector with a different filter does not."""
+    cache = SemanticAnswerCache(maxsize=10, threshold=0.95)
+    cache.set([1.0, 0.0, 0.1], NEGATIVE, "slow service", ["review"])
+
+    hit = cache.get([0.98, 0.02, 0.1], {"rating": {"$in": [1, 2]}})
+    assert hit is not None and hit.answer == "slow service"
+    assert hit.context == ["review"]
+    assert cache.get([0.98, 0.02, 0.1], None) is None
+    assert cache.get([0.0, 1.0, 0.0], NEGATIVE) is None
+    assert filter_key(NEGATIVE) == filter_key({"rating": {"$in": [1, 2]}})
+
+
+def test_ttl_size_and_signature_invalidation():
+    timer = FakeTimer()
+    cache = SemanticAnswerCache(maxsize=2, ttl=10, timer=timer)
+    cache.set([1.0, 0.0], None, "a", [], signature=1)
+    cache.set([0.0, 1.0], None, "b", [], signature=1)
+    cache.set([1.0, 1.0], None, "c", [], signature=1)
+    assert len(cache) == 2
+    assert cache.get([1.0, 0.0], None, signature=1) is None  # evicted
+
+    timer.now = 11
+    assert cache.get([0.0, 1.0], None, signature=1) is None  # expired
+
+    cache.set([0.0, 1.0], None, "b", [], signature=1)
+    assert cache.get([0.0, 1.0], None, signature=2) is None  # collection changed
+    assert len(cache) == 0
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_split_for_replay_round_trips():
+    answer = "Customers love the  bread.\nService is slow."
+    assert "".join(split_for_replay(answer)) == answer
+    assert len(split_for_replay(answer)) > 1
+
+
+def _run_pipeline(chat_history, speculative=None):
+    import asyncio
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock, patch
+
+    from app.chains import get_streaming_rag_response
+
+    parsed = {"query_embedding_text": "Slow Service?", "filter": None}
+    retriever = SimpleNamespace(
+        ainvoke=AsyncMock(return_value=[SimpleNamespace(page_content="slow", metadata={"score": 1.0})]),
+        duplicates_dropped=0,
+    )
+    cache = MagicMock()
+    cache.get.return_value = None
+
+    async def answer(*args, **kwargs):
+        yield "It is slow."
+
+    async def run():
+        return [event async for event in get_streaming_rag_response("is service slow", chat_history=chat_history)]
+
+    with patch("app.chains.aparse_query_with_llm", AsyncMock(return_value=parsed)), \
+            patch("app.chains._start_speculative_embedding", return_value=None), \
+            patch("app.chains._resolve_speculative_embedding", AsyncMock(return_value=speculative)), \
+            patch("app.chains.aget_query_embeddings", AsyncMock(return_value={"dense": [1.0]})) as embed, \
+            patch("app.chains._prepare_query", return_value=(None, "Slow Service?", retriever)), \
+            patch("app.chains._stream_answer", answer), \
+            patch("app.chains.answer_cache_for", return_value=cache), \
+            patch("app.chains.Config.ANSWER_CACHE_ENABLED", True):
+        asyncio.run(run())
+    return cache, embed
+
+
+def test_answer_cache_is_keyed_on_the_retrieval_vector_and_skipped_with_history():
+    """The cache key is the vector retrieval uses, so a lookup never embeds another text."""
+    cache, embed = _run_pipeline(chat_history=None)
+    embed.assert_awaited_once_with("Slow Service?")
+    assert cache.get.call_args.args[0] == [1.0]
+    cache.set.assert_called_once()
+
+    # A reused speculative vector keys the cache without any further embedding
+    cache, embed = _run_pipeline(chat_history=None, speculative={"dense": [0.5]})
+    embed.assert_not_awaited()
+    assert cache.get.call_args.args[0] == [0.5]
+    assert cache.set.call_args.args[0] == [0.5]
+
+    cache, _ = _run_pipeline(chat_history=[{"human": "hi", "ai": "hello"}])
+    cache.get.assert_not_called()
+    cache.set.assert_not_called()
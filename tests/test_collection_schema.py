@@ -0,0 +1,44 @@
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from qdrant_client import models
+
+from app.collection_schema import (
+    PAYLOAD_INDEXES,
+    PROFILES,
+    collection_config,
+    ensure_payload_indexes,
+    get_profile,
+)
+
+
+def test_profiles_configure_quantization_and_storage():
+    binary = collection_config(PROFILES["binary"])
+    assert isinstance(binary["quantization_config"], models.BinaryQuantization)
+    assert binary["vectors_config"]["dense"].on_disk is True
+
+    scalar = collection_config(PROFILES["scalar"])
+    assert scalar["quantization_config"].scalar.type == models.ScalarType.INT8
+
+    memory = collection_config(PROFILES["memory"])
+    assert memory["quantization_config"] is None
+    assert memory["vectors_config"]["dense"].on_disk is False
+
+    with pytest.raises(ValueError):
+        get_profile("fastest")
+
+
+def test_only_missing_or_mistyped_indexes_are_created():
+    qdrant = AsyncMock()
+    existing = {
+        "rating": models.PayloadIndexInfo(data_type=models.PayloadSchemaType.INTEGER, points=10),
+        # An older keyword index on a numeric field can't serve range filters
+        "createTime": models.PayloadIndexInfo(data_type=models.PayloadSchemaType.KEYWORD, points=10),
+    }
+
+    created = asyncio.run(ensure_payload_indexes(qdrant, "reviews", existing))
+
+    assert created == ["createTime", "location_id"]
+    schemas = {c.kwargs["field_name"]: c.kwargs["field_schema"] for c in qdrant.create_payload_index.call_args_list}
+    assert schemas == {name: PAYLOAD_INDEXES[name] for name in created}
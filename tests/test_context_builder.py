@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+from app.context_builder import build_context, estimate_tokens, mmr_order
+
+
+def _doc(text, score, rating=5, created=1716508800.0):
+    return SimpleNamespace(page_content=text, metadata={"score": score, "rating": rating, "createTime": created})
+
+
+def test_build_context_sends_everything_that_fits():
+    """Small result sets are passed through in full."""
+    docs = [_doc("Great duck sandwich.", 0.9), _doc("Slow service at lunch.", 0.8)]
+    build = build_context(docs, token_budget=1000)
+
+    assert not build.compact
+    assert build.reviews == ["Great duck sandwich.", "Slow service at lunch."]
+    assert build.text == "Great duck sandwich.\n\nSlow service at lunch."
+    assert build.tokens_saved == 0
+
+
+def test_build_context_falls_back_to_compact_lines():
+    """Over budget, reviews become one line each with rating and date."""
+    long_text = "The roast duck was excellent but the wait was long. " * 10
+    docs = [_doc(f"{long_text} visit {i}", 1 - i / 100, rating=i % 5 + 1) for i in range(30)]
+    build = build_context(docs, token_budget=600)
+
+    assert build.compact
+    assert build.total == 30
+    assert build.included > 1
+    assert build.tokens <= 600
+    assert build.tokens_saved > 0
+    lines = build.text.splitlines()
+    assert lines[0].startswith(f"Showing {build.included} of 30 reviews")
+    assert lines[1].startswith("- 1★ 2024-05-24: The roast duck")
+    assert estimate_tokens(build.text) <= build.tokens + build.included
+
+
+def test_mmr_prefers_diverse_reviews():
+    """A near-duplicate of the top review is pushed behind a different topic."""
+    docs = [
+        _doc("the duck sandwich is amazing and fresh", 1.0),
+        _doc("the duck sandwich is amazing and very fresh", 0.95),
+        _doc("parking is hard to find downtown", 0.9),
+    ]
+    ordered = mmr_order(docs, lambda_mult=0.5, candidates=10)
+
+    assert [d.metadata["score"] for d in ordered] == [1.0, 0.9, 0.95]
+
+
+def test_build_context_reports_reordering_and_savings():
+    """Reordered reviews and saved tokens are counted per build and in the running totals."""
+    from app.context_builder import get_context_stats
+
+    docs = [
+        _doc("the duck sandwich is amazing and fresh", 1.0),
+        _doc("the duck sandwich is amazing and very fresh", 0.95),
+        _doc("parking is hard to find downtown", 0.9),
+    ]
+    before = get_context_stats()
+    build = build_context(docs, token_budget=1000, lambda_mult=0.5)
+    after = get_context_stats()
+
+    assert build.reordered == 2
+    assert after["requests"] == before["requests"] + 1
+    assert after["reviews_in"] == before["reviews_in"] + 3
+    assert after["reviews_sent"] == before["reviews_sent"] + 3
+    assert after["mmr_reordered"] == before["mmr_reordered"] + 2
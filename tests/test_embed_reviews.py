@@ -0,0 +1,53 @@
+from pathlib import Path
+
+REVIEW = {
+    "reviewer": {"displayName": "Darcy Myers"},
+    "starRating": "FIVE",
+    "comment": "Roast duck sandwich, and the Ruben are my favorite.",
+    "createTime": "2016-05-24T05:40:29.418Z",
+    "name": "accounts/1/locations/2/reviews/abc",
+}
+
+
+def test_point_ids_and_hashes_are_stable():
+    """Re-running ingestion maps a review to the same point and the same hash."""
+    from scripts.embed_reviews import content_hash, review_payload, review_point_id
+
+    assert review_point_id(REVIEW) == review_point_id(dict(REVIEW))
+    assert content_hash(review_payload(REVIEW)) == content_hash(review_payload(dict(REVIEW)))
+
+    edited = {**REVIEW, "comment": "Roast duck sandwich is still my favorite."}
+    assert review_point_id(edited) == review_point_id(REVIEW)
+    assert content_hash(review_payload(edited)) != content_hash(review_payload(REVIEW))
+
+
+def test_checkpoint_resumes_only_for_same_collection(tmp_path: Path):
+    """Completed files survive a restart, but not a switch to another collection."""
+    from scripts.embed_reviews import Checkpoint
+
+    path = tmp_path / ".embed_checkpoint.json"
+    Checkpoint(path, "reviews").mark_completed("reviews-1.json", ["id-1", "id-2"])
+
+    assert Checkpoint(path, "reviews").completed_files == {"reviews-1.json": ["id-1", "id-2"]}
+    assert Checkpoint(path, "other").completed_files == {}
+
+    Checkpoint(path, "reviews").clear()
+    assert not path.exists()
+
+
+def test_deletions_stay_within_the_locations_of_the_run():
+    """Syncing one tenant's export doesn't delete another tenant's reviews unless pruning."""
+    import asyncio
+    from unittest.mock import AsyncMock
+
+    from scripts.embed_reviews import ReviewIngester
+
+    ingester = ReviewIngester(AsyncMock(), concurrency=1)
+    ingester.existing_hashes = {"a-kept": "h", "a-removed": "h", "b-other": "h"}
+    ingester.existing_locations = {"a-kept": "1", "a-removed": "1", "b-other": "2"}
+
+    assert asyncio.run(ingester.delete_removed({"a-kept"}, locations={"1"})) == 1
+    deleted = ingester.qdrant.delete.call_args.kwargs["points_selector"].points
+    assert deleted == ["a-removed"]
+
+    assert asyncio.run(ingester.delete_removed({"a-kept"})) == 2
@@ -0,0 +1,45 @@
+from app.embedding_cache import EmbeddingCache
+
+
+def test_embedding_cache_round_trip_and_warm_start(tmp_path):
+    """Vectors survive a restart and are served from the memory-mapped store."""
+    cache = EmbeddingCache(str(tmp_path), "text-embedding-004", 4, lru_size=8)
+    assert cache.get("great duck sandwich") is None
+
+    cache.put_many(["great duck sandwich", "slow service"], [[0.5, 0.25, 0.0, 1.0], [1, 2, 3, 4]])
+    assert cache.get("great   duck sandwich ") == [0.5, 0.25, 0.0, 1.0]
+
+    # A new process starts with an empty LRU but the on-disk index
+    restarted = EmbeddingCache(str(tmp_path), "text-embedding-004", 4, lru_size=8)
+    assert restarted.get("slow service") == [1.0, 2.0, 3.0, 4.0]
+    assert restarted.get("slow service") == [1.0, 2.0, 3.0, 4.0]
+    stats = restarted.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["entries"] == 2
+
+
+def test_embedding_cache_is_keyed_by_model_and_dimensionality(tmp_path):
+    """The same text embedded with another model or size is a different entry."""
+    small = EmbeddingCache(str(tmp_path), "text-embedding-004", 2)
+    small.put("duck", [0.1, 0.2])
+
+    assert EmbeddingCache(str(tmp_path), "text-embedding-005", 2).get("duck") is None
+    assert EmbeddingCache(str(tmp_path), "text-embedding-004", 3).get("duck") is None
+    small.put("wrong size", [0.1, 0.2, 0.3])
+    assert small.get("wrong size") is None
+
+
+def test_embedding_cache_realigns_after_a_partial_write(tmp_path):
+    """A torn row at the end of the vector file is dropped before new rows are appended."""
+    cache = EmbeddingCache(str(tmp_path), "text-embedding-004", 4)
+    cache.put("first", [1, 1, 1, 1])
+    with open(cache._vectors_path, "ab") as f:
+        f.write(b"\x00" * 6)
+
+    cache.put("second", [2, 2, 2, 2])
+
+    restarted = EmbeddingCache(str(tmp_path), "text-embedding-004", 4)
+    assert restarted.get("first") == [1.0, 1.0, 1.0, 1.0]
+    assert restarted.get("second") == [2.0, 2.0, 2.0, 2.0]
+    assert cache._vectors_path.stat().st_size == 2 * cache._row_bytes
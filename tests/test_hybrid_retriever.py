@@ -0,0 +1,157 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+
+def _result(text, score, rating=5):
+    return {"payload": {"text": text, "rating": rating, "createTime": 1.0}, "score": score}
+
+
+def test_dedupe_results_drops_near_identical_reviews():
+    """Reposted reviews with trivial edits are kept once, at their best score."""
+    from app.hybrid_retriever import dedupe_results
+
+    results = [
+        _result("Great roast duck sandwich, friendly staff and quick service!", 0.9),
+        _result("great roast duck sandwich friendly staff and quick service", 0.8),
+        _result("The Reuben was dry and the service was slow.", 0.7),
+        _result("", 0.6),
+    ]
+    kept = dedupe_results(results, threshold=0.9)
+
+    assert [r["score"] for r in kept] == [0.9, 0.7]
+
+
+@patch("app.hybrid_retriever.ahybrid_search", new_callable=AsyncMock)
+def test_retriever_pages_large_k_with_projected_payload(mock_search):
+    """Large k is fetched in pages, reusing the query vectors and projecting the payload."""
+    from app.hybrid_retriever import RETRIEVAL_PAYLOAD_FIELDS, create_hybrid_retriever
+
+    mock_search.side_effect = [
+        [_result(f"review number {i}", 1 - i / 100) for i in range(2)],
+        [_result("last review", 0.5)],
+    ]
+    embeddings = {"dense": [0.1], "sparse": {"indices": [1], "values": [1.0]}}
+    retriever = create_hybrid_retriever(k=5, query_embeddings=embeddings)
+    retriever.page_size = 2
+
+    docs = asyncio.run(retriever.ainvoke("duck"))
+
+    assert [d.page_content for d in docs] == ["review number 0", "review number 1", "last review"]
+    assert docs[0].metadata == {"rating": 5, "createTime": 1.0, "score": 1.0}
+    # The short second page means there is nothing left, so the third page is never requested
+    assert [c.kwargs["offset"] for c in mock_search.call_args_list] == [0, 2]
+    for call in mock_search.call_args_list:
+        assert call.kwargs["query_embeddings"] == embeddings
+        assert call.kwargs["with_payload"] == RETRIEVAL_PAYLOAD_FIELDS
+
+
+def test_adaptive_cutoff_stops_at_score_drop_off():
+    """After min_k, results stop at a relative-score floor or a sharp gap."""
+    from app.hybrid_retriever import adaptive_cutoff
+
+    scores = [1.0, 0.95, 0.9, 0.85, 0.5, 0.45, 0.2]
+    assert adaptive_cutoff(scores, min_k=2, relative_threshold=0.3, score_gap=0.25) == 4
+    assert adaptive_cutoff(scores, min_k=2, relative_threshold=0.3, score_gap=1.0) == 6
+    # Everything is still relevant, so keep paging
+    assert adaptive_cutoff(scores[:4], min_k=2, relative_threshold=0.3, score_gap=0.25) is None
+    # The first min_k results are always kept
+    assert adaptive_cutoff([1.0, 0.1], min_k=5, relative_threshold=0.3, score_gap=0.25) is None
+
+
+@patch("app.hybrid_retriever.ahybrid_search", new_callable=AsyncMock)
+def test_retriever_stops_paging_when_relevance_drops(mock_search):
+    from app.hybrid_retriever import create_hybrid_retriever
+
+    mock_search.side_effect = [
+        [_result("relevant review one", 1.0), _result("relevant review two", 0.9)],
+        [_result("still relevant three", 0.8), _result("barely related four", 0.1)],
+        [_result("never fetched", 0.05)],
+    ]
+    embeddings = {"dense": [0.1], "sparse": {"indices": [1], "values": [1.0]}}
+    retriever = create_hybrid_retriever(k=6, query_embeddings=embeddings)
+    retriever.page_size = 2
+    retriever.min_k = 1
+
+    docs = asyncio.run(retriever.ainvoke("duck"))
+
+    assert [d.metadata["score"] for d in docs] == [1.0, 0.9, 0.8]
+    assert mock_search.call_count == 2
+
+
+@patch("app.hybrid_retriever.hybrid_search")
+def test_sync_retriever_pages_like_the_async_one(mock_search):
+    from app.hybrid_retriever import create_hybrid_retriever
+
+    mock_search.side_effect = [
+        [_result("relevant review one", 1.0), _result("relevant review two", 0.9)],
+        [_result("still relevant three", 0.8), _result("barely related four", 0.1)],
+    ]
+    embeddings = {"dense": [0.1], "sparse": {"indices": [1], "values": [1.0]}}
+    retriever = create_hybrid_retriever(k=6, query_embeddings=embeddings)
+    retriever.page_size = 2
+    retriever.min_k = 1
+
+    docs = retriever.invoke("duck")
+
+    assert [d.metadata["score"] for d in docs] == [1.0, 0.9, 0.8]
+    assert [c.kwargs["offset"] for c in mock_search.call_args_list] == [0, 2]
+
+
+def test_rank_fused_results_are_cut_on_dense_relevance():
+    """Real RRF scores fall on a fixed curve, so depth is judged on the dense cosine scores."""
+    from contextlib import asynccontextmanager
+
+    from qdrant_client import AsyncQdrantClient, models
+
+    from app.config import Config
+    from app.hybrid_retriever import adaptive_cutoff, create_hybrid_retriever
+    from app.vectorstore import _collection_vectors
+
+    # 30 reviews close to the query, 90 unrelated ones
+    vectors = [[1.0, 0.01 * i, 0.0, 0.0] for i in range(30)]
+    vectors += [[0.05, 0.0, 1.0, 0.01 * i] for i in range(90)]
+
+    async def run():
+        qdrant = AsyncQdrantClient(location=":memory:")
+        await qdrant.create_collection(
+            collection_name="reviews",
+            vectors_config={"dense": models.VectorParams(size=4, distance=models.Distance.COSINE)},
+            sparse_vectors_config={"sparse": models.SparseVectorParams()},
+        )
+        await qdrant.upsert(
+            collection_name="reviews",
+            points=[
+                models.PointStruct(
+                    id=i,
+                    vector={"dense": vector, "sparse": models.SparseVector(indices=[i % 7], values=[1.0])},
+                    payload={"text": f"review {i} about topic {i}", "rating": 5, "createTime": 1.0},
+                )
+                for i, vector in enumerate(vectors)
+            ],
+        )
+        query_points = AsyncMock(wraps=qdrant.query_points)
+
+        @asynccontextmanager
+        async def client():
+            yield qdrant
+
+        embeddings = {"dense": [1.0, 0.0, 0.0, 0.0], "sparse": {"indices": [0, 3], "values": [1.0, 1.0]}}
+        retriever = create_hybrid_retriever(k=100, query_embeddings=embeddings)
+        _collection_vectors.clear()
+        with patch("app.vectorstore.qdrant_pool.client", client), \
+                patch.object(qdrant, "query_points", query_points), \
+                patch.object(Config, "FUSION_MODE", "rrf"), \
+                patch.object(Config, "DENSE_SMALL_VECTOR_SIZE", 0):
+            docs = await retriever.ainvoke("topic")
+        await qdrant.close()
+        return docs, query_points.call_args_list
+
+    docs, searches = asyncio.run(run())
+    scores = [doc.metadata["score"] for doc in docs]
+
+    assert len(docs) == 30
+    # One fused page and one scores-only dense search
+    assert [call.kwargs.get("using") for call in searches] == [None, "dense"]
+    assert searches[1].kwargs["with_payload"] is False
+    # The fused scores judged as relevance would have stopped at min_k
+    assert adaptive_cutoff(scores, Config.RETRIEVAL_MIN_K, 0.3, 0.25) == Config.RETRIEVAL_MIN_K
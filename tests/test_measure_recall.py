@@ -0,0 +1,36 @@
+import random
+
+from qdrant_client import QdrantClient, models
+
+
+def test_recall_at_k():
+    from scripts.measure_recall import recall_at_k
+
+    assert recall_at_k([1, 2, 3, 4], [1, 3, 9, 2], k=2) == 0.5
+    assert recall_at_k([1, 2, 3, 4], [4, 3, 2, 1], k=4) == 1.0
+
+
+def test_measure_compares_every_mode_with_exact_search():
+    from scripts.measure_recall import measure, sample_query_vectors, search_modes
+
+    qdrant = QdrantClient(location=":memory:")
+    qdrant.create_collection(
+        collection_name="reviews",
+        vectors_config={"dense": models.VectorParams(size=8, distance=models.Distance.COSINE)},
+    )
+    rng = random.Random(1)
+    qdrant.upsert(
+        collection_name="reviews",
+        points=[
+            models.PointStruct(id=i, vector={"dense": [rng.random() for _ in range(8)]})
+            for i in range(50)
+        ],
+    )
+
+    vectors = sample_query_vectors(qdrant, "reviews", samples=5, seed=0)
+    results = measure(qdrant, "reviews", vectors, [5, 10], search_modes([2.0]))
+
+    assert len(vectors) == 5
+    assert set(results) == {"full precision (HNSW)", "quantized, no rescore", "quantized, rescore x2"}
+    # Local Qdrant searches exactly, so every mode matches the baseline
+    assert all(row["recall@10"] == 1.0 for row in results.values())
@@ -0,0 +1,40 @@
+import asyncio
+import math
+
+from qdrant_client import AsyncQdrantClient, models
+
+
+def test_truncate_dense_renormalizes_prefix():
+    from app.collection_schema import truncate_dense
+
+    small = truncate_dense([3.0, 4.0, 100.0], size=2)
+    assert small == [0.6, 0.8]
+    assert math.isclose(sum(v * v for v in small), 1.0)
+
+
+def test_migrate_adds_small_vector_and_keeps_points():
+    from scripts.migrate_dense_small import migrate
+
+    async def run():
+        qdrant = AsyncQdrantClient(location=":memory:")
+        await qdrant.create_collection(
+            collection_name="reviews",
+            vectors_config={"dense": models.VectorParams(size=4, distance=models.Distance.COSINE)},
+        )
+        await qdrant.upsert(
+            collection_name="reviews",
+            points=[
+                models.PointStruct(id=i, vector={"dense": [1.0, float(i), 2.0, 3.0]}, payload={"rating": i})
+                for i in range(1, 6)
+            ],
+        )
+        copied = await migrate(qdrant, "reviews", "reviews_small2", size=2, batch_size=2)
+        points = await qdrant.retrieve(collection_name="reviews_small2", ids=[3], with_vectors=True)
+        await qdrant.close()
+        return copied, points[0]
+
+    copied, point = asyncio.run(run())
+    assert copied == 5
+    assert point.payload == {"rating": 3}
+    assert len(point.vector["dense"]) == 4
+    assert len(point.vector["dense_small"]) == 2
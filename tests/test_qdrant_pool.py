@@ -0,0 +1,179 @@
+import asyncio
+from unittest.mock import patch
+
+
+class FakeAsyncQdrantClient:
+    """Stands in for AsyncQdrantClient; the first `fail_first` clients can't connect."""
+
+    fail_first = 0
+    created = 0
+
+    def __init__(self, **kwargs):
+        FakeAsyncQdrantClient.created += 1
+        self.broken = FakeAsyncQdrantClient.created <= FakeAsyncQdrantClient.fail_first
+        self.closed = False
+
+    async def get_collections(self):
+        if self.broken:
+            raise ConnectionError("unavailable")
+
+    async def close(self):
+        self.closed = True
+
+
+def _make_pool(**kwargs):
+    from app.qdrant_pool import QdrantClientPool
+
+    FakeAsyncQdrantClient.created = 0
+    return QdrantClientPool(host="qdrant", grpc_port=6334, health_check_interval=0, **kwargs)
+
+
+@patch("app.qdrant_pool.AsyncQdrantClient", FakeAsyncQdrantClient)
+def test_pool_reuses_long_lived_clients():
+    """Requests share the pooled clients instead of opening a channel per search."""
+    FakeAsyncQdrantClient.fail_first = 0
+    pool = _make_pool(size=2)
+
+    async def run():
+        clients = []
+        for _ in range(10):
+            async with pool.client() as qdrant:
+                clients.append(qdrant)
+        await pool.close()
+        return clients
+
+    clients = asyncio.run(run())
+    metrics = pool.metrics()
+
+    assert len({id(c) for c in clients}) == 2
+    assert metrics["clients_created"] == 2
+    assert metrics["acquisitions"] == 10
+    assert metrics["reuse_ratio"] == 0.8
+
+
+@patch("app.qdrant_pool.AsyncQdrantClient", FakeAsyncQdrantClient)
+def test_pool_reconnects_with_backoff():
+    """A failed connection attempt is retried with a fresh client."""
+    FakeAsyncQdrantClient.fail_first = 2
+    pool = _make_pool(size=1, reconnect_attempts=3, reconnect_backoff=0)
+
+    async def run():
+        qdrant = await pool.acquire()
+        await pool.close()
+        return qdrant
+
+    qdrant = asyncio.run(run())
+
+    assert not qdrant.broken
+    assert pool.metrics()["clients_created"] == 3
+
+
+@patch("app.qdrant_pool.AsyncQdrantClient", FakeAsyncQdrantClient)
+def test_pool_starts_degraded_and_reconnects_once():
+    """An unreachable Qdrant doesn't stop startup, and concurrent requests share one reconnect."""
+    FakeAsyncQdrantClient.fail_first = 1
+    pool = _make_pool(size=2, reconnect_attempts=1, reconnect_backoff=0)
+
+    async def run():
+        await pool.start()
+        started_clients = pool.metrics()["clients_created"]
+        clients = await asyncio.gather(*(pool.acquire() for _ in range(5)))
+        await pool.close()
+        return started_clients, clients
+
+    started_clients, clients = asyncio.run(run())
+
+    assert started_clients == 1
+    assert len({id(c) for c in clients}) == 1
+    assert pool.metrics()["reconnects"] == 1
+
+
+def test_connect_does_not_back_off_after_last_attempt():
+    FakeAsyncQdrantClient.fail_first = 10
+    pool = _make_pool(size=1, reconnect_attempts=2, reconnect_backoff=0.01)
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    async def run():
+        with patch("app.qdrant_pool.AsyncQdrantClient", FakeAsyncQdrantClient), patch(
+            "app.qdrant_pool.asyncio.sleep", fake_sleep
+        ):
+            try:
+                await pool._connect()
+            except ConnectionError:
+                return True
+        return False
+
+    assert asyncio.run(run())
+    assert sleeps == [0.01]
+
+
+def test_transport_errors_are_told_apart_from_bad_requests():
+    import grpc
+    from qdrant_client.http.exceptions import UnexpectedResponse
+
+    from app.qdrant_pool import is_transport_error
+
+    class FakeRpcError(grpc.RpcError):
+        def __init__(self, status):
+            self.status = status
+
+        def code(self):
+            return self.status
+
+    assert is_transport_error(FakeRpcError(grpc.StatusCode.UNAVAILABLE))
+    assert is_transport_error(ConnectionError("down"))
+    assert not is_transport_error(FakeRpcError(grpc.StatusCode.INVALID_ARGUMENT))
+    assert not is_transport_error(UnexpectedResponse(404, "Not Found", b"", None))
+
+
+def test_sync_callers_share_one_client():
+    """Sync searches reuse one client on the configured gRPC port instead of one per call."""
+    created = []
+
+    class FakeQdrantClient:
+        def __init__(self, **kwargs):
+            created.append(kwargs)
+
+        def close(self):
+            pass
+
+    pool = _make_pool()
+    with patch("app.qdrant_pool.QdrantClient", FakeQdrantClient):
+        first = pool.sync_client()
+        assert pool.sync_client() is first
+
+    assert len(created) == 1
+    assert created[0]["grpc_port"] == 6334
+
+
+@patch("app.qdrant_pool.AsyncQdrantClient", FakeAsyncQdrantClient)
+def test_only_transport_errors_mark_a_client_unhealthy():
+    """A NOT_FOUND leaves the shared client alone; a dropped connection doesn't."""
+    from qdrant_client.http.exceptions import UnexpectedResponse
+
+    FakeAsyncQdrantClient.fail_first = 0
+    pool = _make_pool(size=1)
+
+    async def fail_with(error):
+        try:
+            async with pool.client():
+                raise error
+        except type(error):
+            pass
+
+    async def run():
+        await pool.start()
+        await fail_with(UnexpectedResponse(404, "Not Found", b"", {}))
+        first = pool.metrics()
+        await fail_with(ConnectionError("reset"))
+        second = pool.metrics()
+        await pool.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert (first["failures"], first["unhealthy_clients"]) == (0, 0)
+    assert (second["failures"], second["unhealthy_clients"]) == (1, 1)
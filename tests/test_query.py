@@ -1,12 +1,16 @@
-from unittest.mock import patch, MagicMock
+import asyncio
+from unittest.mock import patch, MagicMock, AsyncMock
 from app.main import app
 from app.data_models import QueryRequest, ChatMessage
+from app.config import Config
 
 
-@patch("app.query_parser.query_parser_llm")
-def test_parse_query_with_llm(mock_llm):
+@patch("app.query_parser.get_query_parser_llm")
+def test_parse_query_with_llm(mock_get_llm):
     """Test query parsing with LLM."""
     from app.query_parser import parse_query_with_llm
+
+    mock_llm = mock_get_llm.return_value
     
     # Mock the LLM response
     mock_response = MagicMock()
@@ -31,6 +35,48 @@ def test_parse_query_with_llm(mock_llm):
     assert "2024-05-01T00:00:00" in parsed["filter"]["createTime"]["$gte"]
 
 
+@patch("app.query_parser.get_query_parser_llm")
+def test_parse_query_with_llm_uses_cache(mock_get_llm):
+    """Repeat queries are answered from the parse cache without another LLM call."""
+    from app.query_parser import parse_query_with_llm, _parse_cache
+
+    mock_llm = mock_get_llm.return_value
+
+    _parse_cache.clear()
+    mock_response = MagicMock()
+    mock_response.content = '{"query_embedding_text": "duck sandwich", "filter": {}}'
+    mock_llm.invoke.return_value = mock_response
+
+    first = parse_query_with_llm("What do people think of the duck sandwich?")
+    first["filter"]["rating"] = {"$in": [1]}  # callers must not be able to poison the cache
+    second = parse_query_with_llm("  what do people think of the DUCK sandwich ")
+
+    assert mock_llm.invoke.call_count == 1
+    assert second == {"query_embedding_text": "duck sandwich", "filter": {}}
+
+
+@patch("app.query_parser.aget_query_parser_llm", new_callable=AsyncMock)
+@patch("app.query_parser.get_query_parser_llm")
+def test_aparse_query_with_llm(mock_get_llm, mock_aget_llm):
+    """The async parser awaits ainvoke and never touches the blocking invoke or getter."""
+    from app.query_parser import aparse_query_with_llm, _parse_cache
+
+    mock_llm = MagicMock()
+    mock_aget_llm.return_value = mock_llm
+
+    _parse_cache.clear()
+    mock_response = MagicMock()
+    mock_response.content = '```json\n{"query_embedding_text": "slow service", "filter": {}}\n```'
+    mock_llm.ainvoke = AsyncMock(return_value=mock_response)
+
+    parsed = asyncio.run(aparse_query_with_llm("Is the service slow?"))
+
+    assert parsed["query_embedding_text"] == "slow service"
+    mock_llm.ainvoke.assert_awaited_once()
+    mock_llm.invoke.assert_not_called()
+    mock_get_llm.assert_not_called()
+
+
 def test_build_qdrant_filter():
     """Test Qdrant filter building."""
     from app.vectorstore import build_qdrant_filter
@@ -48,23 +94,121 @@ def test_build_qdrant_filter():
     assert "createTime" in keys
 
 
-def test_get_k_value_for_query():
-    """Test dynamic k value selection."""
-    from app.chains import _get_k_value_for_query
-    
-    # Test analytical queries
-    assert _get_k_value_for_query("What are the most common complaints?") == 1000
-    assert _get_k_value_for_query("How many reviews are there?") == 1000
-    assert _get_k_value_for_query("Summarize all feedback") == 1000
-    
-    # Test comparison queries
-    assert _get_k_value_for_query("Compare service vs food quality") == 100
-    
-    # Test specific queries
-    assert _get_k_value_for_query("Tell me about a specific complaint") == 30
-    
-    # Test default
-    assert _get_k_value_for_query("Random query") == 50
+def test_search_plans_fuse_dense_and_sparse():
+    """Hybrid search runs both branches as prefetches fused by Qdrant in one request."""
+    from qdrant_client import models
+    from app.vectorstore import _search_plans
+
+    embeddings = {"dense": [0.1, 0.2], "sparse": {"indices": [3, 7], "values": [1.0, 1.0]}}
+    plans = _search_plans(embeddings, None, k=10)
+
+    name, request = plans[0]
+    assert name == "hybrid"
+    assert [p.using for p in request["prefetch"]] == ["dense", "sparse"]
+    assert isinstance(request["query"], models.FusionQuery)
+    assert request["limit"] == 10
+
+    # Without a quantized profile the dense branch needs no search params
+    assert request["prefetch"][0].params is None
+
+    # Without sparse terms the dense search is tried first
+    plans = _search_plans({"dense": [0.1, 0.2], "sparse": {"indices": [], "values": []}}, None, k=10)
+    assert plans[0][0] == "dense"
+
+
+def test_quantized_profile_oversamples_and_rescores():
+    from app.collection_schema import PROFILES
+    from app.vectorstore import _search_plans
+
+    embeddings = {"dense": [0.1, 0.2], "sparse": {"indices": [3], "values": [1.0]}}
+    with patch("app.collection_schema.Config.COLLECTION_PROFILE", "binary"):
+        hybrid, dense, _ = _search_plans(embeddings, None, k=10)
+
+    params = hybrid[1]["prefetch"][0].params
+    assert params.quantization.rescore is True
+    assert params.quantization.oversampling == PROFILES["binary"].oversampling
+    assert dense[1]["search_params"] == params
+
+
+def test_small_vector_first_pass_is_rescored_with_full_vector():
+    from app.vectorstore import _search_plans
+
+    embeddings = {"dense": [3.0, 4.0, 1.0, 1.0], "sparse": {"indices": [3], "values": [1.0]}}
+    with patch("app.config.Config.DENSE_SMALL_VECTOR_SIZE", 2):
+        plans = _search_plans(embeddings, None, k=10)
+
+    assert [name for name, _ in plans] == [
+        "two-stage hybrid", "two-stage dense", "hybrid", "dense", "default vector"
+    ]
+    dense_branch = plans[0][1]["prefetch"][0]
+    assert dense_branch.using == "dense"
+    assert dense_branch.prefetch.using == "dense_small"
+    assert dense_branch.prefetch.query == [0.6, 0.8]
+    assert dense_branch.prefetch.limit > dense_branch.limit
+
+
+def test_search_reads_collection_vectors_once_and_skips_unsupported_plans():
+    """A dense-only collection gets the dense plan straight away, without failed hybrid attempts."""
+    from contextlib import asynccontextmanager
+
+    from qdrant_client import AsyncQdrantClient, models
+
+    from app import vectorstore
+
+    async def run():
+        qdrant = AsyncQdrantClient(location=":memory:")
+        await qdrant.create_collection(
+            collection_name="legacy",
+            vectors_config={"dense": models.VectorParams(size=2, distance=models.Distance.COSINE)},
+        )
+        await qdrant.upsert(
+            collection_name="legacy",
+            points=[models.PointStruct(id=1, vector={"dense": [1.0, 0.0]}, payload={"text": "duck"})],
+        )
+        get_collection = AsyncMock(wraps=qdrant.get_collection)
+        query_points = AsyncMock(wraps=qdrant.query_points)
+
+        @asynccontextmanager
+        async def client():
+            yield qdrant
+
+        embeddings = {"dense": [1.0, 0.0], "sparse": {"indices": [3], "values": [1.0]}}
+        vectorstore._collection_vectors.clear()
+        with patch("app.vectorstore.qdrant_pool.client", client), \
+                patch.object(qdrant, "get_collection", get_collection), \
+                patch.object(qdrant, "query_points", query_points), \
+                patch.object(Config, "DENSE_SMALL_VECTOR_SIZE", 256):
+            for _ in range(3):
+                results = await vectorstore.ahybrid_search(
+                    "duck", query_embeddings=embeddings, collection_name="legacy"
+                )
+        await qdrant.close()
+        return results, get_collection.await_count, query_points.call_args_list
+
+    results, lookups, searches = asyncio.run(run())
+
+    assert [r["payload"]["text"] for r in results] == ["duck"]
+    assert lookups == 1
+    assert [call.kwargs.get("using") for call in searches] == ["dense"] * 3
+
+    plans = vectorstore._search_plans(
+        {"dense": [1.0, 0.0], "sparse": {"indices": [3], "values": [1.0]}}, None, k=10,
+        vectors=vectorstore.CollectionVectors(dense=frozenset(["dense"]), sparse=frozenset(["sparse"])),
+    )
+    assert [name for name, _ in plans] == ["hybrid", "dense"]
+
+
+def test_retrieval_depth_follows_filtered_count():
+    """k is capped by how many reviews the filter matches, with a floor for a stale snapshot."""
+    from app.chains import _retrieval_depth
+    from app.review_stats import ReviewStatsSnapshot
+
+    snapshot = ReviewStatsSnapshot(ratings=[1, 1, 5] + [4] * 2000, timestamps=[1.0] * 2003)
+    with patch("app.review_stats.review_stats.snapshot", snapshot):
+        assert asyncio.run(_retrieval_depth({"rating": {"$in": [1]}})) == Config.RETRIEVAL_MIN_K
+        assert asyncio.run(_retrieval_depth({"rating": {"$in": [4]}})) == Config.RETRIEVAL_MAX_K
+    with patch("app.review_stats.review_stats.snapshot", None):
+        assert asyncio.run(_retrieval_depth({"rating": {"$in": [1]}})) == Config.RETRIEVAL_MAX_K
 
 
 @patch("app.chains.create_hybrid_retriever")
@@ -93,7 +237,7 @@ def test_prepare_query(mock_parse, mock_retriever):
     # Check that retriever was created with correct parameters
     mock_retriever.assert_called_once()
     call_args = mock_retriever.call_args
-    assert call_args[1]["k"] == 50  # Default k value for "test query"
+    assert call_args[1]["k"] == Config.RETRIEVAL_MAX_K  # No stats snapshot loaded
 
 
 def test_query_request_model():
@@ -116,3 +260,82 @@ def test_query_request_model():
     assert len(request.chat_history) == 1
     assert request.chat_history[0].human == "Hi"
     assert request.chat_history[0].ai == "Hello"
+
+
+def test_speculative_embedding_reuse_and_discard():
+    """The raw-query vector is reused only when the parsed text is close to the query."""
+    from app.chains import _resolve_speculative_embedding, get_speculation_stats
+
+    async def embed():
+        return {"dense": [0.1, 0.2], "sparse": None}
+
+    async def run(embedding_text):
+        task = asyncio.create_task(embed())
+        return await _resolve_speculative_embedding(
+            task, "What do people like about the duck sandwich?", embedding_text
+        )
+
+    before = get_speculation_stats()
+    reused = asyncio.run(run("what do people like about the duck sandwich"))
+    discarded = asyncio.run(run("positive feedback on food quality"))
+    after = get_speculation_stats()
+
+    assert reused == {"dense": [0.1, 0.2], "sparse": None}
+    assert discarded is None
+    assert after["reused"] == before["reused"] + 1
+    assert after["discarded"] == before["discarded"] + 1
+
+
+def test_map_reduce_answer_streams_reduce_step():
+    """Shards are summarized first; only the final reduce step is streamed."""
+    from langchain_core.documents import Document
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from app.chains import _map_reduce_answer
+    from app.config import Config
+
+    llm = FakeListChatModel(responses=["shard 1", "shard 2", "shard 3", "final answer"])
+    docs = [Document(page_content=f"review {i}", metadata={"score": 1.0}) for i in range(5)]
+
+    async def run():
+        tokens = _map_reduce_answer("most common complaints", docs, {}, 5, "unavailable")
+        return [token async for token in tokens]
+
+    with patch("app.chains.aget_default_llm", AsyncMock(return_value=llm)), \
+            patch.object(Config, "MAP_REDUCE_SHARD_SIZE", 2):
+        tokens = asyncio.run(run())
+
+    assert "".join(tokens) == "final answer"
+    assert len(tokens) > 1  # streamed, not returned in one piece
+
+
+def test_map_reduce_collapses_with_a_summary_prompt_and_counts_one_request():
+    """Intermediate levels merge summaries; only the last step answers, and stats count one request."""
+    from langchain_core.documents import Document
+    from langchain_core.runnables import RunnableLambda
+    from app.chains import _map_reduce_answer
+    from app.context_builder import get_context_stats
+
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt.to_string())
+        return "summary " * 40
+
+    docs = [Document(page_content=f"review {i}", metadata={"score": 1.0}) for i in range(8)]
+
+    async def run():
+        tokens = _map_reduce_answer("most common complaints", docs, {}, 8, "unavailable", "User: hi")
+        return [token async for token in tokens]
+
+    before = get_context_stats()["requests"]
+    with patch("app.chains.aget_default_llm", AsyncMock(return_value=RunnableLambda(llm))), \
+            patch.object(Config, "MAP_REDUCE_SHARD_SIZE", 2), \
+            patch.object(Config, "MAP_REDUCE_FAN_IN", 2), \
+            patch.object(Config, "CONTEXT_TOKEN_BUDGET", 150):
+        asyncio.run(run())
+
+    maps, collapses, reduce = prompts[:4], prompts[4:-1], prompts[-1]
+    assert collapses and all("Merge these into one summary" in p for p in collapses)
+    assert not any("User: hi" in p for p in maps + collapses)
+    assert "User: hi" in reduce and "Merge these" not in reduce
+    assert get_context_stats()["requests"] == before + 1
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+from app.review_stats import ReviewStatsSnapshot, format_stats_for_prompt
+
+
+def _ts(date: str) -> float:
+    return datetime.fromisoformat(date).replace(tzinfo=timezone.utc).timestamp()
+
+
+# The reference date used for relative periods is 2025-05-25
+PAYLOADS = [
+    {"rating": 1, "createTime": _ts("2025-05-20")},
+    {"rating": 2, "createTime": _ts("2025-05-01")},
+    {"rating": 5, "createTime": _ts("2025-04-10")},
+    {"rating": 4, "createTime": _ts("2024-01-15")},
+    {"rating": 5, "createTime": None},
+]
+
+
+def test_snapshot_applies_parsed_filters():
+    """Counts honour the same rating and createTime filters the parser produces."""
+    snapshot = ReviewStatsSnapshot.from_payloads(PAYLOADS)
+
+    assert snapshot.summarize()["count"] == 5
+    negative = snapshot.summarize({"rating": {"$in": [1, 2]}})
+    assert negative["count"] == 2
+    assert negative["average_rating"] == 1.5
+    recent = snapshot.summarize({"rating": {"$gte": 4}, "createTime": {"$gte": "2025-01-01T00:00:00Z"}})
+    assert recent["count"] == 1
+
+
+def test_snapshot_periods_and_monthly_trend():
+    """Week/month/year counts and monthly averages are relative to the reference date."""
+    summary = ReviewStatsSnapshot.from_payloads(PAYLOADS).summarize()
+
+    assert summary["periods"]["week"]["count"] == 1
+    assert summary["periods"]["month"]["count"] == 2
+    assert summary["periods"]["year"]["by_rating"] == {1: 1, 2: 1, 3: 0, 4: 0, 5: 1}
+    trend = {t["month"]: t for t in summary["monthly_trend"]}
+    assert trend["2025-05"]["count"] == 2
+    assert trend["2025-05"]["average_rating"] == 1.5
+    assert trend["2025-05"]["rolling_3m_average"] == 2.67
+    assert "2024-01" not in trend  # outside the trailing 12 months
+
+    text = format_stats_for_prompt(summary)
+    assert "Total matching reviews: 5" in text
+    assert "2025-05 2, 1.5, 2.67" in text
+
+
+def test_signature_changes_on_text_edits():
+    """Editing a review's text changes its content hash, which must invalidate cached answers."""
+    hashed = [{**p, "content_hash": f"{i + 1:016x}" * 4} for i, p in enumerate(PAYLOADS)]
+    edited = [dict(p) for p in hashed]
+    edited[0]["content_hash"] = "f" * 64
+
+    signature = ReviewStatsSnapshot.from_payloads(hashed).signature
+    assert ReviewStatsSnapshot.from_payloads(edited).signature != signature
+    # Scroll order doesn't matter
+    assert ReviewStatsSnapshot.from_payloads(hashed[::-1]).signature == signature
+
+
+def test_engine_summaries_run_once_per_filter_and_start_does_not_wait():
+    import asyncio
+    from unittest.mock import patch
+
+    from app.review_stats import ReviewStatsEngine
+
+    snapshot = ReviewStatsSnapshot.from_payloads(PAYLOADS)
+    engine = ReviewStatsEngine(refresh_interval=0)
+    loaded = asyncio.Event()
+
+    async def slow_load():
+        await loaded.wait()
+        return snapshot
+
+    async def run():
+        with patch.object(engine, "_load", slow_load):
+            await engine.start()
+            # Serving starts before the snapshot is loaded
+            assert await engine.asummarize() is None
+            loaded.set()
+            await engine._task
+        with patch.object(snapshot, "_summarize", wraps=snapshot._summarize) as compute:
+            first = await engine.acount({"rating": {"$in": [1, 2]}})
+            second = await engine.acount({"rating": {"$in": [1, 2]}})
+        await engine.stop()
+        return first, second, compute.call_count
+
+    assert asyncio.run(run()) == (2, 2, 1)
@@ -0,0 +1,61 @@
+from app.session_store import MemorySessionStore, SessionState, SqliteSessionStore
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _state(query: str) -> SessionState:
+    state = SessionState()
+    state.record_turn(query, "answer", {"rating": {"$in": [1]}}, [{"text": "cold fries"}], 5, 300)
+    return state
+
+
+def test_record_turn_bounds_history_and_keeps_reviews():
+    """History is capped; a turn answered without retrieval keeps the earlier reviews."""
+    state = SessionState()
+    for i in range(4):
+        state.record_turn(f"q{i}", f"a{i}", {"rating": {"$in": [1]}}, [{"text": "r"}] * 10, 2, 3)
+    state.record_turn("how many?", "12", {}, None, 2, 3)
+
+    assert [turn["human"] for turn in state.history] == ["q3", "how many?"]
+    assert state.last_query == "how many?"
+    assert state.last_filter == {"rating": {"$in": [1]}}
+    assert len(state.last_reviews) == 3
+
+
+def test_memory_store_is_bounded_and_copies():
+    store = MemorySessionStore(maxsize=2)
+    for session_id in ("a", "b", "c"):
+        store.save(session_id, _state(session_id))
+
+    assert store.get("a") is None  # evicted
+    state = store.get("c")
+    state.history.clear()
+    assert store.get("c").history[0]["human"] == "c"
+
+
+def test_sqlite_store_shared_between_instances(tmp_path):
+    """Two stores on one file (as in two workers) see the same sessions, with TTL and pruning."""
+    timer = FakeTimer()
+    path = tmp_path / "sessions.sqlite3"
+    first = SqliteSessionStore(str(path), maxsize=2, ttl=60, timer=timer)
+    second = SqliteSessionStore(str(path), maxsize=2, ttl=60, timer=timer)
+
+    first.save("s1", _state("cold fries?"))
+    assert second.get("s1").last_reviews == [{"text": "cold fries"}]
+
+    timer.now += 61
+    assert second.get("s1") is None  # expired
+
+    for session_id in ("s2", "s3", "s4"):
+        timer.now += 1
+        first.save(session_id, _state(session_id))
+    first.prune()
+    assert len(first) == 2
+    assert second.get("s2") is None
+    assert second.get("s4").last_query == "s4"
@@ -0,0 +1,131 @@
+import asyncio
+
+from app.single_flight import SingleFlight
+
+
+def _source(calls, gate, n=3):
+    async def events():
+        calls.append(1)
+        for i in range(n):
+            await gate.wait()
+            yield {"chunk": str(i)}
+        yield {"done": True}
+    return events
+
+
+def test_concurrent_subscribers_share_one_run():
+    async def run():
+        flight, calls, gate = SingleFlight(), [], asyncio.Event()
+        factory = _source(calls, gate)
+
+        async def collect():
+            return [e async for e in flight.subscribe("q", factory)]
+
+        tasks = [asyncio.create_task(collect()) for _ in range(3)]
+        await asyncio.sleep(0)
+        gate.set()
+        return await asyncio.gather(*tasks), calls, flight.stats()
+
+    results, calls, stats = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == results[0] for r in results)
+    assert results[0][-1] == {"done": True}
+    assert stats["started"] == 1 and stats["joined"] == 2 and stats["in_flight"] == 0
+
+
+def test_late_joiner_gets_replay():
+    async def run():
+        flight, calls, release = SingleFlight(), [], asyncio.Event()
+
+        async def events():
+            calls.append(1)
+            yield {"chunk": "a"}
+            await release.wait()
+            yield {"chunk": "b"}
+
+        first = flight.subscribe("q", events)
+        assert await first.__anext__() == {"chunk": "a"}
+        late = asyncio.create_task(_collect(flight.subscribe("q", events)))
+        await asyncio.sleep(0)
+        release.set()
+        rest = [e async for e in first]
+        return rest, await late, calls
+
+    async def _collect(stream):
+        return [e async for e in stream]
+
+    rest, late, calls = asyncio.run(run())
+    assert rest == [{"chunk": "b"}]
+    assert late == [{"chunk": "a"}, {"chunk": "b"}]
+    assert len(calls) == 1
+
+
+def test_upstream_cancelled_when_everyone_leaves():
+    async def run():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def events():
+            try:
+                yield {"chunk": "a"}
+                await asyncio.sleep(10)
+                yield {"chunk": "b"}
+            finally:
+                cancelled.set()
+
+        stream = flight.subscribe("q", events)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flight.is_running("q")
+
+    assert asyncio.run(run()) is False
+
+
+def test_errors_reach_every_subscriber():
+    async def run():
+        flight = SingleFlight()
+
+        async def events():
+            yield {"chunk": "a"}
+            raise RuntimeError("boom")
+
+        async def collect():
+            return [e async for e in flight.subscribe("q", events)]
+
+        return await asyncio.gather(collect(), collect(), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+def test_upstream_waits_for_subscribers_to_read():
+    """The leader can't drain the upstream into memory faster than subscribers read it."""
+    async def run():
+        joins = []
+        flight = SingleFlight(max_pending=2, on_join=lambda: joins.append(1))
+        produced = []
+
+        async def events():
+            for i in range(10):
+                produced.append(i)
+                yield i
+
+        first = flight.subscribe("q", events)
+        second = flight.subscribe("q", events)
+        assert await first.__anext__() == 0
+        assert await second.__anext__() == 0
+        # Nobody reads, so the upstream stops a couple of events ahead
+        await asyncio.sleep(0.01)
+        held = len(produced)
+        # A stalled subscriber doesn't hold back the one still reading
+        ahead = [await first.__anext__() for _ in range(5)]
+        rest = [e async for e in second]
+        await first.aclose()
+        return held, ahead, rest, joins
+
+    held, ahead, rest, joins = asyncio.run(asyncio.wait_for(run(), 5))
+    assert held <= 4
+    assert ahead == [1, 2, 3, 4, 5]
+    assert rest == list(range(1, 10))
+    assert joins == [1]
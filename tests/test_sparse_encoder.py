@@ -0,0 +1,30 @@
+from app.sparse_encoder import BM25Encoder, token_index, tokenize
+
+
+def test_tokenize_drops_stopwords_and_plurals():
+    """Menu item names survive tokenization and plural forms share a term."""
+    assert tokenize("The Reuben sandwiches are great!") == ["reuben", "sandwich", "great"]
+    assert tokenize("sandwich") == tokenize("sandwiches")
+
+
+def test_bm25_document_and_query_share_terms():
+    """Query terms map to the same sparse indices as the document terms."""
+    encoder = BM25Encoder(k1=1.2, b=0.75, avg_doc_length=10)
+    doc = encoder.encode_document("Roast duck sandwich and the Reuben, duck duck duck")
+    query = encoder.encode_query("duck Reuben")
+
+    assert set(query["indices"]) <= set(doc["indices"])
+    assert query["values"] == [1.0, 1.0]
+    weights = dict(zip(doc["indices"], doc["values"]))
+    # Term frequency saturates: four mentions weigh more than one but far less than 4x
+    assert weights[token_index("reuben")] < weights[token_index("duck")] < 4 * weights[token_index("reuben")]
+
+
+def test_bm25_normalizes_for_document_length():
+    """The same term weighs less in a long review than in a short one."""
+    encoder = BM25Encoder(k1=1.2, b=0.75, avg_doc_length=10)
+    short = encoder.encode_document("great duck")
+    long = encoder.encode_document("duck " + " ".join(f"word{i}" for i in range(40)))
+
+    index = token_index("duck")
+    assert dict(zip(short["indices"], short["values"]))[index] > dict(zip(long["indices"], long["values"]))[index]
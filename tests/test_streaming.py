@@ -0,0 +1,70 @@
+import asyncio
+import json
+
+from app.streaming import encode_sse_event, encode_token_frame, sse_stream
+
+
+def _decode(frames):
+    return [json.loads(frame.decode("utf-8")[len("data: "):].strip()) for frame in frames]
+
+
+async def _collect(events, **kwargs):
+    async def source():
+        for event in events:
+            yield event
+
+    return [frame async for frame in sse_stream(source(), **kwargs)]
+
+
+def test_token_frame_matches_generic_encoder():
+    """The pre-built token frame must be byte-identical to the generic encoder."""
+    text = 'He said "great" — 5★\n'
+    assert encode_token_frame(text) == encode_sse_event({"type": "token", "text": text})
+
+
+def test_sse_stream_coalesces_tokens_by_size():
+    """Tokens are merged until the size limit, then flushed before the end event."""
+    events = [
+        {"metadata": {"context": ["a"], "parsed_filter": None}},
+        {"chunk": "Hel"},
+        {"chunk": "lo "},
+        {"chunk": "world"},
+        {"done": True},
+    ]
+    frames = _decode(asyncio.run(_collect(events, max_chars=6, max_delay=10)))
+
+    assert frames[0] == {"status": "start"}
+    assert frames[1]["type"] == "metadata"
+    tokens = [f["text"] for f in frames if f.get("type") == "token"]
+    assert tokens == ["Hello ", "world"]
+    assert frames[-1] == {"type": "end", "text": "Hello world"}
+
+
+def test_sse_stream_flushes_on_delay():
+    """A slow LLM still gets its pending tokens flushed once the delay expires."""
+    async def source():
+        yield {"chunk": "slow"}
+        await asyncio.sleep(0.05)
+        yield {"chunk": "er"}
+        yield {"done": True}
+
+    async def run():
+        return [f async for f in sse_stream(source(), max_chars=100, max_delay=0.01)]
+
+    frames = _decode(asyncio.run(run()))
+    tokens = [f["text"] for f in frames if f.get("type") == "token"]
+    assert tokens == ["slow", "er"]
+
+
+def test_sse_stream_reports_errors():
+    """Pipeline exceptions become an error event instead of a broken stream."""
+    async def source():
+        yield {"chunk": "partial"}
+        raise RuntimeError("boom")
+
+    async def run():
+        return [f async for f in sse_stream(source(), max_chars=100, max_delay=10)]
+
+    frames = _decode(asyncio.run(run()))
+    assert frames[-2] == {"type": "token", "text": "partial"}
+    assert frames[-1] == {"type": "error", "message": "boom"}
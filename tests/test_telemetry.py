@@ -0,0 +1,39 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from app.telemetry import RequestTimer
+
+
+def _sample(name, labels=None):
+    return REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_request_timer_records_stages_and_outcome():
+    """Stages feed the histogram, finish counts the outcome once and clears in-flight."""
+    parse_before = _sample("rag_stage_seconds_count", {"stage": "parse"})
+    answered_before = _sample("rag_requests_total", {"outcome": "answered"})
+    in_flight_before = _sample("rag_requests_in_flight")
+
+    timer = RequestTimer()
+    assert _sample("rag_requests_in_flight") == in_flight_before + 1
+    with timer.stage("parse"):
+        pass
+    timer.mark("first_token")
+    timer.mark("first_token")  # only the first mark counts
+    timer.finish("answered", {"reviews": 3})
+    timer.finish("answered")
+
+    assert set(timer.timings) == {"parse", "first_token", "total"}
+    assert _sample("rag_stage_seconds_count", {"stage": "parse"}) == parse_before + 1
+    assert _sample("rag_requests_total", {"outcome": "answered"}) == answered_before + 1
+    assert _sample("rag_requests_in_flight") == in_flight_before
+
+
+def test_stage_records_time_when_step_fails():
+    timer = RequestTimer()
+    with pytest.raises(ValueError):
+        with timer.stage("search"):
+            raise ValueError("qdrant down")
+    timer.finish("error")
+
+    assert "search" in timer.timings
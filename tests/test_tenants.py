@@ -0,0 +1,134 @@
+import asyncio
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+from app.config import Config
+from app.review_stats import ReviewStatsSnapshot
+from app.tenants import Tenant, TenantRegistry, review_location_id
+from app.vectorstore import build_qdrant_filter
+
+
+def _registry(tmp_path: Path) -> TenantRegistry:
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps({"tenants": [
+        {"tenant_id": "duck", "name": "Duck and Decanter", "description": "a sandwich shop",
+         "location_ids": ["1", "2"]},
+        {"tenant_id": "cafe", "name": "Corner Cafe", "collection": "reviews_cafe",
+         "prompts": {"response": "Answer for {business}: {question} {context}"}},
+    ]}))
+    return TenantRegistry.from_file(str(path), default_id="duck")
+
+
+def test_review_location_id():
+    assert review_location_id("accounts/9/locations/123/reviews/abc") == "123"
+    assert review_location_id("reviews/abc") is None
+
+
+def test_registry_routes_locations_to_collections(tmp_path: Path):
+    registry = _registry(tmp_path)
+
+    assert registry.get(None).tenant_id == "duck"
+    assert registry.get("cafe").collection_name == "reviews_cafe"
+    assert registry.get("unknown") is None
+    assert registry.collection_for_location("2") == Config.COLLECTION_NAME
+    assert registry.collection_for_location("elsewhere") == Config.COLLECTION_NAME
+    assert registry.collections() == sorted({Config.COLLECTION_NAME, "reviews_cafe"})
+    # Without a tenant on the shared collection, nothing needs its stats
+    own = TenantRegistry([Tenant("cafe", "Cafe", collection_name="reviews_cafe")])
+    assert own.collections() == ["reviews_cafe"]
+
+
+def test_scope_restricts_search_and_stats_to_tenant_locations():
+    tenant = Tenant("duck", "Duck and Decanter", location_ids=["1"])
+    scoped = tenant.scope({"rating": {"$in": [1]}})
+
+    assert scoped == {"rating": {"$in": [1]}, "location_id": {"$in": ["1"]}}
+    conditions = {c.key: c for c in build_qdrant_filter(scoped).must}
+    assert conditions["location_id"].match.any == ["1"]
+    # A tenant with its own collection searches all of it
+    assert Tenant("cafe", "Corner Cafe", collection_name="reviews_cafe").scope(None) is None
+
+    snapshot = ReviewStatsSnapshot.from_payloads([
+        {"rating": 1, "createTime": 1.0, "location_id": "1"},
+        {"rating": 1, "createTime": 1.0, "location_id": "2"},
+        {"rating": 5, "createTime": 1.0, "location_id": "1"},
+    ])
+    assert snapshot.summarize(scoped)["count"] == 1
+
+
+def test_prompts_name_the_tenant_business(tmp_path: Path):
+    registry = _registry(tmp_path)
+
+    response = registry.get("duck").prompt("response").format(
+        question="q", context="c", criteria="{}", review_count=1, stats="-", history="none"
+    )
+    assert "Duck and Decanter, a sandwich shop" in response
+    assert registry.get("duck").parser_prompt().format(
+        business="B", current_date="2025-01-01", previous_query="none", user_query="q"
+    )
+    override = registry.get("cafe").prompt("response").format(question="q", context="c")
+    assert override == "Answer for Corner Cafe: q c"
+
+
+def test_registry_rejects_unscoped_tenants_on_a_shared_collection():
+    import pytest
+
+    with pytest.raises(ValueError, match="without location_ids"):
+        TenantRegistry([
+            Tenant("duck", "Duck and Decanter", location_ids=["1"]),
+            Tenant("cafe", "Corner Cafe"),
+        ])
+    # Alone in a collection, a tenant needs no location_ids
+    TenantRegistry([Tenant("duck", "Duck"), Tenant("cafe", "Cafe", collection_name="reviews_cafe")])
+
+
+def test_unknown_default_tenant_is_not_guessed():
+    import pytest
+    from fastapi import HTTPException
+
+    from app.data_models import QueryRequest
+    from app.main import rag_streaming_query
+
+    registry = TenantRegistry(
+        [Tenant("duck", "Duck", location_ids=["1"]), Tenant("cafe", "Cafe", location_ids=["2"])],
+        default_id="missing",
+    )
+    assert registry.get(None) is None
+
+    with patch("app.main.tenants", registry):
+        with pytest.raises(HTTPException) as missing:
+            asyncio.run(rag_streaming_query(QueryRequest(query="q")))
+        with pytest.raises(HTTPException) as unknown:
+            asyncio.run(rag_streaming_query(QueryRequest(query="q", tenant_id="x")))
+    assert missing.value.status_code == 400
+    assert unknown.value.status_code == 404
+
+
+def test_session_ids_cannot_reach_another_tenants_session():
+    """A default-tenant id shaped like "<tenant>:<id>" doesn't load that tenant's session."""
+    from app.chains import _legacy_session_key, _load_session, _session_key
+    from app.session_store import MemorySessionStore, SessionState
+
+    duck = Tenant("duck", "Duck", location_ids=["1"])
+    acme = Tenant("acme", "Acme", location_ids=["2"])
+    registry = TenantRegistry([duck, acme], default_id="duck")
+    store = MemorySessionStore(maxsize=10)
+    store.save("acme:abc", SessionState(last_query="acme's question"))
+    store.save("legacy", SessionState(last_query="stored before prefixes"))
+
+    with patch("app.chains.tenants", registry), patch("app.chains.session_store", store):
+        assert _session_key(duck, "acme:abc") != _session_key(acme, "abc")
+
+        def load(tenant: Tenant, session_id: str):
+            return asyncio.run(_load_session(
+                _session_key(tenant, session_id), _legacy_session_key(tenant, session_id)
+            ))
+
+        assert load(duck, "acme:abc") is None
+        assert load(acme, "abc").last_query == "acme's question"
+        # The default tenant's unprefixed sessions are read once and moved under its prefix
+        assert load(duck, "legacy").last_query == "stored before prefixes"
+        assert store.get("legacy") is None
+        assert store.get("duck:legacy").last_query == "stored before prefixes"
+        assert load(acme, "legacy") is None
@@ -0,0 +1,91 @@
+import asyncio
+
+from app.vertexai_models import ModelRegistry
+
+
+def test_registry_creates_models_once_on_first_use():
+    created = []
+    registry = ModelRegistry()
+    registry.register("llm", lambda: created.append("llm") or "llm-client")
+    registry.register("embeddings", lambda: created.append("embeddings") or "embeddings-client")
+
+    assert created == []  # nothing is built at registration
+    assert registry.get("llm") == "llm-client"
+    assert registry.get("llm") == "llm-client"
+    assert created == ["llm"]
+    assert registry.report()["not_loaded"] == ["embeddings"]
+
+
+def test_registry_warm_up_and_overrides():
+    registry = ModelRegistry()
+    registry.register("llm", lambda: "real")
+    registry.register("embeddings", lambda: "real")
+    registry.set("embeddings", "fake")
+
+    load_times = asyncio.run(registry.warm_up(["llm", "embeddings", "unknown"]))
+
+    assert registry.get("llm") == "real"
+    assert registry.get("embeddings") == "fake"
+    assert set(load_times) == {"llm", "embeddings", "unknown"}
+    assert registry.is_loaded("llm")
+
+
+def test_registry_builds_different_models_in_parallel():
+    """A slow model doesn't hold up another one, and aget keeps construction off the loop."""
+    import time
+
+    registry = ModelRegistry()
+    registry.register("llm", lambda: time.sleep(0.3) or "llm")
+    registry.register("embeddings", lambda: time.sleep(0.3) or "embeddings")
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        start = time.perf_counter()
+        await registry.warm_up(["llm", "embeddings"])
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(run())
+
+    assert elapsed < 0.55
+    assert ticks > 10  # the event loop kept running during construction
+
+
+def test_embedding_cache_io_runs_off_the_event_loop():
+    """Cache lookups and stores happen in the blocking pool, not on the loop's thread."""
+    import threading
+    from types import SimpleNamespace
+    from unittest.mock import AsyncMock, MagicMock, patch
+
+    from app import vertexai_models
+
+    threads = []
+    cache = MagicMock()
+    cache.get.side_effect = lambda text: threads.append(threading.get_ident())
+    cache.put_many.side_effect = lambda texts, vectors: threads.append(threading.get_ident())
+
+    async def embed(texts, output_dimensionality):
+        return [SimpleNamespace(values=[1.0], sparse=None) for _ in texts]
+
+    model = SimpleNamespace(get_embeddings_async=embed)
+
+    async def run():
+        await vertexai_models.aget_query_embeddings("duck")
+        await vertexai_models.aget_hybrid_embeddings_batch(["duck", "reuben"])
+        return threading.get_ident()
+
+    with patch("app.vertexai_models.aget_embedding_cache", AsyncMock(return_value=cache)), \
+            patch.object(vertexai_models.models, "aget", AsyncMock(return_value=model)):
+        loop_thread = asyncio.run(run())
+
+    assert len(threads) == 5  # one lookup and store, then two lookups and a store
+    assert loop_thread not in threads